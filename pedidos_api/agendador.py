@@ -0,0 +1,91 @@
+import os
+import logging
+import threading
+from datetime import date, datetime, timezone
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+AGENDADOR_ATIVO = os.getenv('AGENDADOR_ATIVO', '0') == '1'
+AGENDADOR_INTERVALO_MIN = int(os.getenv('AGENDADOR_INTERVALO_MIN', 60))
+AGENDADOR_INTERVALO_MAX = int(os.getenv('AGENDADOR_INTERVALO_MAX', 1800))
+AGENDADOR_LIMITE_MUDANCAS = int(os.getenv('AGENDADOR_LIMITE_MUDANCAS', 50))
+
+class AgendadorIngestao:
+    # Faz polling do dia corrente em intervalo adaptativo. Cada execução só
+    # grava o delta: dias sem mudança voltam 304 da API e pedidos idênticos
+    # são descartados pelos fingerprints antes do banco.
+    def __init__(self, jobs, intervalo_min=AGENDADOR_INTERVALO_MIN, intervalo_max=AGENDADOR_INTERVALO_MAX,
+                 limite_mudancas=AGENDADOR_LIMITE_MUDANCAS):
+        self.jobs = jobs
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.limite_mudancas = limite_mudancas
+        self.intervalo = intervalo_min
+        self.ultimo_periodo = None
+        self.ultimo_sucesso = None
+        self.ultimas_mudancas = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name='agendador-ingestao', daemon=True)
+        self._thread.start()
+        logger.info(f'Agendador iniciado (intervalo entre {self.intervalo_min}s e {self.intervalo_max}s).')
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info('Agendador parado.')
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.executar()
+            except Exception as e:
+                logger.exception(f'Erro no agendador: {e}')
+                self._ajustar_intervalo(None)
+            self._parar.wait(self.intervalo)
+
+    def executar(self):
+        hoje = date.today()
+        # Na virada do dia, uma última passada no dia anterior captura as
+        # mudanças feitas entre o último polling e a meia-noite.
+        if self.ultimo_periodo is not None and self.ultimo_periodo < hoje:
+            self._executar_periodo(self.ultimo_periodo)
+        mudancas = self._executar_periodo(hoje)
+        if mudancas is not None:
+            self.ultimo_periodo = hoje
+        self._ajustar_intervalo(mudancas)
+
+    def _executar_periodo(self, dia):
+        from processador import processar_pedidos
+
+        job, _ = self.jobs.submeter(f'rodar-pedidos:{dia}', processar_pedidos, dia.isoformat())
+        job = self.jobs.aguardar(job['id'])
+        resultado = job['resultado'] if job['status'] == 'concluido' else None
+        if resultado is None:
+            return None
+        self.ultimo_sucesso = datetime.now(timezone.utc).isoformat()
+        return resultado['inseridos'] + resultado['alterados']
+
+    def _ajustar_intervalo(self, mudancas):
+        if mudancas is not None and mudancas >= self.limite_mudancas:
+            self.intervalo = max(self.intervalo_min, self.intervalo // 2)
+        elif mudancas is None or mudancas == 0:
+            self.intervalo = min(self.intervalo_max, self.intervalo * 2)
+        self.ultimas_mudancas = mudancas
+        logger.info(f'Agendador: {mudancas} mudanças na última execução, próximo polling em {self.intervalo}s.')
+
+    def status(self):
+        return {
+            'ativo': bool(self._thread and self._thread.is_alive()),
+            'intervalo_s': self.intervalo,
+            'ultimas_mudancas': self.ultimas_mudancas,
+            'ultimo_sucesso': self.ultimo_sucesso,
+        }
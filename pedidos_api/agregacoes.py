@@ -0,0 +1,103 @@
+"""Recortes e agregações dos pedidos do dashboard, sem dependência do Streamlit.
+
+O dash.py chama estas funções com os carregadores em cache do processo; os
+benchmarks chamam as mesmas direto contra o banco ou um frame sintético, para
+medir o caminho real do dashboard.
+"""
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from consultas import agregar_pedidos, dividir_em_meses, fatos_vazios
+
+def slice_by_date(df, start, end):
+    """Recorta pedidos ordenados por data com busca binária (dias inteiros, inclusive), sem copiar o frame."""
+    dates = df['data_pedido'].to_numpy()
+    lower = dates.searchsorted(np.datetime64(pd.Timestamp(start)), side='left')
+    upper = dates.searchsorted(np.datetime64(pd.Timestamp(end).normalize() + timedelta(days=1)), side='left')
+    return df.iloc[lower:upper]
+
+def dimension_mask(df, selections):
+    """Máscara dos filtros da barra lateral comparando códigos das categorias, não strings."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, selected in selections:
+        if selected:
+            categories = df[column].cat.categories
+            codes = categories.get_indexer(selected)
+            mask &= np.isin(df[column].cat.codes.to_numpy(), codes[codes >= 0])
+    return mask
+
+def select_dimensions(df, selections):
+    """Pedidos que passam nos filtros da barra lateral; sem seleção, devolve o próprio recorte, sem cópia."""
+    if not any(selected for _, selected in selections):
+        return df
+    return df[dimension_mask(df, selections)]
+
+def build_filtered_periods(periods, selections, load_rollup, load_month):
+    """Monta os fatos já filtrados de cada período (atual e comparação) em uma única passada.
+
+    Meses completos vêm dos rollups (`load_rollup(meses)`), carregados uma vez
+    para todos os períodos; meses parciais vêm dos pedidos do mês
+    (`load_month(inicio, fim)`), recortados por busca binária na data.
+    """
+    splits = [
+        dividir_em_meses(start.date(), end.date()) if start <= end else ([], [])
+        for start, end in periods
+    ]
+    all_complete_months = tuple(sorted({month for complete, _ in splits for month in complete}))
+    df_rollup = load_rollup(all_complete_months) if all_complete_months else None
+
+    results = []
+    for (start, end), (complete_months, partial_months) in zip(periods, splits):
+        parts = []
+        if complete_months:
+            in_months = df_rollup['ano_mes'].isin(complete_months).to_numpy()
+            parts.append(df_rollup[in_months & dimension_mask(df_rollup, selections)])
+        for ano_mes in partial_months:
+            month = pd.Period(ano_mes, freq='M')
+            df_month = load_month(month.start_time.date(), month.end_time.date())
+            df_slice = slice_by_date(df_month, start, end)
+            parts.append(agregar_pedidos(select_dimensions(df_slice, selections)))
+
+        parts = [part for part in parts if not part.empty]
+        results.append(pd.concat(parts, ignore_index=True) if parts else fatos_vazios())
+    return results
+
+def calculate_monthly_trend(df):
+    """Calcula a variação mês a mês na contagem de pedidos para franqueados."""
+    df_trend = df.groupby(['franqueado', 'ano_mes'], observed=True).agg(total_pedidos=('total_pedidos', 'sum')).reset_index()
+    df_trend = df_trend.sort_values(by=['franqueado', 'ano_mes'])
+
+    # Pega os últimos dois meses para cada franqueado
+    df_last_two = df_trend.groupby('franqueado').tail(2)
+    # Calcula a diferença no total de pedidos entre os últimos dois meses
+    df_last_two['variacao'] = df_last_two.groupby('franqueado')['total_pedidos'].diff()
+    # Filtra linhas onde a variacao é NaN (significa apenas um mês de dados)
+    df_final = df_last_two.dropna(subset=['variacao'])
+    df_final['variacao'] = df_final['variacao'].astype(int)
+    return df_final[['franqueado', 'variacao']]
+
+def compute_franchisee_tab(df_filtered):
+    """Agregados da aba de franqueados a partir dos fatos do período atual (sem os excluídos)."""
+    df_active_franchisees = df_filtered[~df_filtered['excluido']]
+
+    df_rank = df_active_franchisees.groupby('franqueado', observed=True)['total_pedidos'].sum().reset_index(name='qtd_pedidos')
+    df_rank = df_rank.sort_values(by='qtd_pedidos', ascending=False)
+
+    df_trend = calculate_monthly_trend(df_active_franchisees)
+    df_decline = df_trend[df_trend['variacao'] < 0].sort_values(by='variacao', ascending=True)
+    df_growth = df_trend[df_trend['variacao'] > 0].sort_values(by='variacao', ascending=False)
+    return df_rank, df_decline, df_growth
+
+def compute_general_tab(df_filtered):
+    """Agregados da aba geral a partir dos fatos do período atual."""
+    df_monthly = df_filtered.groupby('ano_mes', observed=True).agg(total_pedidos=('total_pedidos', 'sum')).reset_index()
+
+    df_suppliers = df_filtered.groupby('fornecedor', observed=True).agg(valor_total=('valor_total', 'sum')).reset_index()
+    df_suppliers = df_suppliers.sort_values(by='valor_total', ascending=False)
+
+    status_desejados = ["FINALIZADO", "CANCELADO", "PEDIDO ENTREGUE", "EM PROCESSAMENTO"]
+    df_status_for_chart = df_filtered[df_filtered["status"].isin(status_desejados)]
+    df_status_distribution = df_status_for_chart.groupby('status', observed=True).agg(count_pedidos=('total_pedidos', 'sum')).reset_index()
+    if not df_status_distribution.empty:
+        df_status_distribution['percentage'] = (df_status_distribution['count_pedidos'] / df_status_distribution['count_pedidos'].sum()) * 100
+    return df_monthly, df_suppliers, df_status_distribution
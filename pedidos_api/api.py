@@ -1,33 +1,227 @@
 import os
+import json
+import codecs
+import time
 import logging
+import threading
+from collections import OrderedDict
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from dotenv import load_dotenv
+from config import carregar_env
+from metricas import contador, histograma
 
-load_dotenv()
+carregar_env()
 logger = logging.getLogger(__name__)
 
-def buscar_pedidos(periodo: str):
-    url = os.getenv('API_URL')
-    headers = {'x-api-key': os.getenv('API_KEY')}
-    params = {'periodo': periodo}
+TAMANHO_BLOCO_STREAM = int(os.getenv('TAMANHO_BLOCO_STREAM', 64 * 1024))
 
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504],
-        allowed_methods=["GET"]
-    )
+# Devolvido quando a API responde 304: o período não mudou desde a última busca.
+NAO_MODIFICADO = object()
 
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+class ErroAPI(Exception):
+    pass
 
-    with requests.Session() as session:
-        session.mount("https://", adapter)
+API_LATENCIA = histograma(
+    'pedidos_api_requisicao_segundos',
+    'Latência das requisições à API de pedidos (até os cabeçalhos no modo stream).',
+    ('status', 'stream'),
+)
+API_BYTES = contador('pedidos_api_bytes_total', 'Bytes recebidos da API de pedidos (comprimidos).')
+API_RETENTATIVAS = contador('pedidos_api_retentativas_total', 'Retentativas feitas pelo adapter HTTP.')
+API_ERROS = contador('pedidos_api_erros_total', 'Requisições à API que falharam (rede ou status >= 400) após as retentativas.')
+
+class ClienteAPI:
+    def __init__(self, url=None, api_key=None, timeout=None, max_validadores=None, pool_max=None):
+        self.url = url or os.getenv('API_URL')
+        self.timeout = timeout or int(os.getenv('REQUEST_TIMEOUT', 10))
+        self.max_validadores = max_validadores or int(os.getenv('API_CACHE_VALIDADORES', 64))
+
+        retry_strategy = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"]
+        )
+        pool_max = pool_max or int(os.getenv('API_POOL_MAX', 10))
+        self._adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=1, pool_maxsize=pool_max)
+
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({
+            'x-api-key': api_key or os.getenv('API_KEY'),
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+        self._lock = threading.Lock()
+        self._validadores = OrderedDict()
+        self._estatisticas = {'requisicoes': 0, 'bytes_transferidos': 0, 'cache_hits': 0}
+
+    def _cabecalhos_condicionais(self, periodo):
+        with self._lock:
+            validadores = self._validadores.get(periodo)
+            if validadores:
+                self._validadores.move_to_end(periodo)
+        cabecalhos = {}
+        if validadores:
+            if validadores.get('etag'):
+                cabecalhos['If-None-Match'] = validadores['etag']
+            if validadores.get('last_modified'):
+                cabecalhos['If-Modified-Since'] = validadores['last_modified']
+        return cabecalhos
+
+    def _guardar_validadores(self, periodo, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._validadores[periodo] = {'etag': etag, 'last_modified': last_modified}
+            self._validadores.move_to_end(periodo)
+            while len(self._validadores) > self.max_validadores:
+                self._validadores.popitem(last=False)
+
+    def _contabilizar(self, response):
+        transferidos = response.raw.tell()
+        API_BYTES.inc(transferidos)
+        with self._lock:
+            self._estatisticas['requisicoes'] += 1
+            self._estatisticas['bytes_transferidos'] += transferidos
+            if response.status_code == 304:
+                self._estatisticas['cache_hits'] += 1
+
+    def esquecer(self, periodo):
+        # Usado quando a gravação falha: a próxima busca do período volta a
+        # trazer o conteúdo completo em vez de um 304.
+        with self._lock:
+            self._validadores.pop(periodo, None)
+
+    def _get(self, periodo, condicional, stream=False):
+        cabecalhos = self._cabecalhos_condicionais(periodo) if condicional else {}
+        inicio = time.perf_counter()
+        try:
+            response = self.session.get(self.url, headers=cabecalhos, params={'periodo': periodo},
+                                        stream=stream, timeout=self.timeout)
+        except requests.RequestException:
+            API_LATENCIA.observar(time.perf_counter() - inicio, status='erro', stream=str(stream).lower())
+            API_ERROS.inc()
+            raise
+        API_LATENCIA.observar(time.perf_counter() - inicio, status=response.status_code, stream=str(stream).lower())
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            API_RETENTATIVAS.inc(len(retries.history))
+        if not response.ok:
+            API_ERROS.inc()
+        response.raise_for_status()
+        return response
+
+    def buscar(self, periodo, condicional=True):
+        try:
+            response = self._get(periodo, condicional)
+            self._contabilizar(response)
+            if response.status_code == 304:
+                logger.info(f'Pedidos de {periodo} sem alteração desde a última busca (304).')
+                return NAO_MODIFICADO
+            pedidos = response.json()
+            self._guardar_validadores(periodo, response)
+            return pedidos
+        except requests.RequestException as e:
+            logger.error(f'Erro ao buscar pedidos da API: {e}')
+            return None
+
+    def buscar_stream(self, periodo, condicional=True):
         try:
-            response = session.get(url, headers=headers, params=params, timeout=int(os.getenv('REQUEST_TIMEOUT', 10)))
-            response.raise_for_status()
-            return response.json()
+            response = self._get(periodo, condicional, stream=True)
         except requests.RequestException as e:
             logger.error(f'Erro ao buscar pedidos da API: {e}')
-            return []
+            raise ErroAPI(str(e)) from e
+
+        if response.status_code == 304:
+            self._contabilizar(response)
+            response.close()
+            logger.info(f'Pedidos de {periodo} sem alteração desde a última busca (304).')
+            return NAO_MODIFICADO
+
+        self._guardar_validadores(periodo, response)
+        return self._iterar_resposta(response)
+
+    def _iterar_resposta(self, response):
+        try:
+            yield from _iterar_lista_json(response.iter_content(chunk_size=TAMANHO_BLOCO_STREAM))
+        except requests.RequestException as e:
+            logger.error(f'Erro ao buscar pedidos da API: {e}')
+            raise ErroAPI(str(e)) from e
+        finally:
+            self._contabilizar(response)
+            response.close()
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._estatisticas)
+        conexoes = requisicoes_pool = 0
+        pools = self._adapter.poolmanager.pools
+        for chave in pools.keys():
+            pool = pools.get(chave)
+            if pool is not None:
+                conexoes += pool.num_connections
+                requisicoes_pool += pool.num_requests
+        metricas['conexoes_abertas'] = conexoes
+        metricas['conexoes_reutilizadas'] = max(requisicoes_pool - conexoes, 0)
+        return metricas
+
+    def fechar(self):
+        self.session.close()
+
+cliente = None
+_lock_cliente = threading.Lock()
+
+def get_cliente():
+    global cliente
+    if cliente is None:
+        with _lock_cliente:
+            if cliente is None:
+                cliente = ClienteAPI()
+                logger.info('Cliente da API criado com sucesso.')
+    return cliente
+
+def buscar_pedidos(periodo: str, condicional=True):
+    return get_cliente().buscar(periodo, condicional=condicional)
+
+def _iterar_lista_json(blocos):
+    # Lê uma lista JSON de objetos bloco a bloco e devolve cada objeto assim que
+    # ele estiver completo, sem carregar a resposta inteira em memória.
+    decodificador = json.JSONDecoder()
+    decodificador_utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    dentro_da_lista = False
+
+    for bloco in blocos:
+        buffer += decodificador_utf8.decode(bloco)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not dentro_da_lista:
+                if buffer[pos] != '[':
+                    raise ErroAPI('Resposta da API não é uma lista.')
+                dentro_da_lista = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                objeto, pos_fim = decodificador.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Objeto ainda incompleto: espera o próximo bloco.
+                break
+            yield objeto
+            pos = pos_fim
+        buffer = buffer[pos:]
+
+    raise ErroAPI('Resposta da API terminou antes do fim da lista.')
+
+def buscar_pedidos_stream(periodo: str, condicional=True):
+    return get_cliente().buscar_stream(periodo, condicional=condicional)
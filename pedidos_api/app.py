@@ -1,13 +1,191 @@
-from fastapi import FastAPI
-from processador import processar_pedidos
+import os
+import sys
+import logging
+import importlib
+import threading
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from config import carregar_env
+from metricas import REGISTRO
+from jobs import GerenciadorJobs
+from agendador import AgendadorIngestao, AGENDADOR_ATIVO
 
-app = FastAPI()
+carregar_env()
+logger = logging.getLogger(__name__)
+
+# Ingestão, banco e exportação (requests, psycopg2, pandas) são importados na
+# primeira rota que os usa, não na subida: o health check responde antes deles.
+# Com APP_PREAQUECER=1 eles são carregados logo após a subida, em segundo plano,
+# para que a primeira requisição real também não pague o import.
+APP_PREAQUECER = os.getenv('APP_PREAQUECER', '1') == '1'
+MODULOS_PREAQUECIMENTO = ('processador', 'exportacao')
+# Módulos que registram métricas ao serem importados; /metrics os carrega antes
+# de expor, para que as séries apareçam (zeradas) mesmo antes da primeira ingestão.
+MODULOS_METRICAS = ('api', 'db', 'processador')
+
+jobs = GerenciadorJobs()
+agendador = AgendadorIngestao(jobs)
+
+def _importar(modulos):
+    for modulo in modulos:
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            logger.warning(f"Não foi possível pré-carregar {modulo}: {e}")
+
+def _preaquecer():
+    _importar(MODULOS_PREAQUECIMENTO)
+
+@asynccontextmanager
+async def lifespan(app):
+    if APP_PREAQUECER:
+        threading.Thread(target=_preaquecer, name="preaquecimento", daemon=True).start()
+    if AGENDADOR_ATIVO:
+        agendador.iniciar()
+    yield
+    if AGENDADOR_ATIVO:
+        agendador.parar()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def health_check():
-    return {"status": "API Online"}
+    return {
+        "status": "API Online",
+        "dependencias_carregadas": all(modulo in sys.modules for modulo in MODULOS_PREAQUECIMENTO),
+    }
 
-@app.post("/rodar-pedidos")
+@app.post("/rodar-pedidos", status_code=202)
 def rodar():
-    processar_pedidos()
-    return {"mensagem": "Ingestão executada com sucesso"}
+    from processador import processar_pedidos
+
+    periodo = date.today().isoformat()
+    job, novo = jobs.submeter(f"rodar-pedidos:{periodo}", processar_pedidos, periodo)
+    mensagem = "Ingestão agendada" if novo else "Ingestão já em andamento"
+    return {"mensagem": mensagem, "job_id": job["id"], "status": job["status"]}
+
+@app.post("/backfill", status_code=202)
+def backfill(inicio: date, fim: date, ignorar_checkpoint: bool = False):
+    if inicio > fim:
+        raise HTTPException(status_code=400, detail="A data inicial deve ser anterior ou igual à data final.")
+    from processador import processar_backfill
+
+    job, novo = jobs.submeter(
+        f"backfill:{inicio}:{fim}", processar_backfill, inicio, fim, ignorar_checkpoint=ignorar_checkpoint
+    )
+    mensagem = "Backfill agendado" if novo else "Backfill já em andamento"
+    return {"mensagem": mensagem, "job_id": job["id"], "status": job["status"]}
+
+@app.get("/jobs")
+def listar_jobs():
+    return jobs.listar()
+
+@app.get("/jobs/{job_id}")
+def status_job(job_id: str):
+    job = jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
+
+@app.get("/agendador")
+def status_agendador():
+    return agendador.status()
+
+@app.get("/pool")
+def status_pool():
+    from db import estatisticas_pool
+
+    return estatisticas_pool() or {"mensagem": "Pool ainda não inicializado."}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    _importar(MODULOS_METRICAS)
+    return PlainTextResponse(REGISTRO.expor(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/execucoes")
+def historico_execucoes(limite: int = Query(50, ge=1, le=1000), modo: Optional[str] = None):
+    from psycopg2.errors import UndefinedTable
+    from db import get_conn, put_conn, listar_execucoes, ErroPool
+
+    try:
+        conn = get_conn()
+    except ErroPool as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Só a tabela inexistente vira 404; conexão perdida ou erro de SQL seguem
+    # como 500 e ficam no log.
+    try:
+        return listar_execucoes(conn, limite, modo)
+    except UndefinedTable:
+        conn.rollback()
+        raise HTTPException(status_code=404, detail="Histórico de execuções ainda não existe.")
+    finally:
+        put_conn(conn)
+
+@app.get("/pedidos/mudancas")
+def mudancas_status(desde: int = Query(0, ge=0), limite: int = Query(1000, ge=1, le=10000)):
+    """Pedidos novos e mudanças de status com seq maior que `desde`.
+
+    Para acompanhar o feed, passe em `desde` o `proximo` da resposta anterior;
+    `mais` indica que há entradas além do limite.
+    """
+    from psycopg2.errors import UndefinedTable
+    from db import get_conn, put_conn, listar_mudancas_status, ErroPool
+
+    try:
+        conn = get_conn()
+    except ErroPool as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        mudancas = listar_mudancas_status(conn, desde, limite)
+    except UndefinedTable:
+        conn.rollback()
+        raise HTTPException(status_code=404, detail="Log de status ainda não existe.")
+    finally:
+        put_conn(conn)
+    return {
+        "mudancas": mudancas,
+        "proximo": mudancas[-1]["seq"] if mudancas else desde,
+        "mais": len(mudancas) == limite,
+    }
+
+def _transmitir_export(conn, formato, inicio, fim, filtros):
+    # A conexão fica presa ao download e volta ao pool mesmo se o cliente desconectar.
+    from db import put_conn
+    from exportacao import gerar_export_pedidos
+
+    try:
+        yield from gerar_export_pedidos(conn, formato, inicio, fim, filtros)
+    finally:
+        put_conn(conn)
+
+@app.get("/exportar/pedidos")
+def exportar_pedidos(
+    inicio: date,
+    fim: date,
+    formato: str = "csv",
+    franqueado: Optional[List[str]] = Query(None),
+    fornecedor: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+):
+    from db import get_conn, ErroPool
+    from exportacao import FORMATOS_EXPORT, nome_arquivo_export
+
+    if inicio > fim:
+        raise HTTPException(status_code=400, detail="A data inicial deve ser anterior ou igual à data final.")
+    if formato not in FORMATOS_EXPORT:
+        raise HTTPException(status_code=400, detail=f"Formato inválido. Use um de: {', '.join(FORMATOS_EXPORT)}.")
+    filtros = {'franqueado': franqueado, 'fornecedor': fornecedor, 'status': status}
+    nome_arquivo = nome_arquivo_export("pedidos", formato, inicio, fim)
+    # A conexão é obtida antes de a resposta começar, para o erro ainda virar 503.
+    try:
+        conn = get_conn()
+    except ErroPool as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StreamingResponse(
+        _transmitir_export(conn, formato, inicio, fim, filtros),
+        media_type=FORMATOS_EXPORT[formato][0],
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'},
+    )
@@ -0,0 +1,66 @@
+"""Micro-benchmark da extração de pedidos.
+
+Compara `extrair_dados_pedido` (um pedido por vez) com `extrair_pedidos_lote`
+sobre pedidos sintéticos. Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.bench_extracao --pedidos 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from utils import extrair_dados_pedido, extrair_pedidos_lote
+
+FORNECEDORES = [f"FORN{i:03d} - Distribuidora Papelaria São José {i}" for i in range(150)]
+STATUS = ["Finalizado", "Cancelado", "Pedido Entregue", "Em Processamento", "Aguardando Aprovação"]
+
+def gerar_pedidos(quantidade, semente=42):
+    aleatorio = random.Random(semente)
+    inicio = datetime(2025, 1, 1)
+    pedidos = []
+    for i in range(quantidade):
+        data = inicio + timedelta(seconds=aleatorio.randint(0, 180 * 86400), milliseconds=aleatorio.randint(0, 999))
+        pedidos.append({
+            'codigo': 100000 + i,
+            'situacao': {'descricao': aleatorio.choice(STATUS)},
+            'franqueado': {'nome': f"Franqueado {aleatorio.randint(1, 400)}"},
+            'fornecedor': {'nome': aleatorio.choice(FORNECEDORES)},
+            'dataCriacao': data.strftime('%Y-%m-%dT%H:%M:%S.') + f"{data.microsecond // 1000:03d}Z",
+            'itensPedido': [
+                {'quantidadeProdutos': aleatorio.randint(1, 20), 'valorUnitario': round(aleatorio.uniform(1, 80), 2)}
+                for _ in range(aleatorio.randint(1, 6))
+            ],
+        })
+    return pedidos
+
+def medir(funcao, pedidos, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(pedidos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    pedidos = gerar_pedidos(args.pedidos)
+
+    registros, rejeitados = extrair_pedidos_lote(pedidos)
+    referencia = [extrair_dados_pedido(p) for p in pedidos]
+    assert registros == referencia and not rejeitados, "extração em lote diverge da função original"
+
+    tempo_unitario = medir(lambda ps: [extrair_dados_pedido(p) for p in ps], pedidos, args.repeticoes)
+    tempo_lote = medir(extrair_pedidos_lote, pedidos, args.repeticoes)
+
+    print(f"{args.pedidos} pedidos (melhor de {args.repeticoes})")
+    print(f"  extrair_dados_pedido: {tempo_unitario:.3f}s  ({args.pedidos / tempo_unitario:,.0f} pedidos/s)")
+    print(f"  extrair_pedidos_lote: {tempo_lote:.3f}s  ({args.pedidos / tempo_lote:,.0f} pedidos/s)")
+    print(f"  ganho: {tempo_unitario / tempo_lote:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Memória residente do dashboard com 1 e com 20 sessões simultâneas.
+
+Compara o comportamento anterior (`st.cache_data`: cada sessão recebe uma cópia
+desserializada do DataFrame com strings) com o conjunto compartilhado atual
+(`st.cache_resource` + categorias: cada sessão recorta views dos pedidos com as
+funções de `agregacoes.py` usadas pelo dashboard e guarda só os fatos agregados).
+Cada cenário roda em um processo separado. Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.bench_memoria_dash --linhas 500000
+"""
+import argparse
+import gc
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from agregacoes import select_dimensions, slice_by_date
+from cache_agregados import CacheAgregados, chave_filtros
+from consultas import _derivar_colunas, agregar_pedidos
+
+def rss_mb():
+    with open('/proc/self/status') as arquivo:
+        for linha in arquivo:
+            if linha.startswith('VmRSS:'):
+                return int(linha.split()[1]) / 1024
+    return float('nan')
+
+def gerar_frame(linhas, semente=42):
+    aleatorio = np.random.default_rng(semente)
+    franqueados = np.array([f"Franqueado {i}" for i in range(400)] + [f"Franqueado {i} [Excluído]" for i in range(20)])
+    fornecedores = np.array([f"FORNECEDOR {i}" for i in range(150)])
+    status = np.array(["FINALIZADO", "CANCELADO", "PEDIDO ENTREGUE", "EM PROCESSAMENTO"])
+    inicio = np.datetime64('2023-01-01T00:00:00')
+    segundos = aleatorio.integers(0, 3 * 365 * 86400, linhas)
+    return pd.DataFrame({
+        'numero_pedido': np.arange(1_000_000, 1_000_000 + linhas),
+        'status': status[aleatorio.integers(0, len(status), linhas)].astype(object),
+        'franqueado': franqueados[aleatorio.zipf(1.3, linhas) % len(franqueados)].astype(object),
+        'fornecedor': fornecedores[aleatorio.zipf(1.5, linhas) % len(fornecedores)].astype(object),
+        'data_pedido': inicio + segundos.astype('timedelta64[s]'),
+        'valor_pedido': aleatorio.gamma(2.0, 400.0, linhas).round(2),
+    })
+
+def executar_cenario(cenario, linhas, usuarios):
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+    base = rss_mb()
+    df = gerar_frame(linhas)
+    df['ano_mes'] = df['data_pedido'].dt.to_period('M').astype(str)
+    sessoes = []
+
+    if cenario == 'copia':
+        # st.cache_data devolve um pickle.loads(pickle.dumps(df)) a cada chamada.
+        serializado = pickle.dumps(df)
+        del df
+        for _ in range(usuarios):
+            copia = pickle.loads(serializado)
+            sessoes.append(copia[copia['franqueado'] != 'Franqueado 0'])
+            sessoes.append(copia)
+    else:
+        compartilhado = _derivar_colunas(df.drop(columns=['ano_mes']))
+        del df
+        cache = CacheAgregados()
+        selecoes = (('franqueado', ()), ('fornecedor', ()), ('status', ()))
+        for i in range(usuarios):
+            # Cada sessão com um período diferente, pelo mesmo caminho do dashboard:
+            # recorte por busca binária, filtros por código de categoria e fatos
+            # agregados guardados no cache do processo. Só os fatos são novos.
+            periodo = (pd.Timestamp('2024-01-01') + pd.Timedelta(days=i), pd.Timestamp('2025-06-30'))
+
+            def calcular(periodo=periodo):
+                recorte = slice_by_date(compartilhado, *periodo)
+                return agregar_pedidos(select_dimensions(recorte, selecoes))
+
+            sessoes.append(cache.obter(chave_filtros('facts', [periodo], selecoes, None), calcular))
+
+    gc.collect()
+    return rss_mb() - base
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=500000)
+    parser.add_argument('--usuarios', type=int, nargs='+', default=[1, 20])
+    parser.add_argument('--cenario', choices=['copia', 'compartilhado'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        print(f"{executar_cenario(args.cenario, args.linhas, args.usuarios[0]):.1f}")
+        return
+
+    print(f"{args.linhas} pedidos, memória residente adicional (MB)")
+    print(f"{'usuários':>10} {'cópia por sessão':>18} {'compartilhado':>15}")
+    for usuarios in args.usuarios:
+        resultados = []
+        for cenario in ('copia', 'compartilhado'):
+            saida = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_memoria_dash', '--cenario', cenario,
+                 '--linhas', str(args.linhas), '--usuarios', str(usuarios)],
+                check=True, capture_output=True, text=True,
+            )
+            resultados.append(float(saida.stdout.strip()))
+        print(f"{usuarios:>10} {resultados[0]:>18.1f} {resultados[1]:>15.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Upsert e consultas por período na tabela particionada por mês contra a tabela única antiga.
+
+Em um banco temporário (como em `benchmarks.suite`), gera o mesmo histórico de
+pedidos em duas tabelas: `pedidos`, criada pelas migrações (partições mensais
+e índices de consulta), e `pedidos_simples`, no formato antigo (chave em
+numero_pedido e índice em atualizado_em). Para cada tamanho de histórico em
+anos, mede:
+
+- upsert de um lote no mês corrente (metade pedidos novos, metade mudanças de status);
+- leitura de um mês, como a janela do dashboard e do export;
+- busca do que mudou desde a marca d'água dentro de um mês, como o dashboard;
+- recálculo do rollup de um mês, como a ingestão.
+
+Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.bench_particionamento --anos 1 3 --pedidos-por-mes 50000
+"""
+import argparse
+import time
+from datetime import date
+
+import psycopg2
+from psycopg2 import extras
+
+from migracoes import criar_tabela_pedidos, meses_entre
+from db import banco_descartavel, criar_particao, parametros_conexao
+
+HOJE = date(2025, 6, 15)
+MES_CORRENTE = '2025-06'
+
+SQL_GERAR = """
+    INSERT INTO {tabela} (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido, atualizado_em)
+    SELECT 'P' || i,
+           (ARRAY['Pendente', 'Aprovado', 'Faturado', 'Entregue', 'Cancelado'])[1 + i %% 5],
+           'Franqueado ' || (i * 7919) %% 500,
+           'Fornecedor ' || (i * 104729) %% 80,
+           data,
+           to_char(data, 'YYYY-MM'),
+           round((random() * 5000)::numeric, 2),
+           data
+    FROM (
+        SELECT i, %(fim)s::timestamp - (%(fim)s::timestamp - %(inicio)s::timestamp) * (i::float / %(total)s) AS data
+        FROM generate_series(1, %(total)s::bigint) AS i
+    ) gerados;
+"""
+
+SQL_UPSERT = """
+    INSERT INTO {tabela} (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido)
+    VALUES %s
+    ON CONFLICT ({chave}) DO UPDATE
+    SET status = EXCLUDED.status, atualizado_em = now()
+    WHERE {tabela}.status IS DISTINCT FROM EXCLUDED.status;
+"""
+
+CONSULTAS = {
+    'leitura do mês': """
+        SELECT numero_pedido, status, franqueado, fornecedor, data_pedido, valor_pedido
+        FROM {tabela}
+        WHERE data_pedido >= '2025-05-01' AND data_pedido < '2025-06-01';
+    """,
+    'delta da marca': """
+        SELECT numero_pedido, status, franqueado, fornecedor, data_pedido, valor_pedido
+        FROM {tabela}
+        WHERE atualizado_em > now() - interval '1 hour'
+          AND data_pedido >= '2025-06-01' AND data_pedido < '2025-07-01';
+    """,
+    'rollup do mês': """
+        SELECT franqueado, fornecedor, status, count(*), sum(valor_pedido)
+        FROM {tabela}
+        WHERE data_pedido >= '2025-05-01' AND data_pedido < '2025-06-01'
+        GROUP BY 1, 2, 3;
+    """,
+}
+
+def criar_tabelas(cur, inicio):
+    criar_tabela_pedidos(cur)
+    for ano_mes in meses_entre(inicio, HOJE):
+        criar_particao(cur, ano_mes)
+    cur.execute("""
+        CREATE TABLE pedidos_simples (
+            numero_pedido VARCHAR PRIMARY KEY,
+            status TEXT,
+            franqueado TEXT,
+            fornecedor TEXT,
+            data_pedido TIMESTAMP,
+            mes_pedido TEXT,
+            valor_pedido NUMERIC(14, 2),
+            atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX ON pedidos_simples (atualizado_em);
+        CREATE UNIQUE INDEX ON pedidos_simples (numero_pedido, data_pedido);
+    """)
+
+def lote_upsert(cur, tabela, tamanho):
+    """Metade do lote muda o status de pedidos do mês corrente, a outra metade é nova."""
+    cur.execute(f"""
+        SELECT numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido
+        FROM {tabela} WHERE data_pedido >= '2025-06-01' ORDER BY numero_pedido LIMIT %s;
+    """, (tamanho // 2,))
+    alterados = [(n, 'Alterado ' + (s or ''), f, fo, d, m, v) for n, s, f, fo, d, m, v in cur.fetchall()]
+    novos = [
+        (f'N{i}', 'Pendente', 'Franqueado 1', 'Fornecedor 1', HOJE, MES_CORRENTE, 10)
+        for i in range(tamanho - len(alterados))
+    ]
+    return alterados + novos
+
+def cronometrar(cur, sql, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        cur.execute(sql)
+        if cur.description:
+            cur.fetchall()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+def medir(conn, tabela, tamanho_lote, repeticoes):
+    chave = 'numero_pedido, data_pedido'
+    resultados = {}
+    with conn.cursor() as cur:
+        lote = lote_upsert(cur, tabela, tamanho_lote)
+        inicio = time.perf_counter()
+        extras.execute_values(cur, SQL_UPSERT.format(tabela=tabela, chave=chave), lote, page_size=1000)
+        resultados['upsert do lote'] = time.perf_counter() - inicio
+        conn.rollback()
+        for nome, sql in CONSULTAS.items():
+            resultados[nome] = cronometrar(cur, sql.format(tabela=tabela), repeticoes)
+    conn.rollback()
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--anos', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--pedidos-por-mes', type=int, default=50000)
+    parser.add_argument('--lote', type=int, default=10000, help="Pedidos no upsert medido.")
+    parser.add_argument('--repeticoes', type=int, default=3, help="Cada consulta roda N vezes e vale a melhor.")
+    args = parser.parse_args()
+
+    print(f"{'anos':>4} {'pedidos':>10} {'medição':>16} {'simples (s)':>12} {'particionada (s)':>17}")
+    for anos in args.anos:
+        inicio = date(HOJE.year - anos, HOJE.month, 1)
+        total = args.pedidos_por_mes * len(meses_entre(inicio, HOJE))
+        with banco_descartavel('bench_pedidos') as banco:
+            conn = psycopg2.connect(**parametros_conexao(banco))
+            try:
+                with conn.cursor() as cur:
+                    criar_tabelas(cur, inicio)
+                    for tabela in ('pedidos', 'pedidos_simples'):
+                        cur.execute(SQL_GERAR.format(tabela=tabela), {'inicio': inicio, 'fim': HOJE, 'total': total})
+                conn.commit()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("VACUUM ANALYZE pedidos;")
+                    cur.execute("VACUUM ANALYZE pedidos_simples;")
+                conn.autocommit = False
+
+                simples = medir(conn, 'pedidos_simples', args.lote, args.repeticoes)
+                particionada = medir(conn, 'pedidos', args.lote, args.repeticoes)
+            finally:
+                conn.close()
+        for nome in simples:
+            print(f"{anos:>4} {total:>10} {nome:>16} {simples[nome]:>12.3f} {particionada[nome]:>17.3f}")
+
+if __name__ == '__main__':
+    main()
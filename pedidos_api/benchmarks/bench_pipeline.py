@@ -0,0 +1,63 @@
+"""Tempo total da ingestão sequencial contra o pipeline de estágios simultâneos.
+
+A busca e a gravação são simuladas com esperas fixas por lote (latência de rede
+e de banco); a extração é a real, sobre pedidos sintéticos. O sequencial paga a
+soma dos estágios; o pipeline deve ficar perto do estágio mais lento. Execute a
+partir de `pedidos_api/`:
+
+    python -m benchmarks.bench_pipeline --pedidos 50000 --busca-ms 40 --gravacao-ms 60
+"""
+import argparse
+import time
+
+from benchmarks.bench_extracao import gerar_pedidos
+from pipeline import executar_pipeline
+from processador import _lotes
+from utils import extrair_pedidos_lote
+
+def buscar_simulado(pedidos, tamanho, espera):
+    for lote in _lotes(pedidos, tamanho):
+        time.sleep(espera)
+        yield lote
+
+def gravar_simulado(espera):
+    def gravar(extraido):
+        time.sleep(espera)
+    return gravar
+
+def sequencial(pedidos, tamanho, espera_busca, espera_gravacao):
+    inicio = time.perf_counter()
+    for lote in buscar_simulado(pedidos, tamanho, espera_busca):
+        gravar_simulado(espera_gravacao)(extrair_pedidos_lote(lote))
+    return time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=50000)
+    parser.add_argument('--lote', type=int, default=1000)
+    parser.add_argument('--busca-ms', type=float, default=40)
+    parser.add_argument('--gravacao-ms', type=float, default=60)
+    parser.add_argument('--extratores', type=int, nargs='+', default=[0, 2])
+    args = parser.parse_args()
+
+    pedidos = gerar_pedidos(args.pedidos)
+    espera_busca, espera_gravacao = args.busca_ms / 1000, args.gravacao_ms / 1000
+
+    print(f"{args.pedidos} pedidos em lotes de {args.lote}")
+    print(f"{'modo':>22} {'total (s)':>10} {'busca':>8} {'extração':>9} {'gravação':>9}")
+    print(f"{'sequencial':>22} {sequencial(pedidos, args.lote, espera_busca, espera_gravacao):>10.2f}")
+    for extratores in args.extratores:
+        tempos = executar_pipeline(
+            buscar_simulado(pedidos, args.lote, espera_busca),
+            extrair_pedidos_lote,
+            gravar_simulado(espera_gravacao),
+            extratores=extratores,
+        )
+        nome = f"pipeline ({extratores} proc.)" if extratores else "pipeline (thread)"
+        print(
+            f"{nome:>22} {tempos['total']:>10.2f} {tempos['busca']:>8.2f} "
+            f"{tempos['extracao']:>9.2f} {tempos['gravacao']:>9.2f}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Carga a frio de uma janela do dashboard a partir do snapshot Parquet local.
+
+Grava um snapshot sintético (um arquivo por mês, como o mantido pela ingestão)
+em um diretório temporário e mede `carregar_pedidos_snapshot` para janelas de
+1, 3 e 12 meses. Com `--banco`, mede também `carregar_pedidos` na mesma janela
+contra o banco configurado no `.env`. Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.bench_snapshot --linhas 1000000
+"""
+import argparse
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+import pyarrow as pa
+
+from benchmarks.bench_memoria_dash import gerar_frame
+from consultas import carregar_pedidos, carregar_pedidos_snapshot
+from snapshot import SnapshotPedidos, CHAVE_WATERMARK
+
+JANELAS = {
+    '1 mês': (date(2025, 6, 1), date(2025, 6, 30)),
+    '3 meses': (date(2025, 4, 1), date(2025, 6, 30)),
+    '12 meses': (date(2024, 7, 1), date(2025, 6, 30)),
+}
+
+def gravar_snapshot_sintetico(snapshot, linhas):
+    import pyarrow.parquet as pq
+
+    df = gerar_frame(linhas)
+    df['atualizado_em'] = datetime.now(timezone.utc)
+    ano_mes = df['data_pedido'].dt.strftime('%Y-%m')
+    marca = {CHAVE_WATERMARK: datetime.now(timezone.utc).isoformat().encode()}
+    for mes, parte in df.groupby(ano_mes):
+        tabela = pa.Table.from_pandas(parte.sort_values('data_pedido'), preserve_index=False)
+        snapshot._gravar_atomico(pq, tabela.replace_schema_metadata({**tabela.schema.metadata, **marca}), mes)
+
+def cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return time.perf_counter() - inicio, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=1000000)
+    parser.add_argument('--banco', action='store_true', help="Mede também a leitura da mesma janela no banco.")
+    args = parser.parse_args()
+
+    conn = None
+    if args.banco:
+        from db import get_conn
+        conn = get_conn()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        snapshot = SnapshotPedidos(diretorio)
+        gravar_snapshot_sintetico(snapshot, args.linhas)
+
+        print(f"{args.linhas} pedidos no snapshot, carga a frio da janela (s)")
+        print(f"{'janela':>10} {'pedidos':>10} {'snapshot':>10} {'banco':>10}")
+        for nome, (inicio, fim) in JANELAS.items():
+            segundos, (df, _) = cronometrar(carregar_pedidos_snapshot, snapshot, inicio, fim)
+            banco = f"{cronometrar(carregar_pedidos, conn, inicio, fim)[0]:>10.3f}" if conn else f"{'-':>10}"
+            print(f"{nome:>10} {len(df):>10} {segundos:>10.3f} {banco}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Pedidos sintéticos no formato da API, com cardinalidades e assimetria realistas.
+
+Poucos franqueados e fornecedores concentram a maior parte dos pedidos (pesos
+de Zipf), a maioria dos pedidos está finalizada ou entregue, o volume cresce ao
+longo do período e a quantidade de itens e os valores têm cauda longa. Há
+franqueados B2B e excluídos, fornecedores com acento e com prefixo de código,
+como na API real.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+FRANQUEADOS = 400
+FORNECEDORES = 150
+STATUS = {
+    "Finalizado": 55,
+    "Pedido Entregue": 22,
+    "Em Processamento": 10,
+    "Cancelado": 8,
+    "Aguardando Aprovação": 4,
+    "Em Separação": 1,
+}
+NOMES_FORNECEDOR = ["Papelaria São José", "Distribuidora Gráfica", "Comércio de Papéis Ação", "Indústria Escolar"]
+
+def _pesos_zipf(quantidade, expoente):
+    return [1 / (posicao ** expoente) for posicao in range(1, quantidade + 1)]
+
+def _acumulados(pesos):
+    total, acumulados = 0, []
+    for peso in pesos:
+        total += peso
+        acumulados.append(total)
+    return acumulados
+
+def _franqueados():
+    nomes = [f"Franqueado {i}" for i in range(1, FRANQUEADOS + 1)]
+    # Alguns franqueados encerrados e clientes B2B, tratados à parte pelo dashboard.
+    nomes += [f"Franqueado {i} [Excluído]" for i in range(FRANQUEADOS + 1, FRANQUEADOS + 21)]
+    nomes += [f"B2B Cliente Corporativo {i}" for i in range(1, 11)]
+    return nomes
+
+def _fornecedores():
+    return [
+        f"F{i:04d} - {NOMES_FORNECEDOR[i % len(NOMES_FORNECEDOR)]} {i}"
+        for i in range(1, FORNECEDORES + 1)
+    ]
+
+def _formatar_data(data):
+    return data.strftime('%Y-%m-%dT%H:%M:%S.') + f"{data.microsecond // 1000:03d}Z"
+
+def iterar_pedidos(quantidade, semente=42, inicio=datetime(2024, 1, 1), dias=540, codigo_inicial=1_000_000,
+                   itens_max=30, tamanho_bloco=10000):
+    """Gera `quantidade` pedidos em blocos (listas), sem manter todos em memória."""
+    aleatorio = random.Random(semente)
+    franqueados = _franqueados()
+    fornecedores = _fornecedores()
+    status = list(STATUS)
+    pesos_franqueados = _acumulados(_pesos_zipf(len(franqueados), 1.1))
+    pesos_fornecedores = _acumulados(_pesos_zipf(len(fornecedores), 1.3))
+    pesos_status = _acumulados(STATUS.values())
+    segundos_periodo = dias * 86400
+
+    gerados = 0
+    while gerados < quantidade:
+        tamanho = min(tamanho_bloco, quantidade - gerados)
+        idx_franqueados = aleatorio.choices(range(len(franqueados)), cum_weights=pesos_franqueados, k=tamanho)
+        idx_fornecedores = aleatorio.choices(range(len(fornecedores)), cum_weights=pesos_fornecedores, k=tamanho)
+        idx_status = aleatorio.choices(range(len(status)), cum_weights=pesos_status, k=tamanho)
+        bloco = []
+        for i in range(tamanho):
+            # Volume crescente ao longo do período (densidade triangular).
+            segundos = aleatorio.triangular(0, segundos_periodo, segundos_periodo)
+            data = inicio + timedelta(seconds=int(segundos), milliseconds=aleatorio.randint(0, 999))
+            itens = min(itens_max, 1 + int(aleatorio.expovariate(0.35)))
+            bloco.append({
+                'codigo': codigo_inicial + gerados + i,
+                'situacao': {'descricao': status[idx_status[i]]},
+                'franqueado': {'nome': franqueados[idx_franqueados[i]]},
+                'fornecedor': {'nome': fornecedores[idx_fornecedores[i]]},
+                'dataCriacao': _formatar_data(data),
+                'itensPedido': [
+                    {
+                        'quantidadeProdutos': 1 + int(aleatorio.expovariate(0.15)),
+                        'valorUnitario': round(aleatorio.lognormvariate(2.5, 0.9), 2),
+                    }
+                    for _ in range(itens)
+                ],
+            })
+        gerados += tamanho
+        yield bloco
+
+def gerar_pedidos(quantidade, semente=42, **opcoes):
+    return [pedido for bloco in iterar_pedidos(quantidade, semente, **opcoes) for pedido in bloco]
+
+def gerar_payload(quantidade, semente=42, **opcoes):
+    """Corpo JSON (bytes) da resposta da API com `quantidade` pedidos, serializado bloco a bloco."""
+    partes = []
+    for bloco in iterar_pedidos(quantidade, semente, **opcoes):
+        partes.append(json.dumps(bloco, ensure_ascii=False)[1:-1].encode('utf-8'))
+    return b'[' + b','.join(parte for parte in partes if parte) + b']'
@@ -0,0 +1,110 @@
+"""Perfil de import dos pontos de entrada e tempo até o primeiro health check.
+
+Para `app.py` (API), `main.py` (CLI) e `dash.py` (dashboard), executa os imports
+de nível de módulo do arquivo com `python -X importtime` em um processo limpo e
+mostra o tempo total e os imports diretos mais caros. Também sobe a API com
+uvicorn e mede o tempo até a primeira resposta do health check (`GET /`).
+
+A verificação de que nenhuma dependência pesada volta a ser carregada na
+subida fica em `tests/test_inicializacao.py`. Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.perfil_inicializacao
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+DIRETORIO_PACOTE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRADAS = {'app': 'app.py', 'main': 'main.py', 'dash': 'dash.py'}
+
+def imports_de_modulo(arquivo):
+    """Código com os imports de nível de módulo do arquivo, sem executar o restante."""
+    with open(os.path.join(DIRETORIO_PACOTE, arquivo), encoding='utf-8') as origem:
+        arvore = ast.parse(origem.read())
+    return '\n'.join(ast.unparse(no) for no in arvore.body if isinstance(no, (ast.Import, ast.ImportFrom)))
+
+def perfil_imports(codigo, ignorar=frozenset()):
+    """Executa `codigo` com -X importtime; devolve (total em ms, imports diretos [(ms, nome)], módulos carregados).
+
+    Módulos em `ignorar` (os da própria inicialização do interpretador) ficam de fora.
+    """
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        cwd=DIRETORIO_PACOTE, capture_output=True, text=True,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1])
+
+    diretos, modulos = [], set()
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, cumulativo, nome = linha[len('import time:'):].split('|')
+        if nome.strip() in ignorar:
+            continue
+        modulos.add(nome.strip())
+        # Imports diretos do código não têm recuo; os aninhados têm.
+        if not nome[1:].startswith(' '):
+            diretos.append((int(cumulativo) / 1000, nome.strip()))
+    return sum(ms for ms, _ in diretos), sorted(diretos, reverse=True), modulos
+
+def melhor_perfil(codigo, repeticoes, ignorar):
+    return min((perfil_imports(codigo, ignorar) for _ in range(repeticoes)), key=lambda perfil: perfil[0])
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def tempo_ate_saude(timeout=30):
+    """Milissegundos entre iniciar `uvicorn app:app` e a primeira resposta 200 de `GET /`."""
+    porta = _porta_livre()
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--port', str(porta), '--log-level', 'warning'],
+        cwd=DIRETORIO_PACOTE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - inicio < timeout:
+            if processo.poll() is not None:
+                raise RuntimeError(f"uvicorn terminou com código {processo.returncode}.")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{porta}/', timeout=1) as resposta:
+                    corpo = json.loads(resposta.read())
+                    return (time.perf_counter() - inicio) * 1000, corpo
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"Health check sem resposta em {timeout}s.")
+    finally:
+        processo.terminate()
+        processo.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=3, help="Mede cada ponto de entrada N vezes e usa a melhor.")
+    parser.add_argument('--top', type=int, default=8, help="Imports diretos exibidos por ponto de entrada.")
+    args = parser.parse_args()
+
+    _, _, inicializacao = perfil_imports('pass')
+    for nome, arquivo in ENTRADAS.items():
+        total, diretos, _ = melhor_perfil(imports_de_modulo(arquivo), args.repeticoes, inicializacao)
+        print(f"{nome} ({arquivo}): {total:.0f} ms de imports")
+        for ms, modulo in diretos[:args.top]:
+            print(f"  {ms:>8.1f} ms  {modulo}")
+
+    if importlib.util.find_spec('uvicorn') is None:
+        print("uvicorn não instalado: tempo até o health check não medido.")
+    else:
+        ms, corpo = tempo_ate_saude()
+        print(f"API: primeira resposta do health check em {ms:.0f} ms: {corpo}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Servidor HTTP local no lugar da API de pedidos, para benchmarks e testes manuais.
+
+Responde `GET /?periodo=...` com pedidos sintéticos (`benchmarks.gerador`),
+com latência e tamanho de resposta configuráveis, gzip quando o cliente pede e
+ETag/304 como a API real. A resposta de cada período é gerada uma vez e
+reaproveitada. Para apontar a ingestão para ele manualmente, a partir de
+`pedidos_api/` (a execução diária busca o dia de hoje; o backfill, cada dia do
+intervalo):
+
+    python -m benchmarks.servidor_api --pedidos 10000 --latencia-ms 50 --porta 8099
+    API_URL=http://127.0.0.1:8099/ python main.py
+    API_URL=http://127.0.0.1:8099/ python main.py --inicio 2025-06-01 --fim 2025-06-07
+"""
+import argparse
+import gzip
+import hashlib
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.gerador import gerar_payload
+
+class _Resposta:
+    def __init__(self, corpo):
+        self.corpo = corpo
+        self.etag = '"' + hashlib.sha1(corpo).hexdigest() + '"'
+        self._gzip = None
+        self._lock = threading.Lock()
+
+    def comprimida(self):
+        with self._lock:
+            if self._gzip is None:
+                self._gzip = gzip.compress(self.corpo, compresslevel=5)
+            return self._gzip
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        servidor = self.server.api
+        periodo = parse_qs(urlparse(self.path).query).get('periodo', [''])[0]
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+        resposta = servidor.resposta(periodo)
+
+        if self.headers.get('If-None-Match') == resposta.etag:
+            self.send_response(304)
+            self.send_header('ETag', resposta.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        corpo = resposta.corpo
+        comprimir = servidor.gzip and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if comprimir:
+            corpo = resposta.comprimida()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('ETag', resposta.etag)
+        if comprimir:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+class ServidorAPIFake:
+    """API de pedidos falsa em uma thread, em 127.0.0.1; use como context manager.
+
+    `pedidos` é a quantidade de pedidos por período; os códigos não se repetem
+    entre períodos. Demais opções de `gerar_payload` (dias, itens_max...) são
+    repassadas ao gerador.
+    """
+
+    def __init__(self, pedidos=1000, latencia_ms=0, gzip=True, porta=0, **opcoes_gerador):
+        self.pedidos = pedidos
+        self.latencia = latencia_ms / 1000
+        self.gzip = gzip
+        self.opcoes_gerador = opcoes_gerador
+        self._respostas = {}
+        self._lock = threading.Lock()
+        self._http = ThreadingHTTPServer(('127.0.0.1', porta), _Handler)
+        self._http.daemon_threads = True
+        self._http.api = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._http.server_address[1]}/'
+
+    def resposta(self, periodo):
+        with self._lock:
+            if periodo not in self._respostas:
+                indice = len(self._respostas)
+                self._respostas[periodo] = _Resposta(gerar_payload(
+                    self.pedidos,
+                    semente=zlib.crc32(periodo.encode()),
+                    codigo_inicial=1_000_000 + indice * self.pedidos,
+                    **self.opcoes_gerador,
+                ))
+            return self._respostas[periodo]
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._http.shutdown()
+        self._http.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *excecao):
+        self.parar()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=10000, help="Pedidos por período.")
+    parser.add_argument('--latencia-ms', type=float, default=0)
+    parser.add_argument('--itens-max', type=int, default=30, help="Máximo de itens por pedido (tamanho da resposta).")
+    parser.add_argument('--sem-gzip', action='store_true')
+    parser.add_argument('--porta', type=int, default=8099)
+    args = parser.parse_args()
+
+    servidor = ServidorAPIFake(args.pedidos, args.latencia_ms, not args.sem_gzip, args.porta, itens_max=args.itens_max)
+    print(f"API falsa em {servidor.url} ({args.pedidos} pedidos por período, {args.latencia_ms} ms de latência)")
+    try:
+        servidor._http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor._http.server_close()
+
+if __name__ == '__main__':
+    main()
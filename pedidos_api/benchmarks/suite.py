@@ -0,0 +1,209 @@
+"""Benchmark de ponta a ponta da ingestão e do dashboard, com API falsa e banco descartável.
+
+Para cada tamanho (padrão: 10 mil, 100 mil e 1 milhão de pedidos), cria um banco
+temporário no PostgreSQL configurado no `.env` (o usuário precisa de permissão
+de CREATE DATABASE), sobe a API falsa de `benchmarks.servidor_api` e mede, cada
+cenário em um processo separado:
+
+- `ingestao`: `processar_pedidos` buscando o período na API falsa e gravando no banco;
+- `dashboard`: a carga e agregação da primeira abertura do dashboard (metadados,
+  rollups dos meses completos, pedidos dos meses parciais pelo snapshot local e
+  agregados das abas);
+- `dashboard_banco`: o mesmo com `SNAPSHOT_ATIVO=0`, lendo os pedidos do banco.
+
+Reporta tempo, pedidos por segundo e pico de memória residente de cada
+processo. Os resultados são acrescentados a `benchmarks/resultados/suite.jsonl`
+e comparados com a última medição equivalente (mesmo cenário, tamanho e
+parâmetros da API); quedas de vazão ou aumentos de memória acima da tolerância
+aparecem como regressão. Execute a partir de `pedidos_api/`:
+
+    python -m benchmarks.suite --tamanhos 10000 100000 --latencia-ms 50
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+
+from benchmarks.servidor_api import ServidorAPIFake
+from config import carregar_env
+from db import banco_descartavel
+
+carregar_env()
+
+DIRETORIO_PACOTE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTADOS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados', 'suite.jsonl')
+CENARIOS = ('ingestao', 'dashboard', 'dashboard_banco')
+PERIODO = '2025-06-30'
+
+def pico_rss_mb():
+    # ru_maxrss vem em KB no Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# --- Cenários (executados no processo filho) ---
+
+def cenario_ingestao(periodo):
+    from processador import processar_pedidos
+
+    inicio = time.perf_counter()
+    resultado = processar_pedidos(periodo)
+    segundos = time.perf_counter() - inicio
+    if resultado is None:
+        raise RuntimeError("processar_pedidos falhou; veja o log acima.")
+    return segundos
+
+def cenario_dashboard():
+    from agregacoes import build_filtered_periods, compute_franchisee_tab, compute_general_tab
+    from cache_pedidos import CachePedidos
+    from consultas import carregar_metadados, carregar_rollup, carregar_watermark
+    from db import get_conn, put_conn
+    from snapshot import SNAPSHOT_ATIVO, SnapshotPedidos
+
+    inicio = time.perf_counter()
+    conn = get_conn()
+    try:
+        watermark = carregar_watermark(conn)
+        metadados = carregar_metadados(conn)
+        cache = CachePedidos(snapshot=SnapshotPedidos() if SNAPSHOT_ATIVO else None)
+        # Abertura padrão do dashboard: todo o intervalo de datas, sem filtros,
+        # pelas mesmas funções que o dash.py chama, sem os caches do Streamlit.
+        periodo = (metadados['data_min'].normalize(), metadados['data_max'].normalize())
+        selecoes = (('franqueado', ()), ('fornecedor', ()), ('status', ()))
+        fatos, = build_filtered_periods(
+            [periodo], selecoes,
+            load_rollup=lambda meses: carregar_rollup(conn, meses),
+            load_month=lambda inicio_mes, fim_mes: cache.janela(inicio_mes, fim_mes).obter(conn, watermark),
+        )
+    finally:
+        put_conn(conn)
+
+    compute_franchisee_tab(fatos)
+    compute_general_tab(fatos)
+    return time.perf_counter() - inicio
+
+def executar_cenario(cenario, periodo):
+    warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
+    rss_inicial = pico_rss_mb()
+    segundos = cenario_ingestao(periodo) if cenario == 'ingestao' else cenario_dashboard()
+    print(json.dumps({'segundos': segundos, 'rss_inicial_mb': rss_inicial, 'pico_rss_mb': pico_rss_mb()}))
+
+# --- Orquestração ---
+
+def medir_em_subprocesso(cenario, ambiente):
+    processo = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--cenario', cenario, '--periodo', PERIODO],
+        cwd=DIRETORIO_PACOTE, env=ambiente, stdout=subprocess.PIPE, text=True,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(f"Cenário {cenario} terminou com código {processo.returncode}.")
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+def descrever_execucao():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRETORIO_PACOTE, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'maquina': platform.node(),
+    }
+
+def carregar_resultados(caminho):
+    if not os.path.exists(caminho):
+        return []
+    with open(caminho, encoding='utf-8') as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+def _chave(resultado):
+    return (resultado['cenario'], resultado['pedidos'], resultado['latencia_ms'], resultado['itens_max'])
+
+def comparar(resultado, anteriores, tolerancia):
+    """Variação de vazão e memória em relação à última medição equivalente, e se é regressão."""
+    anterior = next((r for r in reversed(anteriores) if _chave(r) == _chave(resultado)), None)
+    if anterior is None:
+        return None, None, False
+    vazao = resultado['pedidos_por_s'] / anterior['pedidos_por_s'] - 1
+    memoria = resultado['pico_rss_mb'] / anterior['pico_rss_mb'] - 1
+    return vazao, memoria, vazao < -tolerancia or memoria > tolerancia
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--cenarios', nargs='+', choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--itens-max', type=int, default=30, help="Máximo de itens por pedido (tamanho da resposta).")
+    parser.add_argument('--resultados', default=RESULTADOS_PADRAO)
+    parser.add_argument('--tolerancia', type=float, default=0.10, help="Variação aceita antes de apontar regressão.")
+    parser.add_argument('--falhar-em-regressao', action='store_true', help="Sai com código 1 se houver regressão.")
+    parser.add_argument('--cenario', choices=CENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--periodo', default=PERIODO, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        executar_cenario(args.cenario, args.periodo)
+        return
+
+    execucao = descrever_execucao()
+    anteriores = carregar_resultados(args.resultados)
+    novos, regressoes = [], 0
+
+    print(f"{'cenário':>16} {'pedidos':>9} {'tempo (s)':>10} {'pedidos/s':>11} {'pico RSS (MB)':>14} {'Δ vazão':>9} {'Δ memória':>10}")
+    for tamanho in args.tamanhos:
+        servidor = ServidorAPIFake(tamanho, args.latencia_ms, itens_max=args.itens_max)
+        with tempfile.TemporaryDirectory() as temporario, banco_descartavel('bench_pedidos') as banco, servidor:
+            # Gera a resposta antes de medir: o custo do gerador não entra na ingestão.
+            servidor.resposta(PERIODO)
+            ambiente = {
+                **os.environ,
+                'DB_NAME': banco,
+                'API_URL': servidor.url,
+                'FINGERPRINT_ARQUIVO': os.path.join(temporario, 'fingerprints.json'),
+                'SNAPSHOT_DIR': os.path.join(temporario, 'snapshot'),
+            }
+            # A ingestão sempre roda: é ela que popula o banco dos cenários do dashboard.
+            for cenario in ['ingestao'] + [c for c in args.cenarios if c != 'ingestao']:
+                ambiente_cenario = {**ambiente, 'SNAPSHOT_ATIVO': '0'} if cenario == 'dashboard_banco' else ambiente
+                medicao = medir_em_subprocesso(cenario, ambiente_cenario)
+                if cenario not in args.cenarios:
+                    continue
+                resultado = {
+                    **execucao,
+                    'cenario': cenario,
+                    'pedidos': tamanho,
+                    'latencia_ms': args.latencia_ms,
+                    'itens_max': args.itens_max,
+                    'segundos': round(medicao['segundos'], 3),
+                    'pedidos_por_s': round(tamanho / medicao['segundos'], 1),
+                    'pico_rss_mb': round(medicao['pico_rss_mb'], 1),
+                    'rss_inicial_mb': round(medicao['rss_inicial_mb'], 1),
+                }
+                vazao, memoria, regressao = comparar(resultado, anteriores, args.tolerancia)
+                regressoes += regressao
+                novos.append(resultado)
+                print(
+                    f"{cenario:>16} {tamanho:>9} {resultado['segundos']:>10.2f} {resultado['pedidos_por_s']:>11,.0f} "
+                    f"{resultado['pico_rss_mb']:>14.0f} "
+                    f"{'-' if vazao is None else f'{vazao:+.1%}':>9} {'-' if memoria is None else f'{memoria:+.1%}':>10}"
+                    f"{'  REGRESSÃO' if regressao else ''}"
+                )
+
+    os.makedirs(os.path.dirname(args.resultados), exist_ok=True)
+    with open(args.resultados, 'a', encoding='utf-8') as arquivo:
+        for resultado in novos:
+            arquivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+    print(f"Resultados acrescentados a {args.resultados}.")
+    if regressoes and args.falhar_em_regressao:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+# Memória máxima ocupada pelos agregados guardados; acima dela os menos usados saem.
+CACHE_AGREGADOS_ORCAMENTO = int(os.getenv('DASH_CACHE_AGREGADOS_MB', 128)) * 1024 * 1024
+
+def chave_filtros(visao, periodos, selecoes, versao):
+    """Hash canônico do estado dos filtros: mesma visão, mesmos dias, mesmas seleções
+    (em qualquer ordem) e mesma versão dos dados geram a mesma chave."""
+    canonico = {
+        'visao': visao,
+        'periodos': [[pd.Timestamp(inicio).date().isoformat(), pd.Timestamp(fim).date().isoformat()] for inicio, fim in periodos],
+        'selecoes': {coluna: sorted(str(valor) for valor in valores) for coluna, valores in selecoes},
+        'versao': None if versao is None else str(versao),
+    }
+    return hashlib.sha256(json.dumps(canonico, sort_keys=True).encode()).hexdigest()
+
+def tamanho_estimado(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, (tuple, list)):
+        return sys.getsizeof(valor) + sum(tamanho_estimado(item) for item in valor)
+    return sys.getsizeof(valor)
+
+class CacheAgregados:
+    """Agregados do dashboard compartilhados por todas as sessões do processo.
+
+    Os valores são devolvidos sem cópia e devem ser tratados como somente
+    leitura. A remoção é LRU, limitada por `orcamento_bytes`. Sessões que pedem
+    ao mesmo tempo um agregado ausente esperam um único cálculo.
+    """
+
+    def __init__(self, orcamento_bytes=CACHE_AGREGADOS_ORCAMENTO):
+        self.orcamento_bytes = orcamento_bytes
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._calculando = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removidos = 0
+
+    def _buscar(self, chave):
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        self._itens.move_to_end(chave)
+        self.hits += 1
+        return item
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            item = self._buscar(chave)
+            if item is not None:
+                return item[0]
+            trava = self._calculando.setdefault(chave, threading.Lock())
+
+        with trava:
+            with self._lock:
+                # Outra sessão pode ter calculado enquanto esperávamos a trava.
+                item = self._buscar(chave)
+                if item is not None:
+                    return item[0]
+                self.misses += 1
+            try:
+                valor = calcular()
+                self._guardar(chave, valor)
+                return valor
+            finally:
+                with self._lock:
+                    self._calculando.pop(chave, None)
+
+    def _guardar(self, chave, valor):
+        tamanho = tamanho_estimado(valor)
+        with self._lock:
+            if tamanho > self.orcamento_bytes:
+                logger.warning(f"Agregado de {tamanho} bytes maior que o orçamento do cache; não será guardado.")
+                return
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._itens[chave] = (valor, tamanho)
+            self._bytes += tamanho
+            while self._bytes > self.orcamento_bytes:
+                _, (_, tamanho_removido) = self._itens.popitem(last=False)
+                self._bytes -= tamanho_removido
+                self.removidos += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'itens': len(self._itens),
+                'bytes': self._bytes,
+                'orcamento_bytes': self.orcamento_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'removidos': self.removidos,
+                'taxa_hit': self.hits / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+from datetime import timedelta
+import pandas as pd
+from consultas import carregar_pedidos, carregar_pedidos_alterados, carregar_pedidos_snapshot, compactar_pedidos
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+# Folga aplicada à marca d'água: uma transação de ingestão que começou antes
+# da última leitura, mas só fez commit depois, ainda é capturada.
+MARGEM_WATERMARK = timedelta(seconds=int(os.getenv('DASH_MARGEM_WATERMARK_S', 300)))
+
+class JanelaPedidos:
+    """Snapshot em memória dos pedidos de uma janela de datas, atualizado incrementalmente."""
+
+    def __init__(self, data_inicio, data_fim, snapshot=None):
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.snapshot = snapshot
+        self.df = None
+        self.watermark = None
+        self._lock = threading.Lock()
+
+    def obter(self, conn, watermark):
+        with self._lock:
+            if self.df is None or self.watermark is None:
+                self._carregar(conn, watermark)
+            elif watermark is not None and watermark > self.watermark:
+                self._atualizar(conn, watermark)
+            return self.df
+
+    def _carregar(self, conn, watermark):
+        # Com o snapshot local, o banco só entrega o que mudou depois dele.
+        lido = None
+        if self.snapshot is not None:
+            try:
+                lido = carregar_pedidos_snapshot(self.snapshot, self.data_inicio, self.data_fim)
+            except Exception as e:
+                logger.warning(f"Snapshot local indisponível, lendo a janela do banco: {e}")
+        if lido is None:
+            self.df = carregar_pedidos(conn, self.data_inicio, self.data_fim)
+            self.watermark = watermark
+            return
+        self.df, self.watermark = lido
+        if watermark is not None and watermark > self.watermark:
+            self._atualizar(conn, watermark)
+
+    def _atualizar(self, conn, watermark):
+        delta = carregar_pedidos_alterados(conn, self.watermark - MARGEM_WATERMARK)
+        if not delta.empty:
+            # Toda linha de um pedido alterado sai, inclusive a de um pedido que
+            # mudou de data para fora da janela; voltam só as que caem nela.
+            mantidos = self.df[~self.df['numero_pedido'].isin(delta['numero_pedido'])]
+            datas = delta['data_pedido']
+            delta = delta[
+                (datas >= pd.Timestamp(self.data_inicio)) & (datas < pd.Timestamp(self.data_fim) + timedelta(days=1))
+            ]
+            self.df = compactar_pedidos(pd.concat([mantidos, delta], ignore_index=True))
+        logger.info(
+            f"Janela {self.data_inicio} a {self.data_fim}: {len(delta)} pedidos atualizados "
+            f"desde {self.watermark}."
+        )
+        self.watermark = watermark
+
+class CachePedidos:
+    """Janelas de pedidos compartilhadas pelo processo, com limite de janelas em memória."""
+
+    def __init__(self, max_janelas=16, snapshot=None):
+        self.max_janelas = max_janelas
+        self.snapshot = snapshot
+        self._janelas = {}
+        self._lock = threading.Lock()
+
+    def janela(self, data_inicio, data_fim):
+        chave = (data_inicio, data_fim)
+        with self._lock:
+            janela = self._janelas.pop(chave, None)
+            if janela is None:
+                janela = JanelaPedidos(data_inicio, data_fim, self.snapshot)
+            self._janelas[chave] = janela
+            while len(self._janelas) > self.max_janelas:
+                self._janelas.pop(next(iter(self._janelas)))
+            return janela
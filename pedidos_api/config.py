@@ -0,0 +1,20 @@
+import threading
+
+_carregado = False
+_lock = threading.Lock()
+
+def carregar_env():
+    """Lê o `.env` uma única vez por processo; as chamadas seguintes não fazem nada.
+
+    Todo módulo que lê variáveis de ambiente ao ser importado chama esta função
+    antes, de modo que a configuração não depende da ordem dos imports. Variáveis
+    já definidas no ambiente têm precedência sobre o arquivo.
+    """
+    global _carregado
+    if _carregado:
+        return
+    with _lock:
+        if not _carregado:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _carregado = True
@@ -0,0 +1,173 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from filtros import FILTRO_SEM_B2B, PARAMS_SEM_B2B
+
+# Colunas realmente usadas pelo dashboard; evita trazer mes_pedido e afins.
+COLUNAS_DASHBOARD = "numero_pedido, status, franqueado, fornecedor, data_pedido, valor_pedido"
+LISTA_COLUNAS_DASHBOARD = [coluna.strip() for coluna in COLUNAS_DASHBOARD.split(',')]
+
+COLUNAS_CATEGORICAS = ('franqueado', 'fornecedor', 'status')
+PADRAO_EXCLUIDO = r'\[Excluído\]'
+
+class ErroSchema(Exception):
+    """Faltam no banco estruturas que as migrações da ingestão criam e o dashboard lê."""
+
+def verificar_schema(conn):
+    """Confere no catálogo, sem alterar nada, o que o dashboard lê; devolve a lista do que falta."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT to_regclass('pedidos') IS NOT NULL,
+                   to_regclass('pedidos_mensal') IS NOT NULL,
+                   EXISTS (
+                       SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = ANY(current_schemas(false))
+                         AND table_name = 'pedidos' AND column_name = 'atualizado_em'
+                   );
+        """)
+        existentes = cur.fetchone()
+    conn.rollback()
+    return [nome for nome, existe in zip(('pedidos', 'pedidos_mensal', 'pedidos.atualizado_em'), existentes) if not existe]
+
+def carregar_metadados(conn):
+    """Limites de datas e valores distintos usados pelos filtros da barra lateral."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT min(data_pedido), max(data_pedido)
+            FROM pedidos
+            WHERE {FILTRO_SEM_B2B};
+        """, PARAMS_SEM_B2B)
+        data_min, data_max = cur.fetchone()
+
+        valores = {}
+        for coluna in ('franqueado', 'fornecedor', 'status'):
+            cur.execute(f"""
+                SELECT DISTINCT {coluna}
+                FROM pedidos
+                WHERE {FILTRO_SEM_B2B} AND {coluna} IS NOT NULL
+                ORDER BY {coluna};
+            """, PARAMS_SEM_B2B)
+            valores[coluna] = [linha[0] for linha in cur.fetchall()]
+
+    return {
+        'data_min': pd.Timestamp(data_min) if data_min else None,
+        'data_max': pd.Timestamp(data_max) if data_max else None,
+        **valores,
+    }
+
+def marcar_excluidos(df):
+    """Flag de franqueado "[Excluído]", calculado uma vez por categoria e espalhado pelos códigos."""
+    categorias = df['franqueado'].cat.categories
+    flags = np.asarray(categorias.str.contains(PADRAO_EXCLUIDO, case=False, regex=True), dtype=bool)
+    # Código -1 (nulo) cai na posição extra, que é False.
+    flags = np.append(flags, False)
+    df['excluido'] = flags[df['franqueado'].cat.codes.to_numpy()]
+    return df
+
+def compactar_pedidos(df):
+    """Deixa os pedidos prontos para o filtro do dashboard: categorias, flag de excluído e ordem por data.
+
+    Inteiros são reduzidos ao menor tipo que comporta os valores; valor_pedido
+    continua float64, porque float32 perde centavos nas somas.
+    """
+    for coluna in COLUNAS_CATEGORICAS + ('ano_mes',):
+        df[coluna] = df[coluna].astype('category')
+    if pd.api.types.is_integer_dtype(df['numero_pedido']):
+        df['numero_pedido'] = pd.to_numeric(df['numero_pedido'], downcast='integer')
+    df = df.sort_values('data_pedido', kind='stable', ignore_index=True)
+    return marcar_excluidos(df)
+
+def _derivar_colunas(df):
+    # Conversões que não dependem de filtros são feitas aqui
+    df['data_pedido'] = pd.to_datetime(df['data_pedido'])
+    df['ano_mes'] = df['data_pedido'].dt.to_period('M').astype(str)
+    return compactar_pedidos(df)
+
+def carregar_pedidos(conn, data_inicio, data_fim):
+    """Pedidos entre data_inicio e data_fim (inclusive), já sem B2B."""
+    query = f"""
+        SELECT {COLUNAS_DASHBOARD}
+        FROM pedidos
+        WHERE {FILTRO_SEM_B2B}
+          AND data_pedido >= %(inicio)s
+          AND data_pedido < %(fim)s::date + 1;
+    """
+    df = pd.read_sql(query, conn, params={**PARAMS_SEM_B2B, 'inicio': data_inicio, 'fim': data_fim})
+    return _derivar_colunas(df)
+
+def carregar_watermark(conn):
+    """Última modificação gravada pela ingestão (max de pedidos.atualizado_em)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT max(atualizado_em) FROM pedidos;")
+        return cur.fetchone()[0]
+
+def carregar_pedidos_alterados(conn, desde):
+    """Pedidos inseridos ou alterados depois de `desde`, em qualquer mês, já sem B2B.
+
+    Sem filtro de datas: um pedido que mudou de data para fora de uma janela
+    precisa aparecer para que a linha antiga saia dela.
+    """
+    query = f"""
+        SELECT {COLUNAS_DASHBOARD}
+        FROM pedidos
+        WHERE {FILTRO_SEM_B2B}
+          AND atualizado_em > %(desde)s;
+    """
+    df = pd.read_sql(query, conn, params={**PARAMS_SEM_B2B, 'desde': desde})
+    return _derivar_colunas(df)
+
+# Formato comum consumido pelos gráficos: uma linha por mês/franqueado/fornecedor/status.
+COLUNAS_FATOS = ['ano_mes', 'franqueado', 'fornecedor', 'status', 'excluido', 'total_pedidos', 'valor_total']
+
+def fatos_vazios():
+    return pd.DataFrame(columns=COLUNAS_FATOS).astype({'excluido': bool, 'total_pedidos': 'int64', 'valor_total': float})
+
+def dividir_em_meses(data_inicio, data_fim):
+    """Separa [data_inicio, data_fim] em meses completos (lidos dos rollups) e parciais (lidos dos pedidos)."""
+    completos, parciais = [], []
+    mes = date(data_inicio.year, data_inicio.month, 1)
+    while mes <= data_fim:
+        proximo = date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+        if mes >= data_inicio and proximo - timedelta(days=1) <= data_fim:
+            completos.append(mes.strftime('%Y-%m'))
+        else:
+            parciais.append(mes.strftime('%Y-%m'))
+        mes = proximo
+    return completos, parciais
+
+def carregar_pedidos_snapshot(snapshot, data_inicio, data_fim):
+    """Pedidos da janela lidos do snapshot local, com os mesmos filtros de carregar_pedidos.
+
+    Devolve (pedidos, marca d'água do snapshot) ou None se faltar algum mês.
+    """
+    completos, parciais = dividir_em_meses(data_inicio, data_fim)
+    lido = snapshot.ler(sorted(completos + parciais), LISTA_COLUNAS_DASHBOARD)
+    if lido is None:
+        return None
+    df, watermark = lido
+    datas = pd.to_datetime(df['data_pedido'])
+    b2b = df['franqueado'].fillna('').str.lower().str.startswith(PARAMS_SEM_B2B['prefixo_b2b'].rstrip('%'))
+    na_janela = (datas >= pd.Timestamp(data_inicio)) & (datas < pd.Timestamp(data_fim) + timedelta(days=1))
+    return _derivar_colunas(df[na_janela & ~b2b].reset_index(drop=True)), watermark
+
+def carregar_rollup(conn, meses):
+    """Agregados mensais mantidos pela ingestão (tabela pedidos_mensal), já sem B2B."""
+    query = f"""
+        SELECT ano_mes, franqueado, fornecedor, status, total_pedidos, valor_total
+        FROM pedidos_mensal
+        WHERE ano_mes = ANY(%(meses)s)
+          AND {FILTRO_SEM_B2B};
+    """
+    df = pd.read_sql(query, conn, params={**PARAMS_SEM_B2B, 'meses': list(meses)})
+    df['valor_total'] = df['valor_total'].astype(float)
+    df['total_pedidos'] = pd.to_numeric(df['total_pedidos'], downcast='integer')
+    for coluna in COLUNAS_CATEGORICAS + ('ano_mes',):
+        df[coluna] = df[coluna].astype('category')
+    return marcar_excluidos(df)
+
+def agregar_pedidos(df):
+    """Converte pedidos individuais para o formato dos rollups."""
+    return (
+        df.groupby(['ano_mes', 'franqueado', 'fornecedor', 'status', 'excluido'], as_index=False, dropna=False, observed=True)
+          .agg(total_pedidos=('numero_pedido', 'count'), valor_total=('valor_pedido', 'sum'))
+    )[COLUNAS_FATOS]
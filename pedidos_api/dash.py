@@ -1,10 +1,20 @@
 import streamlit as st
+
+# Primeiro comando do Streamlit, antes dos imports pesados: o navegador já recebe
+# título e layout enquanto pandas e o acesso ao banco carregam. O plotly só é
+# importado quando um gráfico é desenhado.
+st.set_page_config(page_title="Dashboard de Pedidos", layout="wide", initial_sidebar_state="expanded")
+
 import pandas as pd
-import plotly.express as px
-import io
 import os
-from dotenv import load_dotenv
+from config import carregar_env
 from db import get_conn, put_conn
+from consultas import carregar_metadados, carregar_watermark, carregar_rollup, verificar_schema, ErroSchema
+from cache_pedidos import CachePedidos
+from cache_agregados import CacheAgregados, chave_filtros
+from agregacoes import build_filtered_periods, compute_franchisee_tab, compute_general_tab
+from snapshot import SnapshotPedidos, SNAPSHOT_ATIVO
+from exportacao import FORMATOS_EXPORT, gerar_xlsx, gerar_export_pedidos, lotes_dataframe, nome_arquivo_export
 from datetime import timedelta, date
 
 # Define add_months function globally to avoid redefinition on reruns
@@ -15,9 +25,14 @@ def add_months(sourcedate, months):
     day = min(sourcedate.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month-1])
     return date(year, month, day)
 
-st.set_page_config(page_title="Dashboard de Pedidos", layout="wide", initial_sidebar_state="expanded")
+# Os dados em cache são um único objeto compartilhado por todas as sessões
+# (st.cache_resource). Com copy-on-write, os recortes de cada sessão são views
+# e qualquer escrita gera uma cópia local, sem alterar o dado compartilhado
+# (no pandas 3 o copy-on-write já é o padrão).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
-load_dotenv()
+carregar_env()
 
 # Estilo CSS para tooltips personalizados e multiselect (MANTIDO EXATAMENTE COMO ESTAVA)
 st.markdown("""
@@ -57,27 +72,79 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- CACHE DE DADOS ---
-@st.cache_data
-def load_data():
-    """Carrega dados do banco de dados, realiza limpeza inicial e conversões de tipo."""
-    loading_message_placeholder = st.empty()
-    loading_message_placeholder.info("⌛ Carregando dados do banco de dados... Isso pode levar alguns segundos.")
+DASH_TTL_WATERMARK = int(os.getenv('DASH_TTL_WATERMARK_S', 30))
+
+@st.cache_resource
+def verificar_banco():
+    """Confere uma vez por processo, só com leituras, que o banco já passou pelas migrações.
 
+    O dashboard não altera o schema: pedidos_mensal, atualizado_em e as demais
+    estruturas são criadas pela ingestão. Se faltar algo, ErroSchema não fica em
+    cache e a próxima execução da página confere de novo.
+    """
     conn = None
     try:
         conn = get_conn()
-        query = "SELECT * FROM pedidos;"
-        df = pd.read_sql(query, conn)
+        faltando = verificar_schema(conn)
+    finally:
+        if conn:
+            put_conn(conn)
+    if faltando:
+        raise ErroSchema(', '.join(faltando))
 
-        # Exclusão do B2B
-        df['franqueado'] = df['franqueado'].astype(str)
-        df = df[~df['franqueado'].str.lower().str.startswith("b2b")]
+@st.cache_data(ttl=DASH_TTL_WATERMARK)
+def load_watermark():
+    """Lê a marca d'água gravada pela ingestão; muda sempre que algum pedido é inserido ou alterado."""
+    conn = None
+    try:
+        conn = get_conn()
+        return carregar_watermark(conn)
+    finally:
+        if conn:
+            put_conn(conn)
+
+@st.cache_resource(max_entries=2)
+def load_metadata(watermark):
+    """Carrega os limites de datas e as opções dos filtros, sem trazer os pedidos."""
+    conn = None
+    try:
+        conn = get_conn()
+        return carregar_metadados(conn)
+    finally:
+        if conn:
+            put_conn(conn)
+
+@st.cache_resource
+def get_cache_pedidos():
+    """Janelas de pedidos mantidas uma única vez no processo do Streamlit e compartilhadas entre sessões.
+
+    A primeira carga de cada janela vem do snapshot Parquet local, quando existe.
+    """
+    return CachePedidos(snapshot=SnapshotPedidos() if SNAPSHOT_ATIVO else None)
 
-        # Conversões que não dependem de filtros são feitas aqui
-        df['data_pedido'] = pd.to_datetime(df['data_pedido'])
-        df['ano'] = df['data_pedido'].dt.year
-        df['mes'] = df['data_pedido'].dt.month
-        df['ano_mes'] = df['data_pedido'].dt.to_period('M').astype(str)
+@st.cache_resource
+def get_cache_agregados():
+    """Agregados calculados (fatos filtrados e dados das abas), compartilhados por todas as sessões."""
+    return CacheAgregados()
+
+def load_data(data_inicio, data_fim, watermark):
+    """Devolve os pedidos da janela (meses parciais dos períodos), já sem B2B.
+
+    A primeira chamada carrega a janela inteira (do snapshot local, completado pelo
+    banco, ou só do banco); as seguintes só buscam os pedidos
+    inseridos ou alterados desde a última marca d'água e os mesclam no snapshot.
+    """
+    janela = get_cache_pedidos().janela(data_inicio, data_fim)
+    if janela.df is not None and janela.watermark == watermark:
+        return janela.df
+
+    loading_message_placeholder = st.empty()
+    loading_message_placeholder.info("⌛ Carregando dados do banco de dados... Isso pode levar alguns segundos.")
+
+    conn = None
+    try:
+        conn = get_conn()
+        df = janela.obter(conn, watermark)
 
         # Limpa a mensagem de carregamento após o sucesso
         loading_message_placeholder.empty()
@@ -86,6 +153,17 @@ def load_data():
         if conn:
             put_conn(conn)
 
+@st.cache_resource(max_entries=8)
+def load_rollup(meses, watermark):
+    """Carrega os agregados mensais mantidos pela ingestão para os meses completos dos períodos (compartilhados, somente leitura)."""
+    conn = None
+    try:
+        conn = get_conn()
+        return carregar_rollup(conn, meses)
+    finally:
+        if conn:
+            put_conn(conn)
+
 # --- Initialize session state for filters ---
 if 'franqueados_selected' not in st.session_state:
     st.session_state['franqueados_selected'] = []
@@ -94,63 +172,44 @@ if 'fornecedores_selected' not in st.session_state:
 if 'status_selected' not in st.session_state:
     st.session_state['status_selected'] = []
 if 'data_inicio_selected' not in st.session_state:
-    st.session_state['data_inicio_selected'] = None # Will be set after df_original is loaded
+    st.session_state['data_inicio_selected'] = None # Will be set after metadata is loaded
 if 'data_fim_selected' not in st.session_state:
-    st.session_state['data_fim_selected'] = None # Will be set after df_original is loaded
+    st.session_state['data_fim_selected'] = None # Will be set after metadata is loaded
 if 'top_n_selected' not in st.session_state:
     st.session_state['top_n_selected'] = 10 # Default value
 
-with st.spinner('Carregando dados do banco de dados...'): # Spinner for initial data load
-    df_original = load_data()
+with st.spinner('Carregando filtros...'): # Spinner for initial metadata load
+    try:
+        verificar_banco()
+    except ErroSchema as e:
+        st.info(
+            f"ℹ️ **O banco ainda não foi preparado pela ingestão** (falta: {e}).\n\n"
+            "Rode a ingestão uma vez (`python main.py`) e recarregue a página."
+        )
+        st.stop()
+    data_watermark = load_watermark()
+    metadata = load_metadata(data_watermark)
+
+if metadata['data_min'] is None:
+    st.warning("⚠️ **Nenhum pedido cadastrado** no banco de dados.")
+    st.stop()
+
+min_overall_ts = metadata['data_min']
+max_overall_ts = metadata['data_max']
 
 # Set default date values in session state if not already set
 if st.session_state['data_inicio_selected'] is None:
-    st.session_state['data_inicio_selected'] = df_original["data_pedido"].min().date()
+    st.session_state['data_inicio_selected'] = min_overall_ts.date()
 if st.session_state['data_fim_selected'] is None:
-    st.session_state['data_fim_selected'] = df_original["data_pedido"].max().date()
-
-
-def calculate_monthly_trend(df):
-    """Calcula a variação mês a mês na contagem de pedidos para franqueados."""
-    df_trend = df.groupby(['franqueado', 'ano_mes']).agg(total_pedidos=('numero_pedido', 'count')).reset_index()
-    df_trend = df_trend.sort_values(by=['franqueado', 'ano_mes'])
-
-    # Pega os últimos dois meses para cada franqueado
-    df_last_two = df_trend.groupby('franqueado').tail(2)
-    # Calcula a diferença no total de pedidos entre os últimos dois meses
-    df_last_two['variacao'] = df_last_two.groupby('franqueado')['total_pedidos'].diff()
-    # Filtra linhas onde a variacao é NaN (significa apenas um mês de dados)
-    df_final = df_last_two.dropna(subset=['variacao'])
-    df_final['variacao'] = df_final['variacao'].astype(int)
-    return df_final[['franqueado', 'variacao']]
-
-def export_excel(dataframe, sheet_name="Sheet1"):
-    """Exporta um DataFrame pandas para um arquivo Excel em bytes."""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        dataframe.to_excel(writer, index=False, sheet_name=sheet_name)
-    output.seek(0)
-    return output
-
-# --- Função auxiliar para gerar todos os exports ---
-def generate_all_exports(df_rank, df_decline, df_growth, df_monthly, df_suppliers_top, df_status_distribution):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df_rank.to_excel(writer, sheet_name="Top Franqueados", index=False)
-        df_decline.to_excel(writer, sheet_name="Queda Franqueados", index=False)
-        df_growth.to_excel(writer, sheet_name="Crescimento Franqueados", index=False)
-        df_monthly.to_excel(writer, sheet_name="Pedidos Mensais", index=False)
-        df_suppliers_top.to_excel(writer, sheet_name="Top Fornecedores", index=False)
-        df_status_distribution.to_excel(writer, sheet_name="Distribuicao Status", index=False)
-    output.seek(0)
-    return output
+    st.session_state['data_fim_selected'] = max_overall_ts.date()
+
 
 # --- FILTROS SIDEBAR ---
 with st.sidebar:
     st.title("Filtros do Dashboard 📊")
 
-    min_overall_date = df_original["data_pedido"].min().date()
-    max_overall_date = df_original["data_pedido"].max().date()
+    min_overall_date = min_overall_ts.date()
+    max_overall_date = max_overall_ts.date()
 
     # --- DATAS NO TOPO ---
     st.subheader("Período de Análise 🗓️")
@@ -229,7 +288,7 @@ with st.sidebar:
     # --- OUTROS FILTROS ---
     st.subheader("Filtros Adicionais 🔍")
 
-    unique_franqueados = sorted(df_original["franqueado"].unique())
+    unique_franqueados = metadata["franqueado"]
     franqueados = st.multiselect(
         "Selecione Franqueados",
         unique_franqueados,
@@ -238,7 +297,7 @@ with st.sidebar:
     )
     st.session_state['franqueados_selected'] = franqueados
 
-    unique_fornecedores = sorted(df_original["fornecedor"].unique())
+    unique_fornecedores = metadata["fornecedor"]
     fornecedores = st.multiselect(
         "Selecione Fornecedores",
         unique_fornecedores,
@@ -247,7 +306,7 @@ with st.sidebar:
     )
     st.session_state['fornecedores_selected'] = fornecedores
 
-    unique_status = sorted(df_original["status"].unique())
+    unique_status = metadata["status"]
     status = st.multiselect(
         "Selecione Status",
         unique_status,
@@ -258,42 +317,7 @@ with st.sidebar:
 
     st.markdown("---")
 
-    top_n = st.number_input(
-        "Número de Itens nos Rankings",
-        min_value=3, max_value=30, value=st.session_state['top_n_selected'], step=1,
-        help="Selecione a quantidade de itens (franqueados/fornecedores) a serem exibidos nos gráficos de ranking.",
-        key='top_n_input'
-    )
-    st.session_state['top_n_selected'] = top_n
-
-    st.markdown("---")
-
-# --- FILTRAGEM DE DADOS ---
-df_filtered = df_original.copy()
-
-if franqueados:
-    df_filtered = df_filtered[df_filtered["franqueado"].isin(franqueados)]
-if fornecedores:
-    df_filtered = df_filtered[df_filtered["fornecedor"].isin(fornecedores)]
-if status:
-    df_filtered = df_filtered[df_filtered["status"].isin(status)]
-
-df_filtered = df_filtered[
-    (df_filtered['data_pedido'] >= pd.to_datetime(data_inicio)) &
-    (df_filtered['data_pedido'] <= pd.to_datetime(data_fim))
-]
-
-# --- Feedback para filtros vazios ---
-if df_filtered.empty:
-    st.warning("""
-        ⚠️ **Nenhum dado encontrado!** Com os filtros selecionados, não há pedidos para exibir.
-        Por favor, **ajuste suas seleções** de Franqueados, Fornecedores, Status ou o período de Datas para ver os resultados.
-    """)
-    st.stop()
-
-df_active_franchisees = df_filtered[~df_filtered['franqueado'].str.contains(r'\[Excluído\]', case=False, na=False)]
-
-# --- Cálculo para Deltas dos KPIs ---
+# --- Cálculo do período de comparação ---
 current_period_start_dt = pd.to_datetime(data_inicio)
 current_period_end_dt = pd.to_datetime(data_fim)
 
@@ -307,33 +331,108 @@ else:
 
 # Tratar o caso em que o período anterior está fora do range de dados original
 # Ajusta previous_data_inicio para não ser menor que a data mínima geral de dados
-previous_data_inicio_adjusted = max(df_original["data_pedido"].min(), previous_data_inicio)
+previous_data_inicio_adjusted = max(min_overall_ts, previous_data_inicio)
 # Ajusta previous_data_fim para não ser maior que a data máxima geral de dados
-previous_data_fim_adjusted = min(df_original["data_pedido"].max(), previous_data_fim)
+previous_data_fim_adjusted = min(max_overall_ts, previous_data_fim)
 
+# --- CARGA E FILTRAGEM DOS PERÍODOS (ROLLUPS + PEDIDOS DOS MESES PARCIAIS) ---
+def cached_aggregate(view, filter_key, compute):
+    """Resultado de `compute` guardado no cache do processo pelo hash canônico dos filtros e da marca d'água.
 
-df_previous_period = df_original[
-    (df_original['data_pedido'] >= previous_data_inicio_adjusted) &
-    (df_original['data_pedido'] <= previous_data_fim_adjusted)
-]
+    Sessões com os mesmos filtros (ex.: o mesmo período rápido, sem seleções)
+    recebem o mesmo objeto, sem refazer nem copiar nada; o retorno é somente leitura.
+    """
+    periods, selections, watermark = filter_key
+    return get_cache_agregados().obter(chave_filtros(view, periods, selections, watermark), compute)
+
+def get_period_facts(filter_key):
+    """Fatos filtrados dos períodos atual e de comparação, memorizados pelo estado dos filtros."""
+    periods, selections, watermark = filter_key
+    return cached_aggregate("facts", filter_key, lambda: build_filtered_periods(
+        periods, selections,
+        load_rollup=lambda months: load_rollup(months, watermark),
+        load_month=lambda start, end: load_data(start, end, watermark),
+    ))
+
+# Agregados de cada aba, memorizados pelo estado dos filtros e calculados só quando
+# a aba é exibida (ou no export). Os rankings são guardados completos: mudar o
+# top N apenas recorta o resultado já calculado.
+def franchisee_tab_data(filter_key):
+    """Ranking de franqueados e tendências de queda/crescimento, completos e ordenados."""
+    return cached_aggregate("franchisee_tab", filter_key, lambda: compute_franchisee_tab(get_period_facts(filter_key)[0]))
+
+def general_tab_data(filter_key):
+    """Pedidos por mês, ranking completo de fornecedores e distribuição por status."""
+    return cached_aggregate("general_tab", filter_key, lambda: compute_general_tab(get_period_facts(filter_key)[0]))
+
+# --- EXPORTAÇÃO ---
+# Os arquivos são gerados só quando o botão de download é clicado (callable em
+# `data`), a partir do estado dos filtros. Extrações grandes devem usar
+# GET /exportar/pedidos da API, que transmite o arquivo sem passar pelo Streamlit.
+EXPORT_FORMAT_LABELS = {"Excel": "xlsx", "CSV": "csv", "Parquet": "parquet"}
+
+def export_summary(filter_key, top_n):
+    """Excel com os dados dos gráficos (rankings recortados no top N), montado em modo de memória constante."""
+    df_rank_all, df_decline_all, df_growth_all = franchisee_tab_data(filter_key)
+    df_monthly, df_suppliers_all, df_status_distribution = general_tab_data(filter_key)
+    sheets = [
+        ("Top Franqueados", df_rank_all.head(top_n)),
+        ("Queda Franqueados", df_decline_all.head(top_n)),
+        ("Crescimento Franqueados", df_growth_all.head(top_n)),
+        ("Pedidos Mensais", df_monthly),
+        ("Top Fornecedores", df_suppliers_all.head(top_n)),
+        ("Distribuicao Status", df_status_distribution),
+    ]
+    return b"".join(gerar_xlsx(
+        (name, list(df.columns), lotes_dataframe(df)) for name, df in sheets
+    ))
+
+def export_filtered_orders(filter_key, export_format):
+    """Pedidos do período atual com os filtros da barra lateral, lidos do banco em lotes."""
+    periods, selections, _ = filter_key
+    start, end = periods[0]
+    conn = None
+    try:
+        conn = get_conn()
+        return b"".join(gerar_export_pedidos(conn, export_format, start.date(), end.date(), dict(selections)))
+    finally:
+        if conn:
+            put_conn(conn)
+
+# --- FILTRAGEM DE DADOS ---
+# Estado dos filtros que define todos os cálculos abaixo; o top N fica de fora
+# porque só recorta rankings já calculados.
+filter_key = (
+    (
+        (current_period_start_dt, current_period_end_dt),
+        (previous_data_inicio_adjusted, previous_data_fim_adjusted),
+    ),
+    (("franqueado", tuple(franqueados)), ("fornecedor", tuple(fornecedores)), ("status", tuple(status))),
+    data_watermark,
+)
+
+with st.spinner('Carregando dados do banco de dados...'):
+    df_filtered, df_previous_period = get_period_facts(filter_key)
+
+# --- Feedback para filtros vazios ---
+if df_filtered.empty:
+    st.warning("""
+        ⚠️ **Nenhum dado encontrado!** Com os filtros selecionados, não há pedidos para exibir.
+        Por favor, **ajuste suas seleções** de Franqueados, Fornecedores, Status ou o período de Datas para ver os resultados.
+    """)
+    st.stop()
 
-# Apply same filters to previous period data
-if franqueados:
-    df_previous_period = df_previous_period[df_previous_period["franqueado"].isin(franqueados)]
-if fornecedores:
-    df_previous_period = df_previous_period[df_previous_period["fornecedor"].isin(fornecedores)]
-if status:
-    df_previous_period = df_previous_period[df_previous_period["status"].isin(status)]
+df_active_franchisees = df_filtered[~df_filtered['excluido']]
 
-df_active_franchisees_prev = df_previous_period[~df_previous_period['franqueado'].str.contains(r'\[Excluído\]', case=False, na=False)]
+df_active_franchisees_prev = df_previous_period[~df_previous_period['excluido']]
 
-total_pedidos_kpi = len(df_filtered)
-total_valor_kpi = df_filtered['valor_pedido'].sum()
+total_pedidos_kpi = df_filtered['total_pedidos'].sum()
+total_valor_kpi = df_filtered['valor_total'].sum()
 active_franchisees_kpi = df_active_franchisees['franqueado'].nunique()
 
 # KPIs do período anterior
-total_pedidos_kpi_prev = len(df_previous_period) if not df_previous_period.empty else 0
-total_valor_kpi_prev = df_previous_period['valor_pedido'].sum() if not df_previous_period.empty else 0
+total_pedidos_kpi_prev = df_previous_period['total_pedidos'].sum() if not df_previous_period.empty else 0
+total_valor_kpi_prev = df_previous_period['valor_total'].sum() if not df_previous_period.empty else 0
 active_franchisees_kpi_prev = df_active_franchisees_prev['franqueado'].nunique() if not df_active_franchisees_prev.empty else 0
 
 # Calcular deltas
@@ -371,7 +470,7 @@ st.info(f"{current_period_description} {comparison_description}")
 # --- FIM DA MELHORIA ---
 
 
-col1, col2, col3, col_export = st.columns([1, 1, 1, 0.7])
+col1, col2, col3 = st.columns(3)
 
 with col1:
     st.metric("Total de Pedidos", f"{total_pedidos_kpi:,.0f}", delta=delta_pedidos_str)
@@ -379,48 +478,21 @@ with col2:
     st.metric("Valor Total", f"R$ {total_valor_kpi:,.2f}", delta=delta_valor_str)
 with col3:
     st.metric("Franqueados Ativos", active_franchisees_kpi, delta=delta_franqueados_str)
-with col_export:
-    st.markdown(" ") # Espaçamento para alinhar o botão
-    st.markdown(" ")
-    # Botão de exportação que será habilitado após a geração dos DataFrames
-    if st.button("📥 Exportar Tudo (Excel)", help="Exporta os dados dos principais gráficos em um único arquivo Excel."):
-        excel_data = generate_all_exports(
-            df_rank_for_export,
-            df_decline_for_export,
-            df_growth_for_export,
-            df_monthly_for_export,
-            df_suppliers_top_for_export,
-            df_status_distribution_for_export
-        )
-        st.download_button(
-            label="Download do Excel",
-            data=excel_data,
-            file_name="dados_dashboard_pedidos.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="download_all_data_hidden"
-        )
 
 
 st.markdown("---")
 
 # --- ABAS ---
-tab1, tab2 = st.tabs(["Análise de Franqueados", "Análise Geral e Fornecedores"])
+ANALYSIS_VIEWS = ["Análise de Franqueados", "Análise Geral e Fornecedores"]
 
-# placeholders para dados que serão gerados nas abas para o export
-df_rank_for_export = pd.DataFrame()
-df_decline_for_export = pd.DataFrame()
-df_growth_for_export = pd.DataFrame()
-df_monthly_for_export = pd.DataFrame()
-df_suppliers_top_for_export = pd.DataFrame()
-df_status_distribution_for_export = pd.DataFrame()
+def render_franchisee_tab(filter_key, top_n):
+    import plotly.express as px
 
+    df_rank_all, df_decline_all, df_growth_all = franchisee_tab_data(filter_key)
 
-with tab1:
     st.markdown(f"""<h4>🏪 Top {top_n} Franqueados por Quantidade de Pedidos</h4>""", unsafe_allow_html=True)
 
-    df_rank = df_active_franchisees.groupby('franqueado')['numero_pedido'].count().reset_index(name='qtd_pedidos')
-    df_rank = df_rank.sort_values(by='qtd_pedidos', ascending=False).head(top_n)
-    df_rank_for_export = df_rank
+    df_rank = df_rank_all.head(top_n)
 
     fig_rank = px.bar(df_rank, x='franqueado', y='qtd_pedidos',
                        title=f"Top {top_n} Franqueados por Pedidos",
@@ -429,18 +501,13 @@ with tab1:
                        hover_data={'qtd_pedidos': ':,0f'})
 
     st.plotly_chart(fig_rank, use_container_width=True)
-    # --- MELHORIA AQUI: Botão de exportação individual removido ---
-    # st.download_button("📥 Exportar Top Franqueados (Tabela Atual)", export_excel(df_rank, sheet_name="Top Franqueados"), file_name="rank_franqueados.xlsx")
 
     # --- Análise de Tendência ---
-    df_trend = calculate_monthly_trend(df_active_franchisees)
-
     col_decline, col_growth = st.columns(2)
     with col_decline:
         st.markdown(f"""<h4>📉 Top {top_n} Franqueados com Tendência de Queda</h4>""", unsafe_allow_html=True)
 
-        df_decline = df_trend[df_trend['variacao'] < 0].sort_values(by='variacao', ascending=True).head(top_n)
-        df_decline_for_export = df_decline
+        df_decline = df_decline_all.head(top_n)
         if not df_decline.empty:
             fig_decline = px.bar(df_decline, x='franqueado', y='variacao',
                                  title=f"Top {top_n} Franqueados com Maior Queda",
@@ -448,17 +515,13 @@ with tab1:
                                  hover_data={'variacao': ':,0f'})
             fig_decline.update_layout(yaxis_title="Variação (nº de pedidos)", xaxis_title="", xaxis_tickangle=-45)
             st.plotly_chart(fig_decline, use_container_width=True)
-            # --- MELHORIA AQUI: Botão de exportação individual removido ---
-            # st.download_button("📥 Exportar Queda (Tabela Atual)", export_excel(df_decline, sheet_name="Queda Franqueados"), file_name="queda_pedidos.xlsx")
         else:
             st.info("ℹ️ Nenhum franqueado apresentou **queda significativa** de pedidos no período selecionado.")
 
     with col_growth:
         st.markdown(f"""<h4>🔼 Top {top_n} Franqueados com Tendência de Crescimento</h4>""", unsafe_allow_html=True)
 
-        df_growth = df_trend[df_trend['variacao'] > 0].sort_values(by='variacao', ascending=False).head(top_n)
-        df_growth_for_export = df_growth
-
+        df_growth = df_growth_all.head(top_n)
         if not df_growth.empty:
             fig_growth = px.bar(df_growth, x='franqueado', y='variacao',
                                  title=f"Top {top_n} Franqueados com Maior Crescimento",
@@ -466,32 +529,28 @@ with tab1:
                                  hover_data={'variacao': ':,0f'})
             fig_growth.update_layout(yaxis_title="Variação (nº de pedidos)", xaxis_title="", xaxis_tickangle=-45)
             st.plotly_chart(fig_growth, use_container_width=True)
-            # --- MELHORIA AQUI: Botão de exportação individual removido ---
-            # st.download_button("📥 Exportar Crescimento (Tabela Atual)", export_excel(df_growth, sheet_name="Crescimento Franqueados"), file_name="crescimento_pedidos.xlsx")
         else:
             st.info("ℹ️ Nenhum franqueado apresentou **crescimento significativo** de pedidos no período selecionado.")
 
-with tab2:
+def render_general_tab(filter_key, top_n):
+    import plotly.express as px
+
+    df_monthly, df_suppliers_all, df_status_distribution = general_tab_data(filter_key)
+
     st.markdown("""<h4>📅 Total de Pedidos por Mês</h4>""", unsafe_allow_html=True)
 
-    df_monthly = df_filtered.groupby('ano_mes').agg(total_pedidos=('numero_pedido', 'count')).reset_index()
-    df_monthly_for_export = df_monthly
     fig_trend = px.line(df_monthly, x='ano_mes', y='total_pedidos', markers=True,
                          title="Evolução Mensal de Pedidos",
                          color_discrete_sequence=px.colors.qualitative.Plotly,
                          hover_data={'total_pedidos': ':,0f'})
     fig_trend.update_layout(xaxis_title="Mês", yaxis_title="Quantidade de Pedidos")
     st.plotly_chart(fig_trend, use_container_width=True)
-    # --- MELHORIA AQUI: Botão de exportação individual removido ---
-    # st.download_button("📥 Exportar Pedidos Mensais (Tabela Atual)", export_excel(df_monthly), file_name="pedidos_mensais.xlsx")
 
     st.markdown("---")
 
     st.markdown(f"""<h4>🏆 Top {top_n} Fornecedores por Valor de Pedido</h4>""", unsafe_allow_html=True)
 
-    df_suppliers = df_filtered.groupby('fornecedor').agg(valor_total=('valor_pedido', 'sum')).reset_index()
-    df_suppliers_top = df_suppliers.sort_values(by='valor_total', ascending=False).head(top_n)
-    df_suppliers_top_for_export = df_suppliers_top
+    df_suppliers_top = df_suppliers_all.head(top_n)
 
     fig_suppliers = px.bar(
         df_suppliers_top,
@@ -505,25 +564,15 @@ with tab2:
     fig_suppliers.update_traces(textposition='outside')
     fig_suppliers.update_layout(xaxis_title="Fornecedor", yaxis_title="Valor Total (R$)")
     st.plotly_chart(fig_suppliers, use_container_width=True)
-    # --- MELHORIA AQUI: Botão de exportação individual removido ---
-    # st.download_button("📥 Exportar Top Fornecedores (Tabela Atual)", export_excel(df_suppliers_top), file_name="rank_fornecedores.xlsx")
 
     st.markdown("---")
 
     # --- NOVA ANÁLISE: Distribuição de Pedidos por Status ---
     st.markdown(f"""<h4>📊 Distribuição de Pedidos por Status</h4>""", unsafe_allow_html=True)
 
-    status_desejados = ["FINALIZADO", "CANCELADO", "PEDIDO ENTREGUE", "EM PROCESSAMENTO"]
-
-    df_status_for_chart = df_filtered[df_filtered["status"].isin(status_desejados)].copy()
-
-    if df_status_for_chart.empty:
+    if df_status_distribution.empty:
         st.info("ℹ️ Nenhum pedido encontrado para os **status desejados** neste período. Por favor, ajuste os filtros gerais.")
     else:
-        df_status_distribution = df_status_for_chart.groupby('status').agg(count_pedidos=('numero_pedido', 'count')).reset_index()
-        df_status_distribution['percentage'] = (df_status_distribution['count_pedidos'] / df_status_distribution['count_pedidos'].sum()) * 100
-        df_status_distribution_for_export = df_status_distribution
-
         fig_status = px.pie(df_status_distribution, values='count_pedidos', names='status',
                              title="Distribuição de Pedidos por Status",
                              hole=.3,
@@ -532,8 +581,53 @@ with tab2:
         fig_status.update_traces(textinfo='percent+label', pull=[0.05]*len(df_status_distribution))
         fig_status.update_layout(showlegend=True)
         st.plotly_chart(fig_status, use_container_width=True)
-        # --- MELHORIA AQUI: Botão de exportação individual removido ---
-        # st.download_button("📥 Exportar Distribuição de Status (Tabela Atual)", export_excel(df_status_distribution), file_name="distribuicao_status.xlsx")
+
+def render_export(filter_key, top_n):
+    periods, _, _ = filter_key
+    start, end = periods[0]
+    with st.popover("📥 Exportar", use_container_width=True):
+        st.download_button(
+            label="Dados dos gráficos (Excel)",
+            data=lambda: export_summary(filter_key, top_n),
+            file_name=nome_arquivo_export("dados_dashboard_pedidos", "xlsx", start, end),
+            mime=FORMATOS_EXPORT["xlsx"][0],
+            help="Exporta os dados dos principais gráficos em um único arquivo Excel.",
+            key="download_summary",
+        )
+        format_label = st.selectbox("Formato dos pedidos", list(EXPORT_FORMAT_LABELS), key="export_format")
+        export_format = EXPORT_FORMAT_LABELS[format_label]
+        st.download_button(
+            label=f"Pedidos filtrados ({format_label})",
+            data=lambda: export_filtered_orders(filter_key, export_format),
+            file_name=nome_arquivo_export("pedidos_filtrados", export_format, start, end),
+            mime=FORMATOS_EXPORT[export_format][0],
+            help="Exporta os pedidos individuais do período atual com os filtros aplicados.",
+            key="download_orders",
+        )
+
+@st.fragment
+def render_analysis(filter_key):
+    """Seletor de aba, top N e gráficos: interações aqui reexecutam só este trecho."""
+    col_view, col_top_n, col_export = st.columns([3, 1, 1])
+    with col_view:
+        selected_view = st.radio("Visão", ANALYSIS_VIEWS, horizontal=True, key='view_selected', label_visibility="collapsed")
+    with col_top_n:
+        top_n = st.number_input(
+            "Número de Itens nos Rankings",
+            min_value=3, max_value=30, value=st.session_state['top_n_selected'], step=1,
+            help="Selecione a quantidade de itens (franqueados/fornecedores) a serem exibidos nos gráficos de ranking.",
+            key='top_n_input'
+        )
+        st.session_state['top_n_selected'] = top_n
+    with col_export:
+        render_export(filter_key, top_n)
+
+    if selected_view == ANALYSIS_VIEWS[0]:
+        render_franchisee_tab(filter_key, top_n)
+    else:
+        render_general_tab(filter_key, top_n)
+
+render_analysis(filter_key)
 
 # --- Rodapé ---
 st.markdown("---")
@@ -544,4 +638,10 @@ st.markdown(
     </div>
     """,
     unsafe_allow_html=True
+)
+cache_stats = get_cache_agregados().estatisticas()
+st.caption(
+    f"Cache de agregados: {cache_stats['taxa_hit']:.0%} de acerto "
+    f"({cache_stats['hits']} hits, {cache_stats['misses']} misses), "
+    f"{cache_stats['itens']} visões em {cache_stats['bytes'] / 1024 / 1024:.1f} MB."
 )
\ No newline at end of file
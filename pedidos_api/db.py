@@ -1,68 +1,901 @@
 import os
+import io
+import re
+import csv
+import json
+import time
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import date
 import psycopg2
-from psycopg2 import pool, extras
-from dotenv import load_dotenv
+from psycopg2 import extras
+from config import carregar_env
+from metricas import contador, histograma, medidor
 
-load_dotenv()
+carregar_env()
 logger = logging.getLogger(__name__)
 
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT_S', 10))
+# Conexões ociosas há mais tempo que isso são testadas com SELECT 1 na retirada.
+POOL_VALIDAR_APOS = float(os.getenv('DB_POOL_VALIDAR_APOS_S', 30))
+
+class ErroPool(Exception):
+    """Nenhuma conexão ficou disponível dentro do tempo de espera."""
+
+ESPERA_POOL = histograma('pedidos_pool_espera_segundos', 'Tempo de espera para retirar uma conexão do pool.')
+TIMEOUTS_POOL = contador('pedidos_pool_timeouts_total', 'Retiradas que desistiram por falta de conexão livre.')
+DESCARTES_POOL = contador('pedidos_pool_descartadas_total', 'Conexões quebradas descartadas pelo pool.')
+
+class PoolConexoes:
+    """Pool de conexões seguro para uso concorrente (threads da FastAPI e sessões do Streamlit).
+
+    A retirada espera no máximo `timeout` segundos por uma conexão livre. Conexões
+    fechadas ou em estado desconhecido são descartadas na devolução, e as que
+    ficaram ociosas por mais de `validar_apos` segundos são testadas antes de
+    serem entregues.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=POOL_TIMEOUT, validar_apos=POOL_VALIDAR_APOS, **parametros):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validar_apos = validar_apos
+        self.parametros = parametros
+        self._ociosas = deque()
+        self._em_uso = set()
+        self._abrindo = 0
+        self._condicao = threading.Condition()
+        self._metricas = {
+            'retiradas': 0, 'esperas': 0, 'tempo_espera_total_s': 0.0, 'tempo_espera_max_s': 0.0,
+            'timeouts': 0, 'criadas': 0, 'descartadas': 0,
+        }
+        for _ in range(minconn):
+            self._ociosas.append((self._conectar(), time.monotonic()))
+            self._metricas['criadas'] += 1
+
+    def _conectar(self):
+        return psycopg2.connect(**self.parametros)
+
+    def _total(self):
+        return len(self._ociosas) + len(self._em_uso) + self._abrindo
+
+    def _valida(self, conn, ociosa_desde):
+        if conn.closed:
+            return False
+        if time.monotonic() - ociosa_desde < self.validar_apos:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _fechar(self, conn):
+        self._metricas['descartadas'] += 1
+        DESCARTES_POOL.inc()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        esperou = False
+        while True:
+            conn = None
+            with self._condicao:
+                while True:
+                    if self._ociosas:
+                        conn, ociosa_desde = self._ociosas.pop()
+                        self._em_uso.add(conn)
+                        break
+                    if self._total() < self.maxconn:
+                        self._abrindo += 1
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._metricas['timeouts'] += 1
+                        TIMEOUTS_POOL.inc()
+                        raise ErroPool(f'Nenhuma conexão livre após {timeout:.1f}s ({self.maxconn} em uso).')
+                    esperou = True
+                    self._condicao.wait(restante)
+
+            # Validação e abertura de conexão ficam fora do lock para não travar as devoluções.
+            if conn is None:
+                return self._abrir_retirada(inicio, esperou)
+            if self._valida(conn, ociosa_desde):
+                with self._condicao:
+                    self._registrar_retirada(inicio, esperou)
+                return conn
+            logger.warning('Conexão inválida descartada do pool.')
+            with self._condicao:
+                self._em_uso.discard(conn)
+                self._fechar(conn)
+                self._condicao.notify()
+
+    def _abrir_retirada(self, inicio, esperou):
+        try:
+            conn = self._conectar()
+        except Exception:
+            with self._condicao:
+                self._abrindo -= 1
+                self._condicao.notify()
+            raise
+        with self._condicao:
+            self._abrindo -= 1
+            self._metricas['criadas'] += 1
+            self._em_uso.add(conn)
+            self._registrar_retirada(inicio, esperou)
+        return conn
+
+    def _registrar_retirada(self, inicio, esperou):
+        espera = time.monotonic() - inicio
+        ESPERA_POOL.observar(espera)
+        self._metricas['retiradas'] += 1
+        self._metricas['tempo_espera_total_s'] += espera
+        self._metricas['tempo_espera_max_s'] = max(self._metricas['tempo_espera_max_s'], espera)
+        if esperou:
+            self._metricas['esperas'] += 1
+
+    def putconn(self, conn, descartar=False):
+        # Como no pool do psycopg2: transação pendente é desfeita, estado desconhecido descarta.
+        if not descartar and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                descartar = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    descartar = True
+        with self._condicao:
+            if conn not in self._em_uso:
+                return
+            self._em_uso.discard(conn)
+            if descartar or conn.closed:
+                self._fechar(conn)
+            else:
+                self._ociosas.append((conn, time.monotonic()))
+            self._condicao.notify()
+
+    def closeall(self):
+        with self._condicao:
+            while self._ociosas:
+                self._fechar(self._ociosas.pop()[0])
+            for conn in list(self._em_uso):
+                self._fechar(conn)
+            self._em_uso.clear()
+            self._condicao.notify_all()
+
+    def estatisticas(self):
+        with self._condicao:
+            retiradas = self._metricas['retiradas']
+            return {
+                'em_uso': len(self._em_uso),
+                'ociosas': len(self._ociosas),
+                'maximo': self.maxconn,
+                **self._metricas,
+                'tempo_espera_medio_s': self._metricas['tempo_espera_total_s'] / retiradas if retiradas else 0.0,
+            }
+
 connection_pool = None
+_lock_pool = threading.Lock()
+
+def parametros_conexao(dbname=None):
+    """Parâmetros do psycopg2.connect a partir das variáveis DB_*; `dbname` troca o banco."""
+    return {
+        'dbname': dbname or os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'host': os.getenv('DB_HOST'),
+        'port': os.getenv('DB_PORT'),
+    }
 
 def inicializar_pool():
     global connection_pool
-    if not connection_pool:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn=int(os.getenv('DB_POOL_MIN', 1)),
-            maxconn=int(os.getenv('DB_POOL_MAX', 5)),
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-        )
-        logger.info('Pool de conexões criado com sucesso.')
-
-def get_conn():
+    with _lock_pool:
+        if not connection_pool:
+            connection_pool = PoolConexoes(
+                minconn=int(os.getenv('DB_POOL_MIN', 1)),
+                maxconn=int(os.getenv('DB_POOL_MAX', 5)),
+                **parametros_conexao(),
+            )
+            logger.info('Pool de conexões criado com sucesso.')
+
+def get_conn(timeout=None):
     if connection_pool is None:
         inicializar_pool()
-    return connection_pool.getconn()
+    return connection_pool.getconn(timeout)
 
-def put_conn(conn):
+def put_conn(conn, descartar=False):
     if connection_pool:
-        connection_pool.putconn(conn)
+        connection_pool.putconn(conn, descartar)
+
+@contextmanager
+def banco_descartavel(prefixo='pedidos_temp'):
+    """Cria um banco vazio no servidor configurado e o remove ao final; devolve o nome.
 
-def inserir_pedidos_batch(conn, pedidos):
+    Usado pelos testes e benchmarks; o usuário precisa de permissão de CREATE
+    DATABASE. O schema vem das migrações.
+    """
+    nome = f"{prefixo}_{os.getpid()}_{time.time_ns()}"
+    admin = psycopg2.connect(**parametros_conexao(os.getenv('DB_NAME') or 'postgres'))
+    admin.autocommit = True
     try:
+        with admin.cursor() as cur:
+            cur.execute(f'CREATE DATABASE {nome};')
+        yield nome
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS {nome};')
+        admin.close()
+
+def estatisticas_pool():
+    if connection_pool is None:
+        return None
+    return connection_pool.estatisticas()
+
+def _coletar_conexoes_pool():
+    estatisticas = estatisticas_pool()
+    if estatisticas is None:
+        return []
+    return [({'estado': 'em_uso'}, estatisticas['em_uso']), ({'estado': 'ociosa'}, estatisticas['ociosas'])]
+
+medidor('pedidos_pool_conexoes', 'Conexões do pool por estado.', ('estado',), coletar=_coletar_conexoes_pool)
+
+TAMANHO_LOTE = int(os.getenv('DB_TAMANHO_LOTE', 1000))
+
+# Insere pedidos novos e atualiza o status apenas quando ele realmente mudou.
+# Linhas sem mudança não são reescritas nem aparecem no RETURNING. A chave
+# inclui data_pedido porque a tabela é particionada por ela (migracoes.py);
+# pedidos cuja data mudou já tiveram a linha antiga removida por
+# _mover_pedidos, então cada numero_pedido continua com uma linha só.
+# Inseridos e alterados são separados pela leitura de pedidos na consulta
+# principal, que enxerga a tabela como antes do INSERT (o truque do xmax = 0 não
+# funciona em tabela particionada); a mesma leitura dá o status anterior, que
+# para um pedido movido vem de pedidos_movidos. Cada linha gravada vai para
+# pedidos_mudancas, de onde segue para o log de status.
+SQL_UPSERT_PEDIDOS = """
+    WITH gravados AS (
+        INSERT INTO pedidos (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido)
+        VALUES %s
+        ON CONFLICT (numero_pedido, data_pedido) DO UPDATE
+        SET status = EXCLUDED.status, atualizado_em = now()
+        WHERE pedidos.status IS DISTINCT FROM EXCLUDED.status
+        RETURNING numero_pedido, data_pedido, status
+    ), mudancas AS (
+        INSERT INTO pedidos_mudancas (numero_pedido, data_pedido, status_anterior, status_novo, inserido)
+        SELECT gravados.numero_pedido::text, gravados.data_pedido,
+               CASE WHEN anterior.numero_pedido IS NULL THEN movido.status ELSE anterior.status END,
+               gravados.status,
+               anterior.numero_pedido IS NULL AND movido.numero_pedido IS NULL
+        FROM gravados
+        LEFT JOIN pedidos anterior USING (numero_pedido, data_pedido)
+        LEFT JOIN pedidos_movidos movido ON movido.numero_pedido = gravados.numero_pedido::text
+        RETURNING inserido
+    )
+    SELECT count(*) FILTER (WHERE inserido), count(*) FILTER (WHERE NOT inserido)
+    FROM mudancas;
+"""
+
+# Mudanças e pedidos movidos da transação corrente, acumulados entre as páginas
+# do upsert; as tabelas temporárias são criadas uma vez por conexão e
+# esvaziadas a cada commit.
+SQL_PREPARAR_MUDANCAS = """
+    CREATE TEMP TABLE IF NOT EXISTS pedidos_mudancas (
+        numero_pedido TEXT NOT NULL,
+        data_pedido TIMESTAMP,
+        status_anterior TEXT,
+        status_novo TEXT,
+        inserido BOOLEAN NOT NULL
+    ) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS pedidos_movidos (
+        numero_pedido TEXT NOT NULL,
+        data_pedido TIMESTAMP NOT NULL,
+        status TEXT
+    ) ON COMMIT DELETE ROWS;
+"""
+
+# Grava a data atual de cada pedido em pedidos_chaves e devolve a data anterior
+# dos que mudaram de data (correção de dataCriacao na origem). A leitura de
+# pedidos_chaves na consulta principal enxerga a tabela como antes do INSERT.
+SQL_ATUALIZAR_CHAVES = """
+    WITH chaves AS (
+        INSERT INTO pedidos_chaves (numero_pedido, data_pedido)
+        SELECT numero_pedido::text, data_pedido FROM {origem}
+        ON CONFLICT (numero_pedido) DO UPDATE
+        SET data_pedido = EXCLUDED.data_pedido
+        WHERE pedidos_chaves.data_pedido <> EXCLUDED.data_pedido
+        RETURNING numero_pedido
+    )
+    SELECT anterior.numero_pedido, anterior.data_pedido
+    FROM chaves
+    JOIN pedidos_chaves anterior USING (numero_pedido);
+"""
+SQL_ATUALIZAR_CHAVES_LOTE = SQL_ATUALIZAR_CHAVES.format(
+    origem="(VALUES %s) AS novos (numero_pedido, data_pedido)"
+)
+SQL_ATUALIZAR_CHAVES_STAGING = SQL_ATUALIZAR_CHAVES.format(origem="""(
+            SELECT DISTINCT ON (numero_pedido) numero_pedido, data_pedido
+            FROM pedidos_staging
+            ORDER BY numero_pedido, ordem DESC
+        ) AS novos""")
+
+# A linha antiga sai pela chave completa, então só a partição do mês antigo é lida.
+SQL_MOVER_PEDIDO = """
+    WITH movido AS (
+        DELETE FROM pedidos
+        WHERE numero_pedido = %(numero)s AND data_pedido = %(data)s
+        RETURNING numero_pedido::text, data_pedido, status
+    )
+    INSERT INTO pedidos_movidos (numero_pedido, data_pedido, status)
+    SELECT numero_pedido, data_pedido, status FROM movido;
+"""
+
+# O seq é tirado sob uma trava mantida até o commit, então a ordem do seq é a
+# ordem de commit: quem já leu até N nunca verá aparecer depois um seq menor.
+# Por isso o log é gravado no fim da transação, e não no próprio upsert.
+SQL_REGISTRAR_MUDANCAS = """
+    SELECT pg_advisory_xact_lock(hashtext('pedidos_status_log'));
+    INSERT INTO pedidos_status_log (numero_pedido, data_pedido, status_anterior, status_novo)
+    SELECT numero_pedido, data_pedido, status_anterior, status_novo
+    FROM pedidos_mudancas
+    ORDER BY data_pedido, numero_pedido;
+"""
+
+def deduplicar_pedidos(pedidos):
+    # O ON CONFLICT não aceita o mesmo numero_pedido duas vezes no mesmo comando;
+    # mantém a última ocorrência, que é a mais recente vinda da API.
+    unicos = {}
+    for pedido in pedidos:
+        unicos[str(pedido[0])] = pedido
+    return list(unicos.values())
+
+def meses_pedidos(pedidos):
+    return {f'{ano:04d}-{mes:02d}' for ano, mes in {(p[4].year, p[4].month) for p in pedidos if p[4]}}
+
+def _mover_pedidos(cur, movidos):
+    """Remove de pedidos a linha antiga dos pedidos que mudaram de data; devolve os meses dessas linhas.
+
+    Sem isso, a tabela particionada ganharia uma segunda linha para o pedido
+    (contado duas vezes nos rollups, no export e no dashboard) e a não
+    particionada recusaria o lote inteiro pela chave primária em numero_pedido.
+    As linhas removidas ficam em pedidos_movidos, e o upsert registra o pedido
+    como alterado, com o status anterior.
+    """
+    for numero, data in movidos:
+        cur.execute(SQL_MOVER_PEDIDO, {'numero': numero, 'data': data})
+    if movidos:
+        logger.info(f'{len(movidos)} pedidos mudaram de data e foram movidos.')
+    return {data.strftime('%Y-%m') for _, data in movidos}
+
+def upsert_pedidos(conn, pedidos, tamanho_lote=TAMANHO_LOTE):
+    # meses_movidos no resultado: meses de onde saíram pedidos que mudaram de
+    # data, para quem guarda cópias por mês (snapshot local) refazê-los também.
+    pedidos = deduplicar_pedidos(pedidos)
+    meses = meses_pedidos(pedidos)
+    try:
+        garantir_particoes(meses)
         with conn.cursor() as cur:
-            extras.execute_values(
+            cur.execute(SQL_PREPARAR_MUDANCAS)
+            movidos = extras.execute_values(
+                cur,
+                SQL_ATUALIZAR_CHAVES_LOTE,
+                [(p[0], p[4]) for p in pedidos],
+                page_size=tamanho_lote,
+                fetch=True
+            )
+            meses_movidos = _mover_pedidos(cur, movidos)
+            resultados = extras.execute_values(
                 cur,
+                SQL_UPSERT_PEDIDOS,
+                pedidos,
+                page_size=tamanho_lote,
+                fetch=True
+            )
+            inseridos = sum(r[0] for r in resultados)
+            alterados = sum(r[1] for r in resultados)
+            if inseridos or alterados:
+                marcar_rollups_pendentes(cur, meses | meses_movidos)
+                cur.execute(SQL_REGISTRAR_MUDANCAS)
+        conn.commit()
+    except Exception as e:
+        logger.error(f'Erro ao gravar pedidos: {e}')
+        conn.rollback()
+        # Pode ser uma partição que falta porque outro processo migrou a tabela.
+        esquecer_particoes()
+        return None
+
+    return {
+        'inseridos': inseridos,
+        'alterados': alterados,
+        'inalterados': len(pedidos) - inseridos - alterados,
+        'meses_movidos': sorted(meses_movidos),
+    }
+
+# Agregados mensais mantidos pela ingestão para o dashboard. Cada gravação só
+# marca em pedidos_mensal_pendentes os meses que tocou, na mesma transação; os
+# meses marcados são recalculados por inteiro uma vez por execução, em
+# atualizar_rollups_pendentes, e não a cada lote ou dia do backfill.
+SQL_RECALCULAR_ROLLUP = """
+    SELECT pg_advisory_xact_lock(hashtext('pedidos_mensal'));
+    DELETE FROM pedidos_mensal WHERE ano_mes = ANY(%(meses)s);
+    INSERT INTO pedidos_mensal (ano_mes, franqueado, fornecedor, status, total_pedidos, valor_total)
+    SELECT to_char(data_pedido, 'YYYY-MM'), COALESCE(franqueado, ''), COALESCE(fornecedor, ''),
+           COALESCE(status, ''), count(*), COALESCE(sum(valor_pedido), 0)
+    FROM pedidos
+    WHERE data_pedido >= to_date(%(primeiro)s, 'YYYY-MM')
+      AND data_pedido < to_date(%(ultimo)s, 'YYYY-MM') + interval '1 month'
+      AND to_char(data_pedido, 'YYYY-MM') = ANY(%(meses)s)
+    GROUP BY 1, 2, 3, 4;
+"""
+
+# A marca é sempre escrita (inclusive sobre uma existente) e fica travada até o
+# commit da gravação: o recálculo que a consome espera esse commit e, por isso,
+# enxerga os pedidos gravados; uma marca feita depois do recálculo sobrevive a
+# ele. Os meses vão em ordem, como no recálculo, para não formar impasses.
+SQL_MARCAR_ROLLUPS = """
+    INSERT INTO pedidos_mensal_pendentes (ano_mes)
+    SELECT unnest(%(meses)s::text[])
+    ON CONFLICT (ano_mes) DO UPDATE SET marcado_em = now();
+"""
+
+SQL_CONSUMIR_ROLLUPS = """
+    WITH pendentes AS (
+        SELECT ano_mes FROM pedidos_mensal_pendentes ORDER BY ano_mes FOR UPDATE
+    )
+    DELETE FROM pedidos_mensal_pendentes p
+    USING pendentes
+    WHERE p.ano_mes = pendentes.ano_mes
+    RETURNING p.ano_mes;
+"""
+
+def garantir_coluna_atualizado_em(conn):
+    # Marca d'água usada pelo dashboard para buscar só o que mudou desde o
+    # último carregamento.
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+            CREATE INDEX IF NOT EXISTS idx_pedidos_atualizado_em ON pedidos (atualizado_em);
+        """)
+    conn.commit()
+
+# Partições mensais de pedidos, nomeadas pedidos_AAAA_MM.
+PADRAO_PARTICAO = re.compile(r'^pedidos_(\d{4})_(\d{2})$')
+
+_particoes_conhecidas = set()
+# Tipo de pedidos ('p' particionada, 'r' comum) visto por garantir_particoes.
+_tipo_pedidos = None
+_lock_particoes = threading.Lock()
+# Espera máxima pela trava da tabela pai ao criar uma partição: quem chamou pode
+# estar com uma transação aberta em pedidos, e a espera não deve virar um impasse.
+ESPERA_TRAVA_PARTICAO = '10s'
+
+def tipo_tabela(cur, tabela='pedidos'):
+    """'p' se a tabela é particionada, 'r' se é uma tabela comum, None se não existe."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (tabela,))
+    linha = cur.fetchone()
+    return linha[0] if linha else None
+
+def nome_particao(ano_mes):
+    return 'pedidos_' + ano_mes.replace('-', '_')
+
+def limites_mes(ano_mes):
+    ano, mes = map(int, ano_mes.split('-'))
+    return date(ano, mes, 1), date(ano + mes // 12, mes % 12 + 1, 1)
+
+def particoes_existentes(cur, tabela='pedidos'):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (tabela,))
+    return {f'{m[1]}-{m[2]}' for m in (PADRAO_PARTICAO.match(linha[0]) for linha in cur.fetchall()) if m}
+
+def criar_particao(cur, ano_mes, tabela='pedidos'):
+    inicio, fim = limites_mes(ano_mes)
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {nome_particao(ano_mes)} PARTITION OF {tabela} FOR VALUES FROM (%s) TO (%s);",
+        (inicio, fim)
+    )
+
+def garantir_particoes(meses):
+    """Cria as partições mensais que faltam para `meses` ('AAAA-MM').
+
+    Roda antes da gravação, em uma conexão própria do pool: criar uma partição
+    trava a tabela pai, e a trava não deve durar o upsert inteiro nem confirmar
+    a transação de quem chamou. As partições já vistas e o tipo da tabela ficam
+    em memória, então o caso comum (mês já existente, ou pedidos ainda não
+    particionada) não vai ao banco.
+    """
+    global _tipo_pedidos
+    if _tipo_pedidos == 'r' or not set(meses) - _particoes_conhecidas:
+        return
+    with _lock_particoes:
+        faltantes = set(meses) - _particoes_conhecidas
+        if _tipo_pedidos == 'r' or not faltantes:
+            return
+        conn = get_conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL lock_timeout = %s;", (ESPERA_TRAVA_PARTICAO,))
+                _tipo_pedidos = tipo_tabela(cur)
+                if _tipo_pedidos != 'p':
+                    conn.rollback()
+                    return
+                existentes = particoes_existentes(cur)
+                for ano_mes in sorted(faltantes - existentes):
+                    criar_particao(cur, ano_mes)
+                    logger.info(f'Partição {nome_particao(ano_mes)} criada.')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            put_conn(conn)
+        _particoes_conhecidas.update(existentes | faltantes)
+
+def esquecer_particoes():
+    """Descarta o que garantir_particoes guardou em memória (após a migração, por exemplo)."""
+    global _tipo_pedidos
+    with _lock_particoes:
+        _particoes_conhecidas.clear()
+        _tipo_pedidos = None
+
+def garantir_tabela_rollup(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pedidos_mensal (
+                ano_mes TEXT NOT NULL,
+                franqueado TEXT NOT NULL,
+                fornecedor TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total_pedidos INTEGER NOT NULL,
+                valor_total NUMERIC NOT NULL,
+                PRIMARY KEY (ano_mes, franqueado, fornecedor, status)
+            );
+            CREATE TABLE IF NOT EXISTS pedidos_mensal_pendentes (
+                ano_mes TEXT PRIMARY KEY,
+                marcado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pedidos_mensal);")
+        vazia = not cur.fetchone()[0]
+        if vazia:
+            cur.execute("SELECT DISTINCT to_char(data_pedido, 'YYYY-MM') FROM pedidos;")
+            meses = {linha[0] for linha in cur.fetchall() if linha[0]}
+            if meses:
+                logger.info(f'Montando rollups mensais para {len(meses)} meses.')
+                atualizar_rollups(cur, meses)
+    conn.commit()
+
+def garantir_tabela_chaves(conn):
+    # Data atual de cada pedido, com numero_pedido como chave primária. Na
+    # tabela particionada a chave única precisa incluir data_pedido; esta tabela
+    # é o que garante uma linha por pedido e acha, com uma busca no índice, a
+    # linha antiga de um pedido cuja data mudou. Ao ser criada, é preenchida a
+    # partir de pedidos, e linhas duplicadas de um mesmo pedido (gravadas antes
+    # dela existir) são removidas, ficando a atualizada por último.
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pedidos_chaves (
+                numero_pedido TEXT PRIMARY KEY,
+                data_pedido TIMESTAMP NOT NULL
+            );
+        """)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pedidos_chaves);")
+        if not cur.fetchone()[0]:
+            cur.execute("""
+                INSERT INTO pedidos_chaves (numero_pedido, data_pedido)
+                SELECT DISTINCT ON (numero_pedido::text) numero_pedido::text, data_pedido
+                FROM pedidos
+                WHERE data_pedido IS NOT NULL
+                ORDER BY numero_pedido::text, atualizado_em DESC, data_pedido DESC;
+            """)
+            logger.info(f'pedidos_chaves preenchida com {cur.rowcount} pedidos.')
+            cur.execute("""
+                DELETE FROM pedidos
+                USING pedidos_chaves chave
+                WHERE pedidos.numero_pedido::text = chave.numero_pedido
+                  AND pedidos.data_pedido <> chave.data_pedido
+                RETURNING to_char(pedidos.data_pedido, 'YYYY-MM');
+            """)
+            meses = {linha[0] for linha in cur.fetchall()}
+            if meses:
+                logger.warning(f'Linhas duplicadas de pedidos removidas em {len(meses)} meses.')
+                cur.execute("SELECT to_regclass('pedidos_mensal') IS NOT NULL;")
+                if cur.fetchone()[0]:
+                    atualizar_rollups(cur, meses)
+    conn.commit()
+
+def garantir_tabela_log_status(conn):
+    # Log somente de inserção: cada pedido novo (status_anterior nulo) e cada
+    # mudança de status ganha um seq crescente, lido por cursor em
+    # listar_mudancas_status.
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pedidos_status_log (
+                seq BIGSERIAL PRIMARY KEY,
+                numero_pedido TEXT NOT NULL,
+                data_pedido TIMESTAMP,
+                status_anterior TEXT,
+                status_novo TEXT,
+                registrado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+    conn.commit()
+
+def listar_mudancas_status(conn, desde=0, limite=1000):
+    """Entradas do log de status com seq maior que `desde`, em ordem de seq.
+
+    O consumidor guarda o maior seq recebido e o passa na próxima chamada; a
+    leitura usa só a chave primária, então o custo depende do que mudou, não
+    do tamanho da tabela pedidos.
+    """
+    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        cur.execute("""
+            SELECT seq, numero_pedido, data_pedido, status_anterior, status_novo, registrado_em
+            FROM pedidos_status_log
+            WHERE seq > %(desde)s
+            ORDER BY seq
+            LIMIT %(limite)s;
+        """, {'desde': desde, 'limite': limite})
+        mudancas = cur.fetchall()
+    conn.rollback()
+    return mudancas
+
+def atualizar_rollups(cur, meses):
+    meses = sorted(meses)
+    if not meses:
+        return
+    cur.execute(SQL_RECALCULAR_ROLLUP, {'meses': meses, 'primeiro': meses[0], 'ultimo': meses[-1]})
+
+def marcar_rollups_pendentes(cur, meses):
+    if meses:
+        cur.execute(SQL_MARCAR_ROLLUPS, {'meses': sorted(meses)})
+
+def atualizar_rollups_pendentes(conn):
+    """Recalcula, em uma transação, os meses marcados pelas gravações; devolve os meses.
+
+    Chamado ao fim de cada execução da ingestão. Meses marcados por uma execução
+    que falhou antes disso ficam para a próxima.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SQL_CONSUMIR_ROLLUPS)
+            meses = {linha[0] for linha in cur.fetchall()}
+            atualizar_rollups(cur, meses)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sorted(meses)
+
+class _LeitorCopy:
+    # Arquivo somente-leitura que gera as linhas CSV sob demanda para o COPY,
+    # sem montar o conteúdo inteiro em memória.
+    def __init__(self, pedidos):
+        self._linhas = self._gerar_linhas(pedidos)
+        self._buffer = ''
+        self.linhas = 0
+
+    def _gerar_linhas(self, pedidos):
+        saida = io.StringIO()
+        escritor = csv.writer(saida, lineterminator='\n')
+        for pedido in pedidos:
+            escritor.writerow(pedido)
+            self.linhas += 1
+            yield saida.getvalue()
+            saida.seek(0)
+            saida.truncate()
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0:
+            tamanho = 1 << 30
+        partes = [self._buffer]
+        total = len(self._buffer)
+        for linha in self._linhas:
+            partes.append(linha)
+            total += len(linha)
+            if total >= tamanho:
+                break
+        dados = ''.join(partes)
+        self._buffer = dados[tamanho:]
+        return dados[:tamanho]
+
+SQL_MERGE_STAGING = """
+    WITH gravados AS (
+        INSERT INTO pedidos (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido)
+        SELECT DISTINCT ON (numero_pedido)
+               numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido
+        FROM pedidos_staging
+        ORDER BY numero_pedido, ordem DESC
+        ON CONFLICT (numero_pedido, data_pedido) DO UPDATE
+        SET status = EXCLUDED.status, atualizado_em = now()
+        WHERE pedidos.status IS DISTINCT FROM EXCLUDED.status
+        RETURNING numero_pedido, data_pedido, status
+    ), mudancas AS (
+        INSERT INTO pedidos_mudancas (numero_pedido, data_pedido, status_anterior, status_novo, inserido)
+        SELECT gravados.numero_pedido::text, gravados.data_pedido,
+               CASE WHEN anterior.numero_pedido IS NULL THEN movido.status ELSE anterior.status END,
+               gravados.status,
+               anterior.numero_pedido IS NULL AND movido.numero_pedido IS NULL
+        FROM gravados
+        LEFT JOIN pedidos anterior USING (numero_pedido, data_pedido)
+        LEFT JOIN pedidos_movidos movido ON movido.numero_pedido = gravados.numero_pedido::text
+        RETURNING inserido
+    )
+    SELECT count(*) FILTER (WHERE inserido), count(*) FILTER (WHERE NOT inserido),
+           (SELECT count(DISTINCT numero_pedido) FROM pedidos_staging)
+    FROM mudancas;
+"""
+
+def copiar_pedidos(conn, pedidos):
+    tempos = {}
+    try:
+        garantir_particoes(meses_pedidos(pedidos))
+        with conn.cursor() as cur:
+            inicio = time.perf_counter()
+            cur.execute("""
+                CREATE TEMP TABLE pedidos_staging ON COMMIT DROP AS
+                SELECT numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido
+                FROM pedidos
+                WITH NO DATA;
+                ALTER TABLE pedidos_staging ADD COLUMN ordem bigserial;
+            """)
+            leitor = _LeitorCopy(pedidos)
+            cur.copy_expert(
                 """
-                INSERT INTO pedidos (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido)
-                VALUES %s
-                ON CONFLICT (numero_pedido) DO NOTHING;
+                COPY pedidos_staging (numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido)
+                FROM STDIN WITH (FORMAT csv)
                 """,
-                pedidos
+                leitor
             )
-            conn.commit()
-            return cur.rowcount
+            tempos['copia'] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            cur.execute(SQL_PREPARAR_MUDANCAS)
+            cur.execute(SQL_ATUALIZAR_CHAVES_STAGING)
+            meses_movidos = _mover_pedidos(cur, cur.fetchall())
+            cur.execute(SQL_MERGE_STAGING)
+            inseridos, alterados, unicos = cur.fetchone()
+            tempos['merge'] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            if inseridos or alterados:
+                cur.execute("SELECT DISTINCT to_char(data_pedido, 'YYYY-MM') FROM pedidos_staging;")
+                marcar_rollups_pendentes(cur, {linha[0] for linha in cur.fetchall()} | meses_movidos)
+            tempos['rollup'] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            if inseridos or alterados:
+                cur.execute(SQL_REGISTRAR_MUDANCAS)
+            tempos['log'] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        conn.commit()
+        tempos['commit'] = time.perf_counter() - inicio
     except Exception as e:
-        logger.error(f'Erro ao inserir pedidos: {e}')
+        logger.error(f'Erro ao copiar pedidos: {e}')
         conn.rollback()
-        return 0
+        esquecer_particoes()
+        return None
+
+    logger.info(
+        f"COPY de {leitor.linhas} linhas: copia {tempos['copia']:.2f}s, "
+        f"merge {tempos['merge']:.2f}s, rollup {tempos['rollup']:.2f}s, log {tempos['log']:.2f}s, "
+        f"commit {tempos['commit']:.2f}s"
+    )
+    return {
+        'inseridos': inseridos,
+        'alterados': alterados,
+        'inalterados': unicos - inseridos - alterados,
+        'meses_movidos': sorted(meses_movidos),
+        'tempos': tempos,
+    }
+
+def garantir_tabela_checkpoint(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+                dia DATE PRIMARY KEY,
+                pedidos INTEGER NOT NULL,
+                concluido_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+    conn.commit()
+
+def dias_concluidos(conn, data_inicio, data_fim):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT dia FROM backfill_checkpoint
+            WHERE dia BETWEEN %s AND %s;
+        """, (data_inicio, data_fim))
+        return {linha[0] for linha in cur.fetchall()}
 
-def atualizar_status_pedidos(conn, pedidos):
+def registrar_dia_concluido(conn, dia, pedidos):
     try:
         with conn.cursor() as cur:
-            for pedido in pedidos:
-                cur.execute("""
-                    UPDATE pedidos
-                    SET status = %s
-                    WHERE numero_pedido = %s;
-                """, (pedido[1], str(pedido[0])))
+            cur.execute("""
+                INSERT INTO backfill_checkpoint (dia, pedidos)
+                VALUES (%s, %s)
+                ON CONFLICT (dia) DO UPDATE
+                SET pedidos = EXCLUDED.pedidos, concluido_em = now();
+            """, (dia, pedidos))
         conn.commit()
-        return len(pedidos)
     except Exception as e:
-        logger.error(f"Erro ao atualizar status dos pedidos: {e}")
+        logger.error(f'Erro ao registrar checkpoint do dia {dia}: {e}')
         conn.rollback()
-        return 0
+
+def listar_pedidos_recentes(conn, dias):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido
+            FROM pedidos
+            WHERE data_pedido >= now() - make_interval(days => %s)
+            ORDER BY data_pedido;
+        """, (dias,))
+        pedidos = cur.fetchall()
+    conn.rollback()
+    return pedidos
+
+def ler_watermark(conn):
+    """Última modificação gravada em pedidos (max de atualizado_em), ou None com a tabela vazia."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT max(atualizado_em) FROM pedidos;")
+        watermark = cur.fetchone()[0]
+    conn.rollback()
+    return watermark
+
+def garantir_tabela_execucoes(conn):
+    # Histórico de execuções da ingestão, para acompanhar tendências de tempo e volume.
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS execucoes_ingestao (
+                id BIGSERIAL PRIMARY KEY,
+                modo TEXT NOT NULL,
+                periodo TEXT,
+                iniciado_em TIMESTAMPTZ NOT NULL,
+                duracao_s DOUBLE PRECISION NOT NULL,
+                sucesso BOOLEAN NOT NULL,
+                inseridos INTEGER,
+                alterados INTEGER,
+                inalterados INTEGER,
+                rejeitados INTEGER,
+                tempos JSONB
+            );
+            CREATE INDEX IF NOT EXISTS execucoes_ingestao_iniciado_em_idx ON execucoes_ingestao (iniciado_em);
+        """)
+    conn.commit()
+
+def registrar_execucao(conn, execucao):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO execucoes_ingestao
+                (modo, periodo, iniciado_em, duracao_s, sucesso, inseridos, alterados, inalterados, rejeitados, tempos)
+            VALUES
+                (%(modo)s, %(periodo)s, %(iniciado_em)s, %(duracao_s)s, %(sucesso)s,
+                 %(inseridos)s, %(alterados)s, %(inalterados)s, %(rejeitados)s, %(tempos)s);
+        """, {**execucao, 'tempos': json.dumps(execucao['tempos']) if execucao.get('tempos') else None})
+    conn.commit()
+
+def listar_execucoes(conn, limite=50, modo=None):
+    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        cur.execute("""
+            SELECT id, modo, periodo, iniciado_em, duracao_s, sucesso,
+                   inseridos, alterados, inalterados, rejeitados, tempos
+            FROM execucoes_ingestao
+            WHERE %(modo)s IS NULL OR modo = %(modo)s
+            ORDER BY iniciado_em DESC
+            LIMIT %(limite)s;
+        """, {'modo': modo, 'limite': limite})
+        execucoes = cur.fetchall()
+    conn.rollback()
+    return execucoes
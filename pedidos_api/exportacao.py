@@ -0,0 +1,201 @@
+import os
+import io
+import csv
+import tempfile
+from filtros import FILTRO_SEM_B2B, PARAMS_SEM_B2B
+from config import carregar_env
+
+carregar_env()
+
+EXPORT_TAMANHO_LOTE = int(os.getenv('EXPORT_TAMANHO_LOTE', 5000))
+# Acima disso o xlsx temporário vai da memória para o disco.
+EXPORT_MAX_MEMORIA = int(os.getenv('EXPORT_MAX_MEMORIA_MB', 16)) * 1024 * 1024
+TAMANHO_BLOCO_EXPORT = 64 * 1024
+
+# Limite de linhas de uma planilha do Excel (incluindo o cabeçalho).
+LIMITE_LINHAS_XLSX = 1048576
+
+FORMATOS_EXPORT = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+COLUNAS_EXPORT = ['numero_pedido', 'status', 'franqueado', 'fornecedor', 'data_pedido', 'valor_pedido']
+FILTROS_EXPORT = ('franqueado', 'fornecedor', 'status')
+
+def montar_consulta_pedidos(data_inicio, data_fim, filtros=None):
+    """SQL e parâmetros dos pedidos filtrados como no dashboard: sem B2B, dias inteiros, filtros vazios não restringem."""
+    condicoes = [FILTRO_SEM_B2B, "data_pedido >= %(inicio)s", "data_pedido < %(fim)s::date + 1"]
+    params = {**PARAMS_SEM_B2B, 'inicio': data_inicio, 'fim': data_fim}
+    for coluna, selecionados in (filtros or {}).items():
+        if coluna not in FILTROS_EXPORT:
+            raise ValueError(f"Filtro de exportação desconhecido: {coluna}")
+        if selecionados:
+            condicoes.append(f"{coluna} = ANY(%({coluna})s)")
+            params[coluna] = list(selecionados)
+
+    query = f"""
+        SELECT numero_pedido::text, status, franqueado, fornecedor, data_pedido, valor_pedido
+        FROM pedidos
+        WHERE {' AND '.join(condicoes)}
+        ORDER BY data_pedido, numero_pedido;
+    """
+    return query, params
+
+def iterar_pedidos_filtrados(conn, data_inicio, data_fim, filtros=None, tamanho_lote=EXPORT_TAMANHO_LOTE):
+    """Gera lotes de tuplas com um cursor no servidor: no máximo um lote fica em memória."""
+    query, params = montar_consulta_pedidos(data_inicio, data_fim, filtros)
+    try:
+        with conn.cursor(name='exportacao_pedidos') as cur:
+            cur.itersize = tamanho_lote
+            cur.execute(query, params)
+            while True:
+                lote = cur.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                yield lote
+    finally:
+        # Encerra a transação aberta pelo cursor antes de a conexão voltar ao pool.
+        conn.rollback()
+
+def lotes_dataframe(df, tamanho_lote=EXPORT_TAMANHO_LOTE):
+    """Adapta um DataFrame ao formato de lotes de tuplas usado pelos geradores.
+
+    Valores ausentes (NaN, NaT, NA) viram None, como os NULL lidos do banco:
+    célula vazia no xlsx e campo vazio no csv.
+    """
+    for inicio in range(0, len(df), tamanho_lote):
+        lote = df.iloc[inicio:inicio + tamanho_lote].astype(object)
+        yield list(lote.where(lote.notna(), None).itertuples(index=False, name=None))
+
+def gerar_csv(colunas, lotes):
+    """CSV em blocos de bytes, um por lote (UTF-8 com BOM, para o Excel reconhecer os acentos)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(colunas)
+    for lote in lotes:
+        writer.writerows(lote)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+class _SaidaParquet:
+    """Destino do ParquetWriter que acumula os bytes escritos até serem entregues ao gerador."""
+
+    def __init__(self):
+        self.blocos = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        self.blocos.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drenar(self):
+        blocos, self.blocos = self.blocos, []
+        return b''.join(blocos)
+
+def _schema_pedidos(pa):
+    return pa.schema([
+        ('numero_pedido', pa.string()),
+        ('status', pa.string()),
+        ('franqueado', pa.string()),
+        ('fornecedor', pa.string()),
+        ('data_pedido', pa.timestamp('us')),
+        ('valor_pedido', pa.float64()),
+    ])
+
+def gerar_parquet(lotes):
+    """Parquet dos pedidos com um row group por lote, entregue à medida que cada lote é escrito."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema_pedidos(pa)
+    saida = _SaidaParquet()
+    writer = pq.ParquetWriter(saida, schema, compression='zstd')
+    try:
+        for lote in lotes:
+            colunas = list(zip(*lote))
+            colunas[5] = [float(valor) if valor is not None else None for valor in colunas[5]]
+            writer.write_batch(pa.record_batch(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, schema)],
+                schema=schema,
+            ))
+            yield saida.drenar()
+    finally:
+        writer.close()
+    yield saida.drenar()
+
+def _nome_planilha(nome, parte):
+    # O Excel limita nomes de planilha a 31 caracteres.
+    return nome[:31] if parte == 1 else f"{nome[:25]} ({parte})"
+
+def gerar_xlsx(planilhas):
+    """Workbook gravado em modo de memória constante e entregue em blocos.
+
+    `planilhas` é uma sequência de (nome, colunas, lotes). O xlsx é um zip e só
+    fica completo no fechamento, então é montado num arquivo temporário (que vai
+    para o disco quando cresce) e então lido em blocos; as linhas nunca ficam
+    todas em memória. Planilhas maiores que o limite do Excel continuam em
+    "Nome (2)", "Nome (3)"...
+    """
+    import xlsxwriter
+
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_MAX_MEMORIA) as arquivo:
+        workbook = xlsxwriter.Workbook(arquivo, {
+            'constant_memory': True,
+            # Infinito (variação sobre zero) vira célula de erro em vez de abortar o arquivo.
+            'nan_inf_to_errors': True,
+            'default_date_format': 'dd/mm/yyyy hh:mm',
+            'remove_timezone': True,
+        })
+        cabecalho = workbook.add_format({'bold': True})
+        for nome, colunas, lotes in planilhas:
+            parte, linha, worksheet = 0, LIMITE_LINHAS_XLSX, None
+            for lote in lotes:
+                for registro in lote:
+                    if linha >= LIMITE_LINHAS_XLSX:
+                        parte += 1
+                        worksheet = workbook.add_worksheet(_nome_planilha(nome, parte))
+                        worksheet.write_row(0, 0, colunas, cabecalho)
+                        linha = 1
+                    worksheet.write_row(linha, 0, registro)
+                    linha += 1
+            if worksheet is None:
+                workbook.add_worksheet(_nome_planilha(nome, 1)).write_row(0, 0, colunas, cabecalho)
+        workbook.close()
+
+        arquivo.seek(0)
+        while True:
+            bloco = arquivo.read(TAMANHO_BLOCO_EXPORT)
+            if not bloco:
+                break
+            yield bloco
+
+def gerar_export_pedidos(conn, formato, data_inicio, data_fim, filtros=None):
+    """Blocos de bytes do arquivo de pedidos filtrados no formato pedido (csv, xlsx ou parquet)."""
+    if formato not in FORMATOS_EXPORT:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    lotes = iterar_pedidos_filtrados(conn, data_inicio, data_fim, filtros)
+    if formato == 'csv':
+        return gerar_csv(COLUNAS_EXPORT, lotes)
+    if formato == 'parquet':
+        return gerar_parquet(lotes)
+    return gerar_xlsx([("Pedidos", COLUNAS_EXPORT, lotes)])
+
+def nome_arquivo_export(prefixo, formato, data_inicio, data_fim):
+    return f"{prefixo}_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}.{FORMATOS_EXPORT[formato][1]}"
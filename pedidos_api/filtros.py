@@ -0,0 +1,7 @@
+# Filtros SQL compartilhados pelo dashboard (consultas.py) e pelo export
+# (exportacao.py). Fica fora de consultas.py, que importa pandas, para que o
+# caminho do export na API não carregue pandas e numpy na subida.
+
+# Exclusão do B2B feita no banco (antes era um filtro de string no pandas).
+FILTRO_SEM_B2B = "COALESCE(lower(franqueado), '') NOT LIKE %(prefixo_b2b)s"
+PARAMS_SEM_B2B = {'prefixo_b2b': 'b2b%'}
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+# Sem FINGERPRINT_ARQUIVO, o nome do arquivo leva o banco: ingestões apontando
+# para bancos diferentes no mesmo diretório não compartilham fingerprints.
+FINGERPRINT_ARQUIVO = os.getenv('FINGERPRINT_ARQUIVO')
+FINGERPRINT_MAX = int(os.getenv('FINGERPRINT_MAX', 200000))
+FINGERPRINT_DIAS_AQUECIMENTO = int(os.getenv('FINGERPRINT_DIAS_AQUECIMENTO', 60))
+
+def fingerprint_pedido(pedido):
+    # Normaliza os tipos para que a tupla extraída da API e a linha lida do
+    # Postgres (Decimal, str, timestamp) gerem o mesmo hash.
+    numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido = pedido
+    if isinstance(data_pedido, datetime):
+        data_pedido = data_pedido.replace(tzinfo=None).isoformat()
+    normalizado = (
+        str(numero_pedido), status, franqueado, fornecedor,
+        str(data_pedido), mes_pedido, f'{float(valor_pedido):.2f}',
+    )
+    return hashlib.blake2b(repr(normalizado).encode('utf-8'), digest_size=8).hexdigest()
+
+def identificar_banco():
+    """Host, porta e nome do banco configurados, no formato host:porta/banco."""
+    return f"{os.getenv('DB_HOST') or 'localhost'}:{os.getenv('DB_PORT') or 5432}/{os.getenv('DB_NAME') or ''}"
+
+def arquivo_padrao(banco):
+    return '.fingerprints_pedidos_' + re.sub(r'[^A-Za-z0-9_.-]+', '_', banco) + '.json'
+
+class CacheFingerprints:
+    def __init__(self, caminho=FINGERPRINT_ARQUIVO, capacidade=FINGERPRINT_MAX, banco=None):
+        self.banco = banco or identificar_banco()
+        self.caminho = caminho or arquivo_padrao(self.banco)
+        self.capacidade = capacidade
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializa as gravações do arquivo, que rodam fora de _lock para não
+        # segurar a filtragem durante o I/O.
+        self._lock_arquivo = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _guardar(self, numero_pedido, valor):
+        self._hashes[numero_pedido] = valor
+        self._hashes.move_to_end(numero_pedido)
+        while len(self._hashes) > self.capacidade:
+            self._hashes.popitem(last=False)
+
+    def carregar(self, marca_banco):
+        """Carrega o arquivo se ele foi gravado para este banco e o banco não voltou no tempo.
+
+        `marca_banco` é a marca d'água atual (max de pedidos.atualizado_em). Um
+        arquivo gravado com marca posterior indica banco restaurado ou recriado:
+        os hashes podem descrever pedidos que não existem mais nele, e o arquivo
+        é ignorado para que o cache seja aquecido a partir do banco.
+        """
+        if not os.path.exists(self.caminho):
+            return 0
+        try:
+            with open(self.caminho, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+            banco, marca, hashes = dados['banco'], dados['marca'], dados['hashes']
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f'Arquivo de fingerprints ignorado ({self.caminho}): {e}')
+            return 0
+        if banco != self.banco:
+            logger.warning(f'Arquivo de fingerprints ignorado ({self.caminho}): gravado para {banco}, não {self.banco}.')
+            return 0
+        if marca is not None and (marca_banco is None or datetime.fromisoformat(marca) > marca_banco):
+            logger.warning(
+                f'Arquivo de fingerprints ignorado ({self.caminho}): marca d\'água do banco ({marca_banco}) '
+                f'anterior à do arquivo ({marca}).'
+            )
+            return 0
+        with self._lock:
+            for numero_pedido, valor in hashes.items():
+                self._guardar(numero_pedido, valor)
+        return len(hashes)
+
+    def salvar(self, marca_atual):
+        """Grava os hashes confirmados junto com a marca d'água do banco.
+
+        `marca_atual` é chamada depois da cópia dos hashes: como eles só são
+        confirmados após o commit, a marca lida cobre todos os pedidos gravados
+        no arquivo.
+        """
+        # Cada gravação usa um temporário próprio no mesmo diretório (o
+        # os.replace só é atômico dentro do mesmo sistema de arquivos): jobs
+        # concorrentes nunca escrevem no mesmo .tmp nem trocam um arquivo pela
+        # metade.
+        with self._lock:
+            hashes = dict(self._hashes)
+        marca = marca_atual()
+        dados = {
+            'banco': self.banco,
+            'marca': marca.isoformat() if marca is not None else None,
+            'hashes': hashes,
+        }
+        diretorio = os.path.dirname(os.path.abspath(self.caminho))
+        with self._lock_arquivo:
+            temporario = None
+            try:
+                descritor, temporario = tempfile.mkstemp(
+                    prefix=os.path.basename(self.caminho) + '.', suffix='.tmp', dir=diretorio
+                )
+                with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+                    json.dump(dados, arquivo)
+                os.replace(temporario, self.caminho)
+            except OSError as e:
+                logger.warning(f'Não foi possível salvar os fingerprints em {self.caminho}: {e}')
+                if temporario and os.path.exists(temporario):
+                    os.remove(temporario)
+
+    def aquecer(self, linhas):
+        with self._lock:
+            for linha in linhas:
+                self._guardar(str(linha[0]), fingerprint_pedido(linha))
+        return len(self._hashes)
+
+    def filtrar_alterados(self, pedidos):
+        alterados = []
+        with self._lock:
+            for pedido in pedidos:
+                numero_pedido = str(pedido[0])
+                if self._hashes.get(numero_pedido) == fingerprint_pedido(pedido):
+                    self._hashes.move_to_end(numero_pedido)
+                    self.hits += 1
+                else:
+                    alterados.append(pedido)
+                    self.misses += 1
+        return alterados
+
+    def confirmar(self, pedidos):
+        # Só depois da gravação: um pedido que falhou ao gravar continua
+        # "alterado" e é reenviado na próxima execução.
+        with self._lock:
+            for pedido in pedidos:
+                self._guardar(str(pedido[0]), fingerprint_pedido(pedido))
+
+    def estatisticas(self, zerar=False):
+        with self._lock:
+            total = self.hits + self.misses
+            estatisticas = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_hit': self.hits / total if total else 0.0,
+                'tamanho': len(self._hashes),
+            }
+            if zerar:
+                self.hits = self.misses = 0
+        return estatisticas
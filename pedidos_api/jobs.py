@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+JOBS_MAX_WORKERS = int(os.getenv('JOBS_MAX_WORKERS', 2))
+JOBS_MAX_HISTORICO = int(os.getenv('JOBS_MAX_HISTORICO', 100))
+
+def _agora():
+    return datetime.now(timezone.utc).isoformat()
+
+class GerenciadorJobs:
+    def __init__(self, max_workers=JOBS_MAX_WORKERS, max_historico=JOBS_MAX_HISTORICO):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-ingestao')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._ativos = {}
+        self._eventos = {}
+        self.max_historico = max_historico
+
+    def submeter(self, chave, funcao, *args, **kwargs):
+        # Single-flight: enquanto houver um job ativo com a mesma chave, novos
+        # disparos recebem esse job em vez de iniciar uma ingestão duplicada.
+        with self._lock:
+            job_id = self._ativos.get(chave)
+            if job_id:
+                return dict(self._jobs[job_id]), False
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'chave': chave,
+                'status': 'pendente',
+                'criado_em': _agora(),
+                'iniciado_em': None,
+                'finalizado_em': None,
+                'duracao_s': None,
+                'resultado': None,
+                'erro': None,
+            }
+            self._ativos[chave] = job_id
+            self._eventos[job_id] = threading.Event()
+            self._limpar_historico()
+            job = dict(self._jobs[job_id])
+
+        self._executor.submit(self._executar, job_id, funcao, args, kwargs)
+        return job, True
+
+    def _executar(self, job_id, funcao, args, kwargs):
+        self._atualizar(job_id, status='executando', iniciado_em=_agora())
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+            status = 'concluido' if resultado is not None else 'falhou'
+            self._atualizar(job_id, status=status, resultado=resultado)
+        except Exception as e:
+            logger.exception(f'Job {job_id} falhou: {e}')
+            self._atualizar(job_id, status='falhou', erro=str(e))
+        finally:
+            with self._lock:
+                job = self._jobs[job_id]
+                job['finalizado_em'] = _agora()
+                job['duracao_s'] = round(time.perf_counter() - inicio, 3)
+                if self._ativos.get(job['chave']) == job_id:
+                    del self._ativos[job['chave']]
+                self._eventos.pop(job_id).set()
+
+    def _atualizar(self, job_id, **campos):
+        with self._lock:
+            self._jobs[job_id].update(campos)
+
+    def _limpar_historico(self):
+        while len(self._jobs) > self.max_historico:
+            job_id, job = next(iter(self._jobs.items()))
+            if job['status'] in ('pendente', 'executando'):
+                break
+            del self._jobs[job_id]
+
+    def aguardar(self, job_id, timeout=None):
+        with self._lock:
+            evento = self._eventos.get(job_id)
+        if evento is not None:
+            evento.wait(timeout)
+        return self.obter(job_id)
+
+    def obter(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def listar(self):
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
@@ -1,4 +1,5 @@
-from processador import processar_pedidos
+import argparse
+from datetime import date
 import logging
 
 logging.basicConfig(
@@ -6,5 +7,41 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Coleta de pedidos da Central do Franqueado.")
+    parser.add_argument('--inicio', type=date.fromisoformat, help="Data inicial do backfill (AAAA-MM-DD).")
+    parser.add_argument('--fim', type=date.fromisoformat, help="Data final do backfill (AAAA-MM-DD).")
+    parser.add_argument('--paralelismo', type=int, help="Quantidade de dias buscados em paralelo no backfill.")
+    parser.add_argument('--streaming', action='store_true', help="Grava os pedidos em chunks enquanto a resposta da API é baixada.")
+    parser.add_argument('--pipeline', action='store_true', help="Baixa, extrai e grava os pedidos em estágios simultâneos.")
+    parser.add_argument('--extratores', type=int, help="Processos de extração no modo pipeline (0 = thread única).")
+    parser.add_argument('--ignorar-checkpoint', action='store_true', help="Reprocessa dias já concluídos.")
+    parser.add_argument('--reconstruir-snapshot', action='store_true', help="Regrava o snapshot Parquet local de todos os meses.")
+    parser.add_argument('--migrar-particionamento', action='store_true', help="Migra a tabela pedidos antiga para a particionada por mês, em lotes.")
+    parser.add_argument('--lote-migracao', type=int, help="Pedidos copiados por transação na migração.")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    processar_pedidos()
+    args = parse_args()
+    # Importado só depois dos argumentos: `--help` e erros de uso respondem sem
+    # carregar requests, psycopg2 e o restante da ingestão.
+    from processador import (
+        processar_pedidos, processar_pedidos_stream, processar_pedidos_pipeline, processar_backfill, reconstruir_snapshot,
+        migrar_particionamento,
+    )
+    if args.migrar_particionamento:
+        migrar_particionamento(args.lote_migracao)
+    elif args.reconstruir_snapshot:
+        reconstruir_snapshot()
+    elif args.inicio:
+        kwargs = {'ignorar_checkpoint': args.ignorar_checkpoint}
+        if args.paralelismo:
+            kwargs['paralelismo'] = args.paralelismo
+        processar_backfill(args.inicio, args.fim or date.today(), **kwargs)
+    elif args.pipeline:
+        kwargs = {'extratores': args.extratores} if args.extratores is not None else {}
+        processar_pedidos_pipeline(**kwargs)
+    elif args.streaming:
+        processar_pedidos_stream()
+    else:
+        processar_pedidos()
@@ -0,0 +1,151 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Limites (em segundos) dos histogramas de latência.
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _formatar_rotulos(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+def _formatar_valor(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rótulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _amostras(self):
+        raise NotImplementedError
+
+    def expor(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        for sufixo, pares, valor in self._amostras():
+            linhas.append(f'{self.nome}{sufixo}{_formatar_rotulos(pares)} {_formatar_valor(valor)}')
+        return '\n'.join(linhas)
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        if not self.rotulos:
+            self._valores[()] = 0
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def _amostras(self):
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [('', list(zip(self.rotulos, chave)), valor) for chave, valor in itens]
+
+class Medidor(_Metrica):
+    """Gauge; com `coletar`, os valores são lidos na hora da exposição: [(rótulos, valor), ...]."""
+
+    tipo = 'gauge'
+
+    def __init__(self, nome, ajuda, rotulos=(), coletar=None):
+        super().__init__(nome, ajuda, rotulos)
+        self.coletar = coletar
+
+    def definir(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def _amostras(self):
+        if self.coletar is not None:
+            return [('', list(zip(self.rotulos, (str(r[n]) for n in self.rotulos))), valor) for r, valor in self.coletar()]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [('', list(zip(self.rotulos, chave)), valor) for chave, valor in itens]
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        if not self.rotulos:
+            self._valores[()] = ([0] * len(self.buckets), 0.0)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+                    break
+            self._valores[chave] = (contagens, soma + valor)
+
+    @contextmanager
+    def cronometrar(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def _amostras(self):
+        with self._lock:
+            itens = sorted((chave, (list(contagens), soma)) for chave, (contagens, soma) in self._valores.items())
+        amostras = []
+        for chave, (contagens, soma) in itens:
+            pares = list(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                amostras.append(('_bucket', pares + [('le', _formatar_valor(limite))], acumulado))
+            amostras.append(('_sum', pares, soma))
+            amostras.append(('_count', pares, acumulado))
+        return amostras
+
+class Registro:
+    """Métricas do processo, expostas no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metricas = []
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def expor(self):
+        with self._lock:
+            metricas = list(self._metricas)
+        return '\n'.join(metrica.expor() for metrica in metricas) + '\n'
+
+REGISTRO = Registro()
+
+def contador(nome, ajuda, rotulos=()):
+    return REGISTRO.registrar(Contador(nome, ajuda, rotulos))
+
+def medidor(nome, ajuda, rotulos=(), coletar=None):
+    return REGISTRO.registrar(Medidor(nome, ajuda, rotulos, coletar))
+
+def histograma(nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+    return REGISTRO.registrar(Histograma(nome, ajuda, rotulos, buckets))
@@ -0,0 +1,355 @@
+import os
+import time
+import logging
+from datetime import date, timedelta
+import psycopg2
+from config import carregar_env
+from db import (
+    tipo_tabela, criar_particao, particoes_existentes, garantir_particoes, esquecer_particoes,
+    garantir_coluna_atualizado_em, garantir_tabela_chaves, garantir_tabela_rollup, garantir_tabela_log_status,
+)
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+# Meses à frente do atual que já ficam com partição criada.
+PARTICOES_FUTURAS = int(os.getenv('PEDIDOS_PARTICOES_FUTURAS', 3))
+MIGRACAO_TAMANHO_LOTE = int(os.getenv('MIGRACAO_TAMANHO_LOTE', 10000))
+# Folga ao reaplicar o que mudou durante a cópia: atualizado_em é a hora de
+# início da transação que gravou, que pode ter confirmado depois. Linhas da
+# folga já copiadas, com o mesmo atualizado_em, não são regravadas.
+MARGEM_REAPLICACAO = timedelta(minutes=5)
+
+TABELA_NOVA = 'pedidos_particionada'
+COLUNAS = 'numero_pedido, status, franqueado, fornecedor, data_pedido, mes_pedido, valor_pedido, atualizado_em'
+
+DDL_PEDIDOS = """
+    CREATE TABLE {tabela} (
+        numero_pedido VARCHAR NOT NULL,
+        status TEXT,
+        franqueado TEXT,
+        fornecedor TEXT,
+        data_pedido TIMESTAMP NOT NULL,
+        mes_pedido TEXT,
+        valor_pedido NUMERIC(14, 2),
+        atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (numero_pedido, data_pedido)
+    ) PARTITION BY RANGE (data_pedido);
+"""
+
+# Índices pelos padrões de acesso. A chave primária atende o upsert; data_pedido
+# as janelas de datas do dashboard, dos rollups e do export; atualizado_em a
+# marca d'água do dashboard; os compostos os filtros de franqueado e fornecedor
+# do export dentro de um intervalo de datas e os valores distintos da barra
+# lateral. Status fica sem índice: poucos valores, sempre junto de um intervalo
+# de datas que a partição e data_pedido já restringem, e cada índice a mais
+# pesa em toda gravação. Criados na tabela pai, valem para todas as partições,
+# inclusive as futuras.
+INDICES_PEDIDOS = {
+    'data_pedido': '(data_pedido)',
+    'atualizado_em': '(atualizado_em)',
+    'franqueado_data': '(franqueado, data_pedido)',
+    'fornecedor_data': '(fornecedor, data_pedido)',
+}
+
+def criar_tabela_pedidos(cur, tabela='pedidos', modelo=None):
+    """Cria `tabela` particionada por mês de data_pedido, com os índices de consulta.
+
+    Com `modelo`, copia as colunas (tipos e defaults) de uma tabela existente,
+    para migrar sem alterar tipos.
+    """
+    if modelo:
+        cur.execute(f"""
+            CREATE TABLE {tabela} (
+                LIKE {modelo} INCLUDING DEFAULTS,
+                PRIMARY KEY (numero_pedido, data_pedido)
+            ) PARTITION BY RANGE (data_pedido);
+        """)
+    else:
+        cur.execute(DDL_PEDIDOS.format(tabela=tabela))
+    for sufixo, colunas in INDICES_PEDIDOS.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{sufixo} ON {tabela} {colunas};")
+
+def meses_entre(inicio, fim):
+    """Meses 'AAAA-MM' de `inicio` até `fim`, inclusive."""
+    meses = []
+    ano, mes = inicio.year, inicio.month
+    while (ano, mes) <= (fim.year, fim.month):
+        meses.append(f'{ano:04d}-{mes:02d}')
+        ano, mes = ano + mes // 12, mes % 12 + 1
+    return meses
+
+def meses_futuros(meses_a_frente=PARTICOES_FUTURAS):
+    hoje = date.today()
+    ano, mes = divmod(hoje.month - 1 + meses_a_frente, 12)
+    return meses_entre(hoje, date(hoje.year + ano, mes + 1, 1))
+
+def criar_particoes_futuras(meses_a_frente=PARTICOES_FUTURAS):
+    """Cria com antecedência as partições do mês atual e dos próximos meses."""
+    garantir_particoes(meses_futuros(meses_a_frente))
+
+def _criar_indice_concorrente(conn, nome, definicao):
+    """Cria o índice `nome` em pedidos com CONCURRENTLY, sem bloquear a ingestão.
+
+    Um índice inválido, deixado por uma tentativa interrompida, é refeito.
+    """
+    conn.commit()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT indisvalid FROM pg_index
+                WHERE indrelid = 'pedidos'::regclass AND indexrelid = to_regclass(%s);
+            """, (nome,))
+            linha = cur.fetchone()
+            if linha and not linha[0]:
+                cur.execute(f"DROP INDEX CONCURRENTLY {nome};")
+            if not linha or not linha[0]:
+                logger.info(f'Criando o índice {nome} em pedidos.')
+                cur.execute(f"CREATE {definicao.format(nome=nome)};")
+    finally:
+        conn.autocommit = autocommit
+
+def garantir_indices_tabela_antiga(conn):
+    """Índices da tabela pedidos antiga, não particionada, criados com CONCURRENTLY.
+
+    O índice único (numero_pedido, data_pedido) é o alvo do ON CONFLICT do
+    upsert; o de data_pedido atende o recálculo dos rollups e as janelas do
+    dashboard e do export, que sem ele leriam a tabela inteira.
+    """
+    _criar_indice_concorrente(
+        conn, 'idx_pedidos_chave_upsert',
+        'UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON pedidos (numero_pedido, data_pedido)',
+    )
+    _criar_indice_concorrente(
+        conn, 'idx_pedidos_data_pedido',
+        'INDEX CONCURRENTLY IF NOT EXISTS {nome} ON pedidos ' + INDICES_PEDIDOS['data_pedido'],
+    )
+
+def aplicar_migracoes(conn):
+    """Deixa o schema pronto para a ingestão; idempotente.
+
+    Cria pedidos particionada se ela não existe, as colunas e tabelas auxiliares
+    (chaves, rollups, log de status) e as partições dos próximos meses. Uma tabela
+    pedidos antiga, não particionada, ganha os índices de que a ingestão precisa e
+    continua funcionando até ser migrada com `migrar_para_particionada`.
+    """
+    with conn.cursor() as cur:
+        tipo = tipo_tabela(cur)
+        if tipo is None:
+            criar_tabela_pedidos(cur)
+            logger.info('Tabela pedidos criada, particionada por mês.')
+    conn.commit()
+
+    garantir_coluna_atualizado_em(conn)
+    if tipo == 'r':
+        garantir_indices_tabela_antiga(conn)
+        logger.warning('A tabela pedidos não é particionada; migre com `python main.py --migrar-particionamento`.')
+    garantir_tabela_chaves(conn)
+    garantir_tabela_rollup(conn)
+    garantir_tabela_log_status(conn)
+    criar_particoes_futuras()
+
+# --- Migração online da tabela antiga ---
+
+# Cada lote é delimitado pela chave da tabela antiga; os meses do lote vêm
+# junto para criar antes as partições que faltarem (a ingestão pode gravar
+# meses fora do histórico durante a cópia).
+SQL_LIMITES_LOTE = """
+    SELECT max(numero_pedido)::text, count(*), count(*) FILTER (WHERE data_pedido IS NULL),
+           array_agg(DISTINCT to_char(data_pedido, 'YYYY-MM')) FILTER (WHERE data_pedido IS NOT NULL)
+    FROM (
+        SELECT numero_pedido, data_pedido FROM pedidos
+        WHERE %(ultimo)s IS NULL OR numero_pedido > %(ultimo)s
+        ORDER BY numero_pedido
+        LIMIT %(tamanho)s
+    ) lote;
+"""
+
+SQL_COPIAR_LOTE = f"""
+    INSERT INTO {TABELA_NOVA} ({COLUNAS})
+    SELECT {COLUNAS} FROM pedidos
+    WHERE (%(ultimo)s IS NULL OR numero_pedido > %(ultimo)s)
+      AND numero_pedido <= %(maior)s
+      AND data_pedido IS NOT NULL
+    ON CONFLICT (numero_pedido, data_pedido) DO NOTHING;
+"""
+
+SQL_REAPLICAR = f"""
+    WITH alterados AS (
+        INSERT INTO {TABELA_NOVA} ({COLUNAS})
+        SELECT {COLUNAS} FROM pedidos
+        WHERE atualizado_em >= %(desde)s AND data_pedido IS NOT NULL
+        ON CONFLICT (numero_pedido, data_pedido) DO UPDATE
+        SET status = EXCLUDED.status, franqueado = EXCLUDED.franqueado, fornecedor = EXCLUDED.fornecedor,
+            mes_pedido = EXCLUDED.mes_pedido, valor_pedido = EXCLUDED.valor_pedido,
+            atualizado_em = EXCLUDED.atualizado_em
+        WHERE {TABELA_NOVA}.atualizado_em IS DISTINCT FROM EXCLUDED.atualizado_em
+        RETURNING atualizado_em
+    )
+    SELECT count(*), max(atualizado_em) FROM alterados;
+"""
+
+# Um pedido que mudou de data durante a cópia foi removido e regravado na
+# tabela antiga; a linha com a data anterior, já copiada, sai da nova. Só os
+# pedidos alterados desde a marca são procurados, pelo índice de cada partição.
+SQL_DESCARTAR_MOVIDOS = f"""
+    DELETE FROM {TABELA_NOVA} nova
+    USING pedidos antiga
+    WHERE nova.numero_pedido = ANY(ARRAY(
+              SELECT numero_pedido FROM pedidos
+              WHERE atualizado_em >= %(desde)s AND data_pedido IS NOT NULL
+          ))
+      AND antiga.numero_pedido = nova.numero_pedido
+      AND antiga.data_pedido <> nova.data_pedido;
+"""
+
+def _garantir_particoes_nova(cur, meses):
+    for ano_mes in sorted(set(meses) - particoes_existentes(cur, TABELA_NOVA)):
+        criar_particao(cur, ano_mes, TABELA_NOVA)
+
+def _iniciar_migracao(conn):
+    """Cria a tabela nova e o registro de progresso, ou retoma uma migração interrompida."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migracao_particionamento (
+                id SMALLINT PRIMARY KEY CHECK (id = 1),
+                ultimo_numero TEXT,
+                marca TIMESTAMPTZ NOT NULL,
+                iniciada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cur.execute("SELECT ultimo_numero, marca FROM migracao_particionamento;")
+        progresso = cur.fetchone()
+        if progresso and tipo_tabela(cur, TABELA_NOVA) == 'p':
+            logger.info(f'Retomando a migração a partir do pedido {progresso[0]}.')
+            conn.commit()
+            return progresso
+
+        # Marca d'água tomada antes da cópia: o que mudar depois dela é reaplicado no fim.
+        cur.execute("SELECT COALESCE(max(atualizado_em), now()) FROM pedidos;")
+        marca = cur.fetchone()[0]
+        cur.execute(f"DROP TABLE IF EXISTS {TABELA_NOVA};")
+        criar_tabela_pedidos(cur, TABELA_NOVA, modelo='pedidos')
+        cur.execute("SELECT min(data_pedido), max(data_pedido) FROM pedidos;")
+        primeira, ultima = cur.fetchone()
+        meses = meses_entre(primeira, ultima) if primeira else []
+        _garantir_particoes_nova(cur, meses + meses_futuros())
+        cur.execute("""
+            INSERT INTO migracao_particionamento (id, ultimo_numero, marca) VALUES (1, NULL, %s)
+            ON CONFLICT (id) DO UPDATE SET ultimo_numero = NULL, marca = EXCLUDED.marca, iniciada_em = now();
+        """, (marca,))
+    conn.commit()
+    logger.info(f'Tabela {TABELA_NOVA} criada com {len(meses)} partições de histórico.')
+    return None, marca
+
+def _reaplicar_alterados(cur, marca):
+    """Leva para a tabela nova o que mudou na antiga desde `marca`; devolve (linhas, nova marca)."""
+    desde = marca - MARGEM_REAPLICACAO
+    cur.execute("""
+        SELECT DISTINCT to_char(data_pedido, 'YYYY-MM') FROM pedidos
+        WHERE atualizado_em >= %s AND data_pedido IS NOT NULL;
+    """, (desde,))
+    _garantir_particoes_nova(cur, [linha[0] for linha in cur.fetchall()])
+    cur.execute(SQL_DESCARTAR_MOVIDOS, {'desde': desde})
+    cur.execute(SQL_REAPLICAR, {'desde': desde})
+    linhas, maior = cur.fetchone()
+    return linhas, max(marca, maior) if maior else marca
+
+def _trocar_tabelas(conn, marca, tentativas=5, espera_trava='5s'):
+    """Troca pedidos pela tabela nova em uma transação curta.
+
+    A trava exclusiva só é pedida com lock_timeout; se houver transação longa
+    usando pedidos, desiste e tenta de novo em vez de enfileirar a ingestão e o
+    dashboard atrás dela.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SET LOCAL lock_timeout = '{espera_trava}';")
+                cur.execute(f"LOCK TABLE pedidos, {TABELA_NOVA} IN ACCESS EXCLUSIVE MODE;")
+                linhas, _ = _reaplicar_alterados(cur, marca)
+
+                cur.execute("""
+                    SELECT conname FROM pg_constraint
+                    WHERE conrelid = 'pedidos'::regclass AND contype = 'p';
+                """)
+                chave_antiga = cur.fetchone()
+                if chave_antiga:
+                    cur.execute(f"ALTER TABLE pedidos RENAME CONSTRAINT {chave_antiga[0]} TO pedidos_antiga_pkey;")
+                for sufixo in [*INDICES_PEDIDOS, 'chave_upsert']:
+                    cur.execute(f"ALTER INDEX IF EXISTS idx_pedidos_{sufixo} RENAME TO idx_pedidos_antiga_{sufixo};")
+                cur.execute("ALTER TABLE pedidos RENAME TO pedidos_antiga;")
+                cur.execute(f"ALTER TABLE {TABELA_NOVA} RENAME TO pedidos;")
+                cur.execute(f"ALTER TABLE pedidos RENAME CONSTRAINT {TABELA_NOVA}_pkey TO pedidos_pkey;")
+                for sufixo in INDICES_PEDIDOS:
+                    cur.execute(f"ALTER INDEX idx_{TABELA_NOVA}_{sufixo} RENAME TO idx_pedidos_{sufixo};")
+                cur.execute("DROP TABLE migracao_particionamento;")
+            conn.commit()
+            logger.info(f'Tabelas trocadas ({linhas} linhas reaplicadas sob trava).')
+            return
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            logger.warning(f'Trava de pedidos indisponível (tentativa {tentativa}/{tentativas}).')
+            time.sleep(tentativa)
+    raise RuntimeError(f'Não foi possível travar pedidos para a troca após {tentativas} tentativas.')
+
+def migrar_para_particionada(conn, tamanho_lote=MIGRACAO_TAMANHO_LOTE, max_reaplicacoes=5):
+    """Migra a tabela pedidos não particionada para a particionada, sem parar a ingestão.
+
+    1. cria `pedidos_particionada` com as partições do histórico;
+    2. copia em lotes pela chave, cada lote em sua transação (retomável: o
+       progresso fica em migracao_particionamento);
+    3. reaplica o que a ingestão alterou durante a cópia, pela marca d'água
+       atualizado_em, até sobrar pouco;
+    4. sob trava exclusiva curta, reaplica o restante e troca os nomes.
+
+    A tabela antiga fica como `pedidos_antiga` para conferência e pode ser
+    removida depois. Pedidos sem data_pedido não cabem em nenhuma partição e
+    não são copiados. Devolve o número de linhas copiadas, ou None se não havia
+    o que migrar.
+    """
+    with conn.cursor() as cur:
+        tipo = tipo_tabela(cur)
+    conn.rollback()
+    if tipo != 'r':
+        logger.info('Nada a migrar: pedidos ' + ('já é particionada.' if tipo == 'p' else 'não existe.'))
+        return None
+
+    garantir_coluna_atualizado_em(conn)
+    ultimo, marca = _iniciar_migracao(conn)
+
+    copiados = sem_data = 0
+    inicio = time.perf_counter()
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(SQL_LIMITES_LOTE, {'ultimo': ultimo, 'tamanho': tamanho_lote})
+            maior, quantidade, nulos, meses = cur.fetchone()
+            if not quantidade:
+                break
+            _garantir_particoes_nova(cur, meses or [])
+            cur.execute(SQL_COPIAR_LOTE, {'ultimo': ultimo, 'maior': maior})
+            cur.execute("UPDATE migracao_particionamento SET ultimo_numero = %s;", (maior,))
+        conn.commit()
+        ultimo = maior
+        copiados += quantidade
+        sem_data += nulos
+        logger.info(f'{copiados} pedidos copiados ({copiados / (time.perf_counter() - inicio):.0f}/s).')
+    conn.rollback()
+    if sem_data:
+        logger.warning(f'{sem_data} pedidos sem data_pedido ficaram só em pedidos_antiga.')
+
+    for _ in range(max_reaplicacoes):
+        with conn.cursor() as cur:
+            linhas, marca = _reaplicar_alterados(cur, marca)
+            cur.execute("UPDATE migracao_particionamento SET marca = %s;", (marca,))
+        conn.commit()
+        logger.info(f'{linhas} pedidos alterados durante a cópia reaplicados.')
+        if linhas < tamanho_lote:
+            break
+
+    _trocar_tabelas(conn, marca)
+    esquecer_particoes()
+    logger.info('Migração concluída; a tabela antiga ficou como pedidos_antiga.')
+    return copiados
@@ -0,0 +1,135 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from config import carregar_env
+
+carregar_env()
+
+# Lotes aguardando em cada fila. Com a fila cheia o estágio anterior bloqueia:
+# um banco lento segura a extração, que segura o download.
+PIPELINE_TAMANHO_FILA = int(os.getenv('PIPELINE_TAMANHO_FILA', 4))
+# 0 extrai em uma thread do próprio processo; N > 0 usa N processos.
+PIPELINE_EXTRATORES = int(os.getenv('PIPELINE_EXTRATORES', 0))
+
+_FIM = object()
+
+class _Falha:
+    def __init__(self, erro):
+        self.erro = erro
+
+def _colocar(fila, item, parar):
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _consumir(fila, parar):
+    while True:
+        try:
+            item = fila.get(timeout=0.1)
+        except queue.Empty:
+            if parar.is_set():
+                return
+            continue
+        if item is _FIM:
+            return
+        if isinstance(item, _Falha):
+            raise item.erro
+        yield item
+
+def _cronometrado(funcao, lote):
+    inicio = time.perf_counter()
+    resultado = funcao(lote)
+    return time.perf_counter() - inicio, resultado
+
+def _estagio_busca(lotes, saida, parar, tempos):
+    try:
+        iterador = iter(lotes)
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            lote = next(iterador, _FIM)
+            tempos['busca'] += time.perf_counter() - inicio
+            if lote is _FIM:
+                break
+            if not _colocar(saida, lote, parar):
+                return
+        _colocar(saida, _FIM, parar)
+    except Exception as e:
+        _colocar(saida, _Falha(e), parar)
+
+def _estagio_extracao(extrair, entrada, saida, parar, tempos, executor, em_voo):
+    # Com processos, até `em_voo` lotes ficam em extração ao mesmo tempo e são
+    # entregues na ordem de chegada, preservando a ordem dos pedidos.
+    def entregar(futuro):
+        duracao, resultado = futuro.result()
+        tempos['extracao'] += duracao
+        return _colocar(saida, resultado, parar)
+
+    try:
+        pendentes = deque()
+        for lote in _consumir(entrada, parar):
+            if executor is None:
+                duracao, resultado = _cronometrado(extrair, lote)
+                tempos['extracao'] += duracao
+                if not _colocar(saida, resultado, parar):
+                    return
+                continue
+            pendentes.append(executor.submit(_cronometrado, extrair, lote))
+            if len(pendentes) >= em_voo and not entregar(pendentes.popleft()):
+                return
+        while pendentes:
+            if not entregar(pendentes.popleft()):
+                return
+        _colocar(saida, _FIM, parar)
+    except Exception as e:
+        _colocar(saida, _Falha(e), parar)
+
+def executar_pipeline(lotes, extrair, gravar, tamanho_fila=PIPELINE_TAMANHO_FILA, extratores=PIPELINE_EXTRATORES):
+    """Executa busca, extração e gravação ao mesmo tempo, ligadas por filas limitadas.
+
+    `lotes` é iterado em uma thread (download), `extrair` roda em outra thread
+    ou em `extratores` processos e `gravar` roda na thread chamadora, que
+    normalmente é a dona da conexão com o banco. Uma exceção em qualquer
+    estágio interrompe os demais e é relançada aqui.
+
+    Devolve o tempo ocupado de cada estágio e o tempo total: com os estágios
+    sobrepostos, o total fica próximo do estágio mais lento, não da soma.
+    """
+    parar = threading.Event()
+    tempos = {'busca': 0.0, 'extracao': 0.0, 'gravacao': 0.0}
+    fila_bruta = queue.Queue(maxsize=tamanho_fila)
+    fila_extraida = queue.Queue(maxsize=tamanho_fila)
+    executor = None
+    if extratores > 0:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=extratores)
+
+    threads = [
+        threading.Thread(target=_estagio_busca, args=(lotes, fila_bruta, parar, tempos), daemon=True),
+        threading.Thread(
+            target=_estagio_extracao,
+            args=(extrair, fila_bruta, fila_extraida, parar, tempos, executor, max(extratores, 1) * 2),
+            daemon=True,
+        ),
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for extraido in _consumir(fila_extraida, parar):
+            inicio_gravacao = time.perf_counter()
+            gravar(extraido)
+            tempos['gravacao'] += time.perf_counter() - inicio_gravacao
+    finally:
+        parar.set()
+        for thread in threads:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    tempos['total'] = time.perf_counter() - inicio
+    return tempos
@@ -1,37 +1,515 @@
+import os
+import time
+import inspect
 import logging
-from db import get_conn, put_conn, inserir_pedidos_batch, atualizar_status_pedidos
-from api import buscar_pedidos
-from utils import extrair_dados_pedido
-from datetime import date
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from db import (
+    get_conn, put_conn, ErroPool, upsert_pedidos, copiar_pedidos,
+    garantir_tabela_checkpoint, dias_concluidos, registrar_dia_concluido,
+    listar_pedidos_recentes, ler_watermark, atualizar_rollups_pendentes,
+    garantir_tabela_execucoes, registrar_execucao,
+)
+from api import buscar_pedidos, buscar_pedidos_stream, get_cliente, ErroAPI, NAO_MODIFICADO
+from utils import extrair_pedidos_lote, iterar_pedidos_extraidos
+from fingerprints import CacheFingerprints, FINGERPRINT_DIAS_AQUECIMENTO
+from snapshot import SnapshotPedidos, SNAPSHOT_ATIVO
+from pipeline import executar_pipeline, PIPELINE_EXTRATORES
+from migracoes import aplicar_migracoes, migrar_para_particionada
+from metricas import contador, histograma, medidor
+from datetime import date, datetime, timedelta, timezone
+from config import carregar_env
 
 
+carregar_env()
 logger = logging.getLogger(__name__)
 
-def processar_pedidos():
-    data_hoje = date.today().isoformat()
-    pedidos_json = buscar_pedidos(data_hoje)
+LIMITE_COPY = int(os.getenv('LIMITE_COPY', 20000))
+BACKFILL_PARALELISMO = int(os.getenv('BACKFILL_PARALELISMO', 8))
+TAMANHO_CHUNK_STREAM = int(os.getenv('TAMANHO_CHUNK_STREAM', 1000))
+
+cache_fingerprints = None
+banco_preparado = False
+# Jobs da API rodam em threads: a preparação do banco e a criação do cache de
+# fingerprints acontecem uma vez só, mesmo com duas ingestões começando juntas.
+_lock_inicializacao = threading.Lock()
+tabela_execucoes_pronta = False
+snapshot = SnapshotPedidos() if SNAPSHOT_ATIVO else None
+
+EXTRACAO_SEGUNDOS = histograma('pedidos_extracao_lote_segundos', 'Tempo de extração de um lote de pedidos.')
+PEDIDOS_EXTRAIDOS = contador('pedidos_extraidos_total', 'Pedidos extraídos da resposta da API.')
+PEDIDOS_REJEITADOS = contador('pedidos_rejeitados_total', 'Pedidos malformados descartados na extração.')
+PEDIDOS_IGNORADOS = contador('pedidos_ignorados_fingerprint_total', 'Pedidos sem mudança descartados antes do banco.')
+GRAVACAO_SEGUNDOS = histograma('pedidos_gravacao_segundos', 'Tempo de gravação de um lote no banco.', ('metodo',))
+PEDIDOS_GRAVADOS = contador('pedidos_gravados_total', 'Pedidos enviados ao banco, por resultado.', ('resultado',))
+FALHAS_GRAVACAO = contador('pedidos_gravacao_falhas_total', 'Lotes cuja gravação falhou.')
+EXECUCOES = contador('pedidos_execucoes_total', 'Execuções da ingestão.', ('modo', 'resultado'))
+EXECUCAO_SEGUNDOS = histograma('pedidos_execucao_segundos', 'Duração das execuções da ingestão.', ('modo',))
+ULTIMO_SUCESSO = medidor('pedidos_ultimo_sucesso_timestamp_segundos', 'Fim da última execução bem-sucedida.', ('modo',))
+
+# Contagens da execução corrente da thread, gravadas no histórico ao final.
+_execucao = threading.local()
+
+def _obter_conexao():
+    """Conexão do pool, ou None se nenhuma ficar livre dentro do tempo de espera."""
+    try:
+        return get_conn()
+    except ErroPool as e:
+        logger.error(f"Não foi possível obter conexão com o banco: {e}")
+        return None
+
+def preparar_banco(conn):
+    global banco_preparado
+    if banco_preparado:
+        return
+    with _lock_inicializacao:
+        if not banco_preparado:
+            aplicar_migracoes(conn)
+            banco_preparado = True
+
+def get_cache_fingerprints(conn):
+    global cache_fingerprints
+    if cache_fingerprints is not None:
+        return cache_fingerprints
+    with _lock_inicializacao:
+        if cache_fingerprints is None:
+            cache = CacheFingerprints()
+            try:
+                carregados = cache.carregar(ler_watermark(conn))
+            except Exception as e:
+                logger.warning(f"Não foi possível ler a marca d'água para validar os fingerprints: {e}")
+                conn.rollback()
+                carregados = 0
+            if not carregados:
+                try:
+                    carregados = cache.aquecer(listar_pedidos_recentes(conn, FINGERPRINT_DIAS_AQUECIMENTO))
+                except Exception as e:
+                    logger.warning(f"Não foi possível aquecer os fingerprints a partir do banco: {e}")
+                    conn.rollback()
+            logger.info(f"Cache de fingerprints pronto com {carregados} pedidos.")
+            cache_fingerprints = cache
+    return cache_fingerprints
+
+def gravar_pedidos(conn, pedidos):
+    preparar_banco(conn)
+
+    # Pedidos idênticos aos já gravados são descartados antes do banco.
+    cache = get_cache_fingerprints(conn)
+    alterados = cache.filtrar_alterados(pedidos)
+    descartados = len(pedidos) - len(alterados)
+    PEDIDOS_IGNORADOS.inc(descartados)
+    if not alterados:
+        return {'inseridos': 0, 'alterados': 0, 'inalterados': descartados}
+
+    # Cargas grandes (backfills, ressincronizações) vão pelo COPY + staging;
+    # o dia a dia continua no upsert em lotes.
+    metodo = 'copy' if len(alterados) > LIMITE_COPY else 'upsert'
+    with GRAVACAO_SEGUNDOS.cronometrar(metodo=metodo):
+        if metodo == 'copy':
+            resultado = copiar_pedidos(conn, alterados)
+        else:
+            resultado = upsert_pedidos(conn, alterados)
+
+    if resultado is None:
+        FALHAS_GRAVACAO.inc()
+    else:
+        for chave in ('inseridos', 'alterados', 'inalterados'):
+            PEDIDOS_GRAVADOS.inc(resultado[chave], resultado=chave)
+        cache.confirmar(alterados)
+        resultado['inalterados'] += descartados
+        # Pedidos que mudaram de data saíram de outro mês, que também é regravado.
+        meses_movidos = resultado.pop('meses_movidos', [])
+        if snapshot is not None and (resultado['inseridos'] or resultado['alterados']):
+            snapshot.marcar({p[4].strftime('%Y-%m') for p in alterados if p[4]} | set(meses_movidos))
+    return resultado
+
+def _finalizar_fingerprints(conn):
+    # Só em execuções concluídas, com a conexão ainda em mãos: o arquivo leva a
+    # marca d'água lida depois dos commits, usada para invalidá-lo se o banco
+    # voltar no tempo.
+    if cache_fingerprints is None:
+        return
+    estatisticas = cache_fingerprints.estatisticas(zerar=True)
+    logger.info(
+        f"Fingerprints: {estatisticas['hits']} pedidos sem mudança ignorados, "
+        f"{estatisticas['misses']} enviados ao banco (taxa de acerto {estatisticas['taxa_hit']:.1%})."
+    )
+    try:
+        cache_fingerprints.salvar(lambda: ler_watermark(conn))
+    except Exception as e:
+        logger.warning(f"Fingerprints não salvos: falha ao ler a marca d'água: {e}")
+        conn.rollback()
+
+def _finalizar_rollups(conn):
+    # Uma vez por execução, também nas que falharam no meio: os lotes já
+    # gravados marcaram seus meses, recalculados aqui de uma vez.
+    try:
+        meses = atualizar_rollups_pendentes(conn)
+        if meses:
+            logger.info(f"Rollups recalculados para {len(meses)} meses.")
+    except Exception as e:
+        logger.warning(f"Rollups não recalculados, ficam para a próxima execução: {e}")
+
+def _finalizar_snapshot(conn):
+    # Regrava uma vez por execução os meses tocados, em vez de a cada lote/dia.
+    if snapshot is None:
+        return
+    try:
+        meses = snapshot.sincronizar(conn)
+        if meses:
+            logger.info(f"Snapshot local atualizado: {meses} meses.")
+    except Exception as e:
+        logger.warning(f"Não foi possível atualizar o snapshot local: {e}")
+
+def _registrar_extraidos(quantidade, duracao=None):
+    PEDIDOS_EXTRAIDOS.inc(quantidade)
+    if duracao is not None:
+        EXTRACAO_SEGUNDOS.observar(duracao)
+
+def _extrair_cronometrado(pedidos_json):
+    # Roda também nos processos de extração do pipeline: só mede, quem registra é o processo principal.
+    inicio = time.perf_counter()
+    registros, rejeitados = extrair_pedidos_lote(pedidos_json)
+    return registros, rejeitados, time.perf_counter() - inicio
+
+def _registrar_rejeitados(rejeitados):
+    if not rejeitados:
+        return
+    PEDIDOS_REJEITADOS.inc(len(rejeitados))
+    _execucao.rejeitados = getattr(_execucao, 'rejeitados', 0) + len(rejeitados)
+    exemplos = ', '.join(f"{type(erro).__name__}: {erro}" for _, erro in rejeitados[:3])
+    logger.warning(f"{len(rejeitados)} pedidos malformados descartados na extração ({exemplos}).")
+
+def extrair_pedidos(pedidos_json):
+    pedidos, rejeitados, duracao = _extrair_cronometrado(pedidos_json)
+    _registrar_extraidos(len(pedidos), duracao)
+    _registrar_rejeitados(rejeitados)
+    return pedidos
+
+def _registrar_execucao(modo, periodo, iniciado_em, duracao, resultado):
+    global tabela_execucoes_pronta
+    sucesso = resultado is not None
+    EXECUCOES.inc(modo=modo, resultado='sucesso' if sucesso else 'falha')
+    EXECUCAO_SEGUNDOS.observar(duracao, modo=modo)
+    if sucesso:
+        ULTIMO_SUCESSO.definir(time.time(), modo=modo)
+
+    resultado = resultado or {}
+    execucao = {
+        'modo': modo, 'periodo': periodo, 'iniciado_em': iniciado_em, 'duracao_s': duracao, 'sucesso': sucesso,
+        'inseridos': resultado.get('inseridos'), 'alterados': resultado.get('alterados'),
+        'inalterados': resultado.get('inalterados'), 'rejeitados': getattr(_execucao, 'rejeitados', 0),
+        'tempos': resultado.get('tempos'),
+    }
+    conn = None
+    try:
+        conn = get_conn()
+        if not tabela_execucoes_pronta:
+            garantir_tabela_execucoes(conn)
+            tabela_execucoes_pronta = True
+        registrar_execucao(conn, execucao)
+    except Exception as e:
+        logger.warning(f"Não foi possível registrar a execução no histórico: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            put_conn(conn)
+
+def _instrumentar_execucao(modo):
+    """Registra duração e resultado de cada execução nas métricas e na tabela execucoes_ingestao."""
+    def decorador(funcao):
+        assinatura = inspect.signature(funcao)
+
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            # Lido por nome: tamanho_chunk, paralelismo e afins não entram no período.
+            argumentos = assinatura.bind(*args, **kwargs).arguments
+            if 'data_inicio' in argumentos:
+                periodo = f"{argumentos['data_inicio']} a {argumentos['data_fim']}"
+            else:
+                periodo = argumentos.get('periodo') or date.today().isoformat()
+            _execucao.rejeitados = 0
+            iniciado_em = datetime.now(timezone.utc)
+            inicio = time.perf_counter()
+            resultado = None
+            try:
+                resultado = funcao(*args, **kwargs)
+                return resultado
+            finally:
+                _registrar_execucao(modo, periodo, iniciado_em, time.perf_counter() - inicio, resultado)
+        return executar
+    return decorador
+
+def _esquecer_validadores_se_falhar(funcao):
+    """Descarta os validadores HTTP do período se a ingestão falhar ou levantar exceção.
+
+    Sem isso, a próxima busca do período receberia 304 e os pedidos baixados
+    nesta execução nunca chegariam ao banco.
+    """
+    @functools.wraps(funcao)
+    def executar(periodo=None, *args, **kwargs):
+        periodo = periodo or date.today().isoformat()
+        resultado = None
+        try:
+            resultado = funcao(periodo, *args, **kwargs)
+            return resultado
+        finally:
+            if resultado is None:
+                get_cliente().esquecer(periodo)
+    return executar
+
+@_instrumentar_execucao('diaria')
+@_esquecer_validadores_se_falhar
+def processar_pedidos(periodo=None):
+    pedidos_json = buscar_pedidos(periodo)
+
+    if pedidos_json is NAO_MODIFICADO:
+        return {'inseridos': 0, 'alterados': 0, 'inalterados': 0}
 
     if not isinstance(pedidos_json, list):
         logger.warning("Resposta da API não é uma lista.")
-        return
+        return None
 
-    pedidos = [extrair_dados_pedido(p) for p in pedidos_json]
-    pedidos = [p for p in pedidos if p]
+    pedidos = extrair_pedidos(pedidos_json)
 
     if not pedidos:
         logger.info("Nenhum pedido processado.")
-        return
+        return {'inseridos': 0, 'alterados': 0, 'inalterados': 0}
+
+    conn = _obter_conexao()
+    if conn is None:
+        return None
+
+    try:
+        resultado = gravar_pedidos(conn, pedidos)
+        if resultado is None:
+            return None
 
-    conn = get_conn()
-    if not conn:
-        logger.error("Não foi possível obter conexão com o banco.")
+        logger.info(f"Pedidos inseridos: {resultado['inseridos']}")
+        logger.info(f"Status atualizados: {resultado['alterados']}")
+        logger.info(f"Pedidos sem alteração: {resultado['inalterados']}")
+        _log_metricas_api()
+        _finalizar_fingerprints(conn)
+        _finalizar_snapshot(conn)
+        return resultado
+    finally:
+        _finalizar_rollups(conn)
+        put_conn(conn)
+
+def _log_metricas_api():
+    metricas = get_cliente().metricas()
+    logger.info(
+        f"API: {metricas['requisicoes']} requisições, {metricas['bytes_transferidos']} bytes transferidos, "
+        f"{metricas['cache_hits']} respostas 304, {metricas['conexoes_reutilizadas']} conexões reutilizadas"
+    )
+
+def _chunks_extraidos(pedidos_json, tamanho, rejeitados):
+    chunk = []
+    for pedido in iterar_pedidos_extraidos(pedidos_json, rejeitados):
+        chunk.append(pedido)
+        if len(chunk) >= tamanho:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@_instrumentar_execucao('stream')
+@_esquecer_validadores_se_falhar
+def processar_pedidos_stream(periodo=None, tamanho_chunk=TAMANHO_CHUNK_STREAM):
+    # Busca, extrai e grava em chunks de tamanho fixo: a memória fica limitada
+    # a um chunk e as primeiras linhas chegam ao banco antes do fim do download.
+    conn = _obter_conexao()
+    if conn is None:
+        return None
+
+    resumo = {'inseridos': 0, 'alterados': 0, 'inalterados': 0}
+    rejeitados = []
+    try:
+        pedidos_json = buscar_pedidos_stream(periodo)
+        if pedidos_json is NAO_MODIFICADO:
+            return resumo
+
+        for chunk in _chunks_extraidos(pedidos_json, tamanho_chunk, rejeitados):
+            _registrar_extraidos(len(chunk))
+            resultado = gravar_pedidos(conn, chunk)
+            if resultado is None:
+                logger.error("Falha ao gravar chunk; interrompendo a ingestão em streaming.")
+                return None
+            for chave in resumo:
+                resumo[chave] += resultado[chave]
+        _finalizar_fingerprints(conn)
+        _finalizar_snapshot(conn)
+    except ErroAPI as e:
+        logger.error(f"Ingestão em streaming interrompida: {e}")
+        return None
+    finally:
+        _finalizar_rollups(conn)
+        put_conn(conn)
+        _registrar_rejeitados(rejeitados)
+
+    logger.info(f"Pedidos inseridos: {resumo['inseridos']}")
+    logger.info(f"Status atualizados: {resumo['alterados']}")
+    logger.info(f"Pedidos sem alteração: {resumo['inalterados']}")
+    _log_metricas_api()
+    return resumo
+
+class ErroGravacao(Exception):
+    """Falha ao gravar um lote no banco; interrompe o pipeline."""
+
+def _lotes(itens, tamanho):
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+@_instrumentar_execucao('pipeline')
+@_esquecer_validadores_se_falhar
+def processar_pedidos_pipeline(periodo=None, tamanho_chunk=TAMANHO_CHUNK_STREAM, extratores=PIPELINE_EXTRATORES):
+    # Download, extração e gravação rodam ao mesmo tempo, ligados por filas
+    # limitadas: enquanto um lote é gravado, o próximo é extraído e o seguinte baixado.
+    conn = _obter_conexao()
+    if conn is None:
+        return None
+
+    resumo = {'inseridos': 0, 'alterados': 0, 'inalterados': 0}
+    rejeitados = []
+
+    def gravar(extraido):
+        pedidos, rejeitados_lote, duracao = extraido
+        _registrar_extraidos(len(pedidos), duracao)
+        rejeitados.extend(rejeitados_lote)
+        if not pedidos:
+            return
+        resultado = gravar_pedidos(conn, pedidos)
+        if resultado is None:
+            raise ErroGravacao("falha ao gravar lote")
+        for chave in resumo:
+            resumo[chave] += resultado[chave]
+
+    try:
+        pedidos_json = buscar_pedidos_stream(periodo)
+        if pedidos_json is NAO_MODIFICADO:
+            return resumo
+
+        tempos = executar_pipeline(_lotes(pedidos_json, tamanho_chunk), _extrair_cronometrado, gravar, extratores=extratores)
+        _finalizar_fingerprints(conn)
+        _finalizar_snapshot(conn)
+    except (ErroAPI, ErroGravacao) as e:
+        logger.error(f"Ingestão em pipeline interrompida: {e}")
+        return None
+    finally:
+        _finalizar_rollups(conn)
+        put_conn(conn)
+        _registrar_rejeitados(rejeitados)
+
+    logger.info(
+        f"Pipeline em {tempos['total']:.2f}s: busca {tempos['busca']:.2f}s, "
+        f"extração {tempos['extracao']:.2f}s, gravação {tempos['gravacao']:.2f}s"
+    )
+    logger.info(f"Pedidos inseridos: {resumo['inseridos']}")
+    logger.info(f"Status atualizados: {resumo['alterados']}")
+    logger.info(f"Pedidos sem alteração: {resumo['inalterados']}")
+    _log_metricas_api()
+    return {**resumo, 'tempos': tempos}
+
+def _gravar_dia(conn, dia, pedidos_json, resumo):
+    if not isinstance(pedidos_json, list):
+        logger.warning(f"Backfill {dia}: resposta da API inválida, dia não será marcado como concluído.")
+        resumo['falhas'].append(dia.isoformat())
         return
 
+    pedidos = extrair_pedidos(pedidos_json)
+    if pedidos:
+        resultado = gravar_pedidos(conn, pedidos)
+        if resultado is None:
+            logger.warning(f"Backfill {dia}: falha ao gravar, dia não será marcado como concluído.")
+            resumo['falhas'].append(dia.isoformat())
+            return
+        for chave in ('inseridos', 'alterados', 'inalterados'):
+            resumo[chave] += resultado[chave]
+
+    registrar_dia_concluido(conn, dia, len(pedidos))
+    resumo['dias_processados'] += 1
+    logger.info(f"Backfill {dia}: {len(pedidos)} pedidos gravados.")
+
+@_instrumentar_execucao('backfill')
+def processar_backfill(data_inicio, data_fim, paralelismo=BACKFILL_PARALELISMO, ignorar_checkpoint=False):
+    if data_inicio > data_fim:
+        raise ValueError("A data inicial do backfill deve ser anterior ou igual à data final.")
+
+    conn = _obter_conexao()
+    if conn is None:
+        return None
+
+    try:
+        garantir_tabela_checkpoint(conn)
+        concluidos = set() if ignorar_checkpoint else dias_concluidos(conn, data_inicio, data_fim)
+        total_dias = (data_fim - data_inicio).days + 1
+        dias = [data_inicio + timedelta(days=i) for i in range(total_dias)]
+        dias = [d for d in dias if d not in concluidos]
+
+        logger.info(
+            f"Backfill de {data_inicio} a {data_fim}: {len(dias)} dias pendentes, "
+            f"{len(concluidos)} já concluídos, paralelismo {paralelismo}."
+        )
+
+        resumo = {
+            'dias_processados': 0, 'dias_ignorados': len(concluidos), 'falhas': [],
+            'inseridos': 0, 'alterados': 0, 'inalterados': 0,
+        }
+
+        # As buscas rodam em paralelo; a gravação fica na thread principal, com a
+        # mesma conexão. A janela limita quantos dias baixados aguardam gravação.
+        with ThreadPoolExecutor(max_workers=paralelismo) as executor:
+            em_andamento = {}
+            for dia in dias:
+                em_andamento[executor.submit(buscar_pedidos, dia.isoformat(), condicional=False)] = dia
+                if len(em_andamento) >= paralelismo * 2:
+                    prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                    for futuro in prontos:
+                        _gravar_dia(conn, em_andamento.pop(futuro), futuro.result(), resumo)
+
+            for futuro in as_completed(em_andamento):
+                _gravar_dia(conn, em_andamento[futuro], futuro.result(), resumo)
+
+        logger.info(
+            f"Backfill concluído: {resumo['dias_processados']} dias, "
+            f"{resumo['inseridos']} inseridos, {resumo['alterados']} alterados, "
+            f"{len(resumo['falhas'])} dias com falha."
+        )
+        _log_metricas_api()
+        _finalizar_fingerprints(conn)
+        _finalizar_snapshot(conn)
+        return resumo
+    finally:
+        _finalizar_rollups(conn)
+        put_conn(conn)
+
+def migrar_particionamento(tamanho_lote=None):
+    """Migra a tabela pedidos antiga para a particionada por mês, em lotes e sem parar a ingestão."""
+    conn = _obter_conexao()
+    if conn is None:
+        return None
     try:
-        inseridos = inserir_pedidos_batch(conn, pedidos)
-        atualizados = atualizar_status_pedidos(conn, pedidos)
+        kwargs = {'tamanho_lote': tamanho_lote} if tamanho_lote else {}
+        return migrar_para_particionada(conn, **kwargs)
+    finally:
+        put_conn(conn)
 
-        logger.info(f"Pedidos inseridos: {inseridos}")
-        logger.info(f"Status atualizados: {atualizados}")
+def reconstruir_snapshot():
+    """Regrava o snapshot local de todos os meses a partir do banco."""
+    conn = _obter_conexao()
+    if conn is None:
+        return None
+    try:
+        meses = SnapshotPedidos().reconstruir(conn)
+        logger.info(f"Snapshot local reconstruído: {meses} meses.")
+        return meses
     finally:
         put_conn(conn)
@@ -0,0 +1,224 @@
+import os
+import logging
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from config import carregar_env
+
+carregar_env()
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ATIVO = os.getenv('SNAPSHOT_ATIVO', '1') == '1'
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '.snapshot_pedidos')
+
+COLUNAS_SNAPSHOT = [
+    'numero_pedido', 'status', 'franqueado', 'fornecedor', 'data_pedido', 'mes_pedido', 'valor_pedido', 'atualizado_em',
+]
+ARQUIVO_PARTICAO = 'pedidos.parquet'
+CHAVE_WATERMARK = b'watermark'
+# Folga na busca do que mudou: atualizado_em é a hora de início da transação,
+# que pode ter confirmado depois da marca. Reaplicar a folga não duplica nada,
+# porque a mescla substitui os pedidos por numero_pedido.
+MARGEM_MESCLA = timedelta(minutes=5)
+
+class SnapshotPedidos:
+    """Cópia colunar local da tabela pedidos, um arquivo Parquet por mês (`ano_mes=AAAA-MM/`).
+
+    Cada partição guarda nos metadados a marca d'água do banco no momento em que
+    foi gerada; quem lê busca no banco só o que mudou depois dela. A ingestão
+    marca os meses que tocou e, ao fim de cada execução, mescla nas partições
+    existentes só os pedidos alterados desde a marca delas, substituindo o
+    arquivo de forma atômica: leitores veem sempre a versão antiga ou a nova.
+    """
+
+    def __init__(self, diretorio=SNAPSHOT_DIR):
+        self.diretorio = diretorio
+        self._pendentes = set()
+        self._lock = threading.Lock()
+
+    def caminho(self, ano_mes):
+        return os.path.join(self.diretorio, f'ano_mes={ano_mes}', ARQUIVO_PARTICAO)
+
+    def meses(self):
+        if not os.path.isdir(self.diretorio):
+            return []
+        return sorted(
+            nome.split('=', 1)[1] for nome in os.listdir(self.diretorio)
+            if nome.startswith('ano_mes=') and os.path.exists(os.path.join(self.diretorio, nome, ARQUIVO_PARTICAO))
+        )
+
+    def marcar(self, meses):
+        with self._lock:
+            self._pendentes.update(meses)
+
+    def sincronizar(self, conn):
+        """Atualiza os meses marcados desde a última sincronização; devolve quantos foram marcados."""
+        with self._lock:
+            meses, self._pendentes = self._pendentes, set()
+        if not meses:
+            return 0
+        try:
+            watermarks = {ano_mes: self.watermark(ano_mes) for ano_mes in meses}
+            existentes = {ano_mes: marca for ano_mes, marca in watermarks.items() if marca is not None}
+            if existentes:
+                self.mesclar_meses(conn, existentes)
+            self.atualizar_meses(conn, set(meses) - set(existentes))
+        except Exception:
+            # Ficam para a próxima execução; até lá, os leitores completam pelo banco.
+            self.marcar(meses)
+            raise
+        return len(meses)
+
+    def reconstruir(self, conn):
+        """Gera as partições de todos os meses existentes no banco."""
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT to_char(data_pedido, 'YYYY-MM') FROM pedidos WHERE data_pedido IS NOT NULL;")
+            meses = {linha[0] for linha in cur.fetchall()}
+        conn.rollback()
+        self.atualizar_meses(conn, meses)
+        return len(meses)
+
+    def watermark(self, ano_mes):
+        """Marca d'água gravada na partição do mês, ou None se ela não existe."""
+        import pyarrow.parquet as pq
+
+        caminho = self.caminho(ano_mes)
+        if not os.path.exists(caminho):
+            return None
+        metadados = pq.read_schema(caminho).metadata or {}
+        if CHAVE_WATERMARK not in metadados:
+            return None
+        return datetime.fromisoformat(metadados[CHAVE_WATERMARK].decode())
+
+    def mesclar_meses(self, conn, watermarks):
+        """Aplica às partições existentes os pedidos alterados depois da marca de cada uma.
+
+        `watermarks` é {ano_mes: marca d'água da partição}. Uma única consulta,
+        pelo índice de atualizado_em, traz o que mudou em qualquer mês desde a
+        marca mais antiga; cada partição perde as linhas desses pedidos (inclusive
+        os que mudaram de data para outro mês) e recebe as do seu mês. Partições
+        sem nada a mudar não são regravadas.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        colunas = ', '.join(f'p.{coluna}' for coluna in COLUNAS_SNAPSHOT)
+        try:
+            alterados = pd.read_sql(
+                f"""
+                WITH marca AS (SELECT max(atualizado_em) AS watermark FROM pedidos)
+                SELECT marca.watermark, {colunas}
+                FROM marca
+                LEFT JOIN pedidos p ON p.atualizado_em > %(desde)s
+                ORDER BY p.data_pedido;
+                """,
+                conn,
+                params={'desde': min(watermarks.values()) - MARGEM_MESCLA},
+            )
+        finally:
+            conn.rollback()
+        watermark = alterados['watermark'].iloc[0]
+        alterados = alterados[alterados['numero_pedido'].notna()].drop(columns='watermark')
+        alterados_mes = pd.to_datetime(alterados['data_pedido']).dt.strftime('%Y-%m')
+        chaves_alteradas = list(zip(alterados['numero_pedido'], pd.to_datetime(alterados['atualizado_em'], utc=True)))
+
+        for ano_mes in sorted(watermarks):
+            tabela = pq.read_table(self.caminho(ano_mes))
+            atual = tabela.to_pandas()
+            # Linhas da folga que a partição já tem, com o mesmo atualizado_em, não são mudança.
+            gravadas = set(zip(atual['numero_pedido'], pd.to_datetime(atual['atualizado_em'], utc=True)))
+            novos = pd.Series([chave not in gravadas for chave in chaves_alteradas], index=alterados.index, dtype=bool)
+            saindo = atual['numero_pedido'].isin(alterados.loc[novos, 'numero_pedido'])
+            entrando = alterados[novos & (alterados_mes == ano_mes)]
+            if not saindo.any() and entrando.empty:
+                continue
+            df = pd.concat([atual[~saindo], entrando], ignore_index=True)
+            df = df.sort_values('data_pedido', kind='stable', ignore_index=True)
+
+            # Partição gravada vazia não tem tipos confiáveis nas colunas; aí vale o dos alterados.
+            mesclada = pa.Table.from_pandas(df, schema=tabela.schema if tabela.num_rows else None, preserve_index=False)
+            metadados = dict(mesclada.schema.metadata or {})
+            if pd.notna(watermark):
+                metadados[CHAVE_WATERMARK] = pd.Timestamp(watermark).isoformat().encode()
+            self._gravar_atomico(pq, mesclada.replace_schema_metadata(metadados), ano_mes)
+            logger.info(f"Snapshot {ano_mes}: {int(saindo.sum())} pedidos substituídos ou removidos, {len(entrando)} gravados.")
+
+    def atualizar_meses(self, conn, meses):
+        """Gera do zero, lendo o mês inteiro do banco, as partições dos meses."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for ano_mes in sorted(meses):
+            inicio = date(int(ano_mes[:4]), int(ano_mes[5:7]), 1)
+            fim = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+            # Marca d'água e pedidos no mesmo comando, portanto na mesma fotografia
+            # do banco; o LEFT JOIN garante a linha da marca mesmo em mês vazio.
+            colunas = ', '.join(f'p.{coluna}' for coluna in COLUNAS_SNAPSHOT)
+            try:
+                df = pd.read_sql(
+                    f"""
+                    WITH marca AS (SELECT max(atualizado_em) AS watermark FROM pedidos)
+                    SELECT marca.watermark, {colunas}
+                    FROM marca
+                    LEFT JOIN pedidos p ON p.data_pedido >= %(inicio)s AND p.data_pedido < %(fim)s
+                    ORDER BY p.data_pedido;
+                    """,
+                    conn,
+                    params={'inicio': inicio, 'fim': fim},
+                )
+            finally:
+                conn.rollback()
+            watermark = df['watermark'].iloc[0] if len(df) else None
+            df = df[df['numero_pedido'].notna()].drop(columns='watermark').reset_index(drop=True)
+
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            metadados = dict(tabela.schema.metadata or {})
+            if pd.notna(watermark):
+                metadados[CHAVE_WATERMARK] = pd.Timestamp(watermark).isoformat().encode()
+            self._gravar_atomico(pq, tabela.replace_schema_metadata(metadados), ano_mes)
+            logger.info(f"Snapshot {ano_mes}: {len(df)} pedidos gravados.")
+
+    def _gravar_atomico(self, pq, tabela, ano_mes):
+        destino = self.caminho(ano_mes)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix='.tmp')
+        os.close(descritor)
+        try:
+            pq.write_table(tabela, temporario, compression='zstd')
+            os.replace(temporario, destino)
+        except Exception:
+            os.unlink(temporario)
+            raise
+
+    def ler(self, meses, colunas):
+        """Lê só as partições e colunas pedidas, com memory-map.
+
+        Devolve (DataFrame, marca d'água mais antiga entre as partições) ou None
+        se algum mês ainda não estiver no snapshot.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tabelas, watermarks = [], []
+        for ano_mes in meses:
+            caminho = self.caminho(ano_mes)
+            if not os.path.exists(caminho):
+                return None
+            arquivo = pq.ParquetFile(caminho, memory_map=True)
+            metadados = arquivo.schema_arrow.metadata or {}
+            if CHAVE_WATERMARK not in metadados:
+                return None
+            watermarks.append(datetime.fromisoformat(metadados[CHAVE_WATERMARK].decode()))
+            tabela = arquivo.read(columns=colunas)
+            if tabela.num_rows:
+                tabelas.append(tabela)
+
+        if not watermarks:
+            return None
+        if not tabelas:
+            return pd.DataFrame(columns=colunas), min(watermarks)
+        tabela = pa.concat_tables(tabelas, promote_options='default')
+        return tabela.to_pandas(), min(watermarks)
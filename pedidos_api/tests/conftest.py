@@ -0,0 +1,38 @@
+import os
+import sys
+from functools import lru_cache
+
+import pytest
+
+# Os módulos ficam soltos em pedidos_api/ e se importam pelo nome, como ao
+# rodar `python main.py` a partir dela.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@lru_cache(maxsize=None)
+def _postgres_disponivel():
+    import psycopg2
+    from db import parametros_conexao
+
+    try:
+        psycopg2.connect(connect_timeout=3, **parametros_conexao(os.getenv('DB_NAME') or 'postgres')).close()
+        return True
+    except psycopg2.Error:
+        return False
+
+@pytest.fixture
+def banco(monkeypatch):
+    """Banco vazio e descartável, apontado por DB_NAME e pelo pool de db; pula o teste sem PostgreSQL."""
+    if not _postgres_disponivel():
+        pytest.skip("PostgreSQL indisponível (variáveis DB_*).")
+    import db
+
+    with db.banco_descartavel('teste_pedidos') as nome:
+        monkeypatch.setenv('DB_NAME', nome)
+        monkeypatch.setattr(db, 'connection_pool', None)
+        db.esquecer_particoes()
+        try:
+            yield nome
+        finally:
+            if db.connection_pool is not None:
+                db.connection_pool.closeall()
+            db.esquecer_particoes()
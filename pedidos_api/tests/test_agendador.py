@@ -0,0 +1,82 @@
+from datetime import date
+
+import agendador
+from agendador import AgendadorIngestao
+
+class _JobsFalsos:
+    """Conclui cada submissão com `n` pedidos alterados, tirados da fila, ou falha quando `n` é None."""
+    def __init__(self, *mudancas):
+        self.mudancas = list(mudancas)
+        self.chaves = []
+        self._jobs = {}
+
+    def submeter(self, chave, funcao, *args):
+        self.chaves.append(chave)
+        n = self.mudancas.pop(0)
+        job = {'id': len(self.chaves), 'status': 'falhou', 'resultado': None}
+        if n is not None:
+            job.update(status='concluido', resultado={'inseridos': 0, 'alterados': n, 'inalterados': 0})
+        self._jobs[job['id']] = job
+        return job, True
+
+    def aguardar(self, job_id, timeout=None):
+        return self._jobs[job_id]
+
+def _agendador(jobs):
+    return AgendadorIngestao(jobs, intervalo_min=60, intervalo_max=480, limite_mudancas=50)
+
+def test_sem_mudancas_dobra_o_intervalo_ate_o_maximo():
+    polling = _agendador(_JobsFalsos(0, 0, 0, 0, 0))
+
+    intervalos = []
+    for _ in range(5):
+        polling.executar()
+        intervalos.append(polling.intervalo)
+
+    assert intervalos == [120, 240, 480, 480, 480]
+
+def test_muitas_mudancas_reduzem_o_intervalo_ate_o_minimo():
+    polling = _agendador(_JobsFalsos(500, 50, 50))
+    polling.intervalo = 200
+
+    intervalos = []
+    for _ in range(3):
+        polling.executar()
+        intervalos.append(polling.intervalo)
+
+    assert intervalos == [100, 60, 60]
+
+def test_poucas_mudancas_mantem_o_intervalo():
+    polling = _agendador(_JobsFalsos(10))
+    polling.intervalo = 240
+
+    polling.executar()
+
+    assert (polling.intervalo, polling.ultimas_mudancas) == (240, 10)
+
+def test_falha_afasta_o_proximo_polling_e_nao_marca_o_dia():
+    polling = _agendador(_JobsFalsos(None))
+
+    polling.executar()
+
+    assert (polling.intervalo, polling.ultimas_mudancas) == (120, None)
+    assert polling.ultimo_periodo is None and polling.ultimo_sucesso is None
+
+def test_virada_do_dia_passa_uma_ultima_vez_no_dia_anterior(monkeypatch):
+    class _Hoje(date):
+        atual = date(2025, 6, 1)
+
+        @classmethod
+        def today(cls):
+            return cls.atual
+
+    monkeypatch.setattr(agendador, 'date', _Hoje)
+    jobs = _JobsFalsos(0, 3, 7)
+    polling = _agendador(jobs)
+
+    polling.executar()
+    _Hoje.atual = date(2025, 6, 2)
+    polling.executar()
+
+    assert jobs.chaves == ['rodar-pedidos:2025-06-01', 'rodar-pedidos:2025-06-01', 'rodar-pedidos:2025-06-02']
+    assert (polling.ultimo_periodo, polling.ultimas_mudancas) == (date(2025, 6, 2), 7)
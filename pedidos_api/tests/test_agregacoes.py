@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from agregacoes import build_filtered_periods, compute_general_tab, select_dimensions, slice_by_date
+from consultas import agregar_pedidos, compactar_pedidos
+
+def _pedidos():
+    df = pd.DataFrame({
+        'numero_pedido': [1, 2, 3, 4],
+        'status': ['FINALIZADO', 'CANCELADO', 'FINALIZADO', 'FINALIZADO'],
+        'franqueado': ['Franqueado A', 'Franqueado B', 'Franqueado A [Excluído]', 'Franqueado B'],
+        'fornecedor': ['F1', 'F1', 'F2', 'F2'],
+        'data_pedido': pd.to_datetime(['2025-05-31 23:59', '2025-06-01 00:00', '2025-06-30 23:59', '2025-07-01 00:00']),
+        'valor_pedido': [10.0, 20.0, 30.0, 40.0],
+    })
+    df['ano_mes'] = df['data_pedido'].dt.to_period('M').astype(str)
+    return compactar_pedidos(df)
+
+def test_recorte_por_data_inclui_o_dia_final_sem_copiar():
+    df = _pedidos()
+
+    recorte = slice_by_date(df, pd.Timestamp('2025-06-01'), pd.Timestamp('2025-06-30'))
+
+    assert list(recorte['numero_pedido']) == [2, 3]
+    assert np.shares_memory(recorte['valor_pedido'].to_numpy(), df['valor_pedido'].to_numpy())
+
+def test_selecoes_vazias_devolvem_o_proprio_recorte():
+    df = _pedidos()
+
+    assert select_dimensions(df, (('franqueado', ()), ('status', ()))) is df
+    filtrado = select_dimensions(df, (('franqueado', ('Franqueado B', 'Inexistente')), ('status', ())))
+    assert list(filtrado['numero_pedido']) == [2, 4]
+
+def test_fatos_juntam_rollups_dos_meses_completos_e_pedidos_dos_parciais():
+    df = _pedidos()
+    pedidos_mes, rollups = [], []
+
+    def load_rollup(months):
+        rollups.append(months)
+        return agregar_pedidos(df[df['ano_mes'].isin(months)])
+
+    def load_month(start, end):
+        pedidos_mes.append((start.isoformat(), end.isoformat()))
+        return slice_by_date(df, start, end)
+
+    atual, anterior = build_filtered_periods(
+        [(pd.Timestamp('2025-06-01'), pd.Timestamp('2025-07-10')), (pd.Timestamp('2025-05-31'), pd.Timestamp('2025-05-30'))],
+        (('franqueado', ()), ('fornecedor', ('F2',)), ('status', ())),
+        load_rollup, load_month,
+    )
+
+    assert rollups == [('2025-06',)]
+    assert pedidos_mes == [('2025-07-01', '2025-07-31')]
+    assert anterior.empty
+    assert sorted(zip(atual['ano_mes'].astype(str), atual['valor_total'])) == [('2025-06', 30.0), ('2025-07', 40.0)]
+    df_monthly, df_suppliers, _ = compute_general_tab(atual)
+    assert list(df_monthly['total_pedidos']) == [1, 1]
+    assert list(df_suppliers['fornecedor']) == ['F2']
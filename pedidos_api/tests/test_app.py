@@ -0,0 +1,166 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+import db
+import metricas
+from migracoes import aplicar_migracoes
+
+class _ConexaoFalsa:
+    def rollback(self):
+        pass
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(db, 'get_conn', lambda timeout=None: _ConexaoFalsa())
+    monkeypatch.setattr(db, 'put_conn', lambda conn, descartar=False: None)
+    # Sem o lifespan: nem preaquecimento nem agendador.
+    return TestClient(app_module.app, raise_server_exceptions=False)
+
+def _falhar_com(erro):
+    def listar(*args, **kwargs):
+        raise erro
+    return listar
+
+@pytest.mark.parametrize('rota, funcao', [
+    ('/execucoes', 'listar_execucoes'),
+    ('/pedidos/mudancas', 'listar_mudancas_status'),
+])
+def test_tabela_inexistente_responde_404(cliente, monkeypatch, rota, funcao):
+    monkeypatch.setattr(db, funcao, _falhar_com(psycopg2.errors.UndefinedTable('relation does not exist')))
+
+    assert cliente.get(rota).status_code == 404
+
+@pytest.mark.parametrize('rota, funcao', [
+    ('/execucoes', 'listar_execucoes'),
+    ('/pedidos/mudancas', 'listar_mudancas_status'),
+])
+@pytest.mark.parametrize('erro', [
+    psycopg2.OperationalError('server closed the connection unexpectedly'),
+    psycopg2.errors.SyntaxError('syntax error at or near "FORM"'),
+])
+def test_outras_falhas_do_banco_nao_viram_404(cliente, monkeypatch, rota, funcao, erro):
+    monkeypatch.setattr(db, funcao, _falhar_com(erro))
+
+    assert cliente.get(rota).status_code == 500
+
+def test_pool_esgotado_responde_503(cliente, monkeypatch):
+    def esgotado(timeout=None):
+        raise db.ErroPool('pool esgotado')
+    monkeypatch.setattr(db, 'get_conn', esgotado)
+
+    assert cliente.get('/execucoes').status_code == 503
+
+AMOSTRA = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? (\S+)$')
+
+def test_metrics_no_formato_texto_do_prometheus(cliente):
+    resposta = cliente.get('/metrics')
+
+    assert resposta.status_code == 200
+    assert resposta.headers['content-type'].startswith('text/plain; version=0.0.4')
+    ajudas, tipos, amostras = [], {}, []
+    for linha in resposta.text.splitlines():
+        if linha.startswith('# HELP '):
+            ajudas.append(linha.split()[2])
+        elif linha.startswith('# TYPE '):
+            _, _, nome, tipo = linha.split()
+            assert nome not in tipos, f'{nome} declarada duas vezes'
+            tipos[nome] = tipo
+        else:
+            casamento = AMOSTRA.match(linha)
+            assert casamento, f'linha inválida: {linha!r}'
+            float(casamento.group(3))
+            amostras.append(casamento.group(1))
+
+    assert sorted(ajudas) == sorted(tipos)
+    assert {'pedidos_execucoes_total', 'pedidos_api_bytes_total', 'pedidos_pool_conexoes'} <= set(tipos)
+    for nome in amostras:
+        base = re.sub(r'_(bucket|sum|count)$', '', nome) if nome not in tipos else nome
+        assert base in tipos, f'amostra {nome} sem # TYPE'
+        assert nome == base or tipos[base] == 'histogram'
+
+def test_histograma_acumula_os_buckets():
+    registro = metricas.Registro()
+    latencia = registro.registrar(metricas.Histograma('teste_latencia_segundos', 'Latência.', ('etapa',), buckets=(0.1, 1)))
+    for valor in (0.05, 0.5, 0.7, 3):
+        latencia.observar(valor, etapa='gravar "lote"')
+
+    assert registro.expor().splitlines()[2:] == [
+        'teste_latencia_segundos_bucket{etapa="gravar \\"lote\\"",le="0.1"} 1',
+        'teste_latencia_segundos_bucket{etapa="gravar \\"lote\\"",le="1"} 3',
+        'teste_latencia_segundos_bucket{etapa="gravar \\"lote\\"",le="+Inf"} 4',
+        'teste_latencia_segundos_sum{etapa="gravar \\"lote\\""} 4.25',
+        'teste_latencia_segundos_count{etapa="gravar \\"lote\\""} 4',
+    ]
+
+@pytest.fixture
+def cliente_real(banco):
+    """Cliente da API ligado a um banco temporário já migrado."""
+    conn = db.get_conn()
+    try:
+        aplicar_migracoes(conn)
+    finally:
+        db.put_conn(conn)
+    return TestClient(app_module.app)
+
+def _pedido(numero, status='Aprovado'):
+    return (numero, status, 'Franqueado A', 'Fornecedor B', datetime(2025, 5, 10), 'Maio', 100)
+
+def _gravar(pedidos):
+    conn = db.get_conn()
+    try:
+        assert db.upsert_pedidos(conn, pedidos) is not None
+    finally:
+        db.put_conn(conn)
+
+def _ler_feed(cliente_real, desde, limite):
+    recebidas = []
+    while True:
+        pagina = cliente_real.get('/pedidos/mudancas', params={'desde': desde, 'limite': limite}).json()
+        recebidas += pagina['mudancas']
+        desde = pagina['proximo']
+        if not pagina['mais']:
+            return recebidas, desde
+
+def test_feed_de_status_lido_por_cursor_em_paginas(cliente_real):
+    _gravar([_pedido(f'P{i}') for i in range(5)])
+
+    primeiras, cursor = _ler_feed(cliente_real, 0, limite=2)
+    _gravar([_pedido('P1', 'Faturado'), _pedido('P3'), _pedido('P5')])
+    novas, cursor = _ler_feed(cliente_real, cursor, limite=2)
+
+    assert [(m['numero_pedido'], m['status_anterior'], m['status_novo']) for m in primeiras] == [
+        (f'P{i}', None, 'Aprovado') for i in range(5)
+    ]
+    assert [(m['numero_pedido'], m['status_anterior'], m['status_novo']) for m in novas] == [
+        ('P1', 'Aprovado', 'Faturado'), ('P5', None, 'Aprovado'),
+    ]
+    seqs = [m['seq'] for m in primeiras + novas]
+    assert seqs == sorted(set(seqs)) and cursor == seqs[-1]
+    assert _ler_feed(cliente_real, cursor, limite=2) == ([], cursor)
+
+def test_consumidor_nao_perde_mudancas_gravadas_em_paralelo(cliente_real):
+
+    def escritor(n):
+        for lote in range(10):
+            _gravar([_pedido(f'E{n}-{lote}-{i}') for i in range(20)])
+
+    recebidas, cursor = [], 0
+    with ThreadPoolExecutor(max_workers=3) as escritores:
+        futuros = [escritores.submit(escritor, n) for n in range(3)]
+        while not all(futuro.done() for futuro in futuros):
+            novas, cursor = _ler_feed(cliente_real, cursor, limite=50)
+            recebidas += novas
+        for futuro in futuros:
+            futuro.result()
+    novas, cursor = _ler_feed(cliente_real, cursor, limite=50)
+    recebidas += novas
+
+    seqs = [m['seq'] for m in recebidas]
+    assert seqs == sorted(set(seqs))
+    assert len({m['numero_pedido'] for m in recebidas}) == len(recebidas) == 3 * 10 * 20
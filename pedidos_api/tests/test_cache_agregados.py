@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from cache_agregados import CacheAgregados, chave_filtros, tamanho_estimado
+
+def _agregado(valor):
+    return pd.DataFrame({'valor_total': np.full(1000, float(valor))})
+
+TAMANHO = tamanho_estimado(_agregado(0))
+
+def test_remove_o_menos_usado_quando_passa_do_orcamento():
+    cache = CacheAgregados(orcamento_bytes=3 * TAMANHO)
+    for chave in 'abc':
+        cache.obter(chave, lambda: _agregado(1))
+    cache.obter('a', lambda: _agregado(2))
+
+    cache.obter('d', lambda: _agregado(1))
+
+    assert list(cache._itens) == ['c', 'a', 'd']
+    estatisticas = cache.estatisticas()
+    assert (estatisticas['hits'], estatisticas['misses'], estatisticas['removidos']) == (1, 4, 1)
+    assert estatisticas['bytes'] == 3 * TAMANHO <= estatisticas['orcamento_bytes']
+
+def test_agregado_maior_que_o_orcamento_nao_e_guardado():
+    cache = CacheAgregados(orcamento_bytes=TAMANHO - 1)
+    calculos = []
+
+    for _ in range(2):
+        valor = cache.obter('a', lambda: calculos.append(1) or _agregado(1))
+
+    assert valor.shape == (1000, 1)
+    assert len(calculos) == 2
+    assert cache.estatisticas()['bytes'] == 0
+
+def test_sessoes_concorrentes_esperam_um_unico_calculo():
+    cache = CacheAgregados(orcamento_bytes=10 * TAMANHO)
+    calculos = []
+
+    def calcular():
+        calculos.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return _agregado(1)
+
+    with ThreadPoolExecutor(max_workers=8) as sessoes:
+        valores = list(sessoes.map(lambda _: cache.obter('a', calcular), range(8)))
+
+    assert len(calculos) == 1
+    assert all(valor is valores[0] for valor in valores)
+
+def test_chave_ignora_a_ordem_das_selecoes_e_muda_com_a_versao():
+    periodos = [(date(2025, 1, 1), pd.Timestamp('2025-06-30 23:59'))]
+    chave = chave_filtros('geral', periodos, [('status', ['B', 'A'])], 'v1')
+
+    assert chave == chave_filtros('geral', [('2025-01-01', '2025-06-30')], [('status', ['A', 'B'])], 'v1')
+    assert chave != chave_filtros('geral', periodos, [('status', ['A', 'B'])], 'v2')
+    assert chave != chave_filtros('fornecedores', periodos, [('status', ['A', 'B'])], 'v1')
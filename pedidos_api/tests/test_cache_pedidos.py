@@ -0,0 +1,45 @@
+from datetime import date, datetime
+
+import pytest
+
+import db
+from cache_pedidos import JanelaPedidos
+from migracoes import aplicar_migracoes
+
+@pytest.fixture
+def conn(banco):
+    conn = db.get_conn()
+    try:
+        aplicar_migracoes(conn)
+        yield conn
+    finally:
+        db.put_conn(conn)
+
+def _pedido(numero, data, status='FINALIZADO'):
+    return (numero, status, 'Franqueado A', 'Fornecedor B', data, 'Maio', 100)
+
+def _numeros(df):
+    return sorted(str(numero) for numero in df['numero_pedido'])
+
+def _ler(janela):
+    # Como no dashboard: cada leitura em uma conexão do pool, devolvida em seguida.
+    conn = db.get_conn()
+    try:
+        return janela.obter(conn, db.ler_watermark(conn))
+    finally:
+        db.put_conn(conn)
+
+def test_pedido_movido_de_mes_sai_da_janela_antiga(conn):
+    db.upsert_pedidos(conn, [_pedido('1', datetime(2025, 5, 10)), _pedido('2', datetime(2025, 5, 20))])
+    maio = JanelaPedidos(date(2025, 5, 1), date(2025, 5, 31))
+    junho = JanelaPedidos(date(2025, 6, 1), date(2025, 6, 30))
+    assert _numeros(_ler(maio)) == ['1', '2']
+    assert _numeros(_ler(junho)) == []
+
+    resultado = db.upsert_pedidos(conn, [_pedido('1', datetime(2025, 6, 2), status='CANCELADO')])
+    assert resultado['meses_movidos'] == ['2025-05']
+
+    assert _numeros(_ler(maio)) == ['2']
+    df_junho = _ler(junho)
+    assert _numeros(df_junho) == ['1']
+    assert list(df_junho['status']) == ['CANCELADO']
@@ -0,0 +1,67 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import db
+import snapshot
+from migracoes import aplicar_migracoes
+
+DASH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dash.py')
+
+@pytest.fixture
+def dashboard(banco, monkeypatch):
+    """AppTest do dashboard contra o banco temporário, com os caches do Streamlit zerados."""
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_ATIVO', False)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield AppTest.from_file(DASH, default_timeout=60)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+def _tabelas(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' ORDER BY tablename;")
+        tabelas = [linha[0] for linha in cur.fetchall()]
+    conn.rollback()
+    return tabelas
+
+def test_abre_em_banco_ja_migrado(dashboard):
+    conn = db.get_conn()
+    try:
+        aplicar_migracoes(conn)
+        hoje = datetime.now().replace(microsecond=0)
+        pedidos = [
+            (f'P{i}', 'FINALIZADO', f'Franqueado {i % 3}', 'Fornecedor A', hoje - timedelta(days=i * 20), 'Mês', 100)
+            for i in range(8)
+        ]
+        assert db.upsert_pedidos(conn, pedidos)['inseridos'] == 8
+        db.atualizar_rollups_pendentes(conn)
+        antes = _tabelas(conn)
+    finally:
+        db.put_conn(conn)
+
+    dashboard.run()
+
+    assert not dashboard.exception
+    assert [m.label for m in dashboard.metric] == ["Total de Pedidos", "Valor Total", "Franqueados Ativos"]
+    assert dashboard.metric[0].value == '8'
+    conn = db.get_conn()
+    try:
+        assert _tabelas(conn) == antes
+    finally:
+        db.put_conn(conn)
+
+def test_banco_sem_migracoes_pede_a_ingestao_sem_alterar_o_schema(dashboard):
+    dashboard.run()
+
+    assert not dashboard.exception
+    assert not dashboard.metric
+    assert 'pedidos_mensal' in dashboard.info[0].value
+    conn = db.get_conn()
+    try:
+        assert _tabelas(conn) == []
+    finally:
+        db.put_conn(conn)
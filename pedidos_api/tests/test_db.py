@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+
+import db
+from migracoes import aplicar_migracoes
+
+DDL_PEDIDOS_ANTIGA = """
+    CREATE TABLE pedidos (
+        numero_pedido VARCHAR PRIMARY KEY,
+        status TEXT,
+        franqueado TEXT,
+        fornecedor TEXT,
+        data_pedido TIMESTAMP,
+        mes_pedido TEXT,
+        valor_pedido NUMERIC(14, 2)
+    );
+"""
+
+@pytest.fixture(params=['particionada', 'antiga'])
+def conn(request, banco):
+    """Conexão com um banco temporário, com pedidos particionada ou no formato antigo."""
+    conn = db.get_conn()
+    try:
+        if request.param == 'antiga':
+            with conn.cursor() as cur:
+                cur.execute(DDL_PEDIDOS_ANTIGA)
+            conn.commit()
+        aplicar_migracoes(conn)
+        yield conn
+    finally:
+        db.put_conn(conn)
+
+def _pedido(data, status='Aprovado', numero='P1'):
+    return (numero, status, 'Franqueado A', 'Fornecedor B', data, 'Maio', 100)
+
+def _linhas(conn, sql):
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        linhas = cur.fetchall()
+    conn.rollback()
+    return linhas
+
+def test_upsert_conta_inseridos_alterados_e_inalterados(conn):
+    maio = datetime(2025, 5, 10)
+    primeiro = db.upsert_pedidos(conn, [_pedido(maio, numero=f'P{i}') for i in range(5)], tamanho_lote=2)
+    assert (primeiro['inseridos'], primeiro['alterados'], primeiro['inalterados']) == (5, 0, 0)
+
+    # P0 e P1 mudam de status, P2 a P4 voltam iguais, P5 é novo e aparece
+    # duas vezes no lote (vale a última ocorrência); páginas de 2 linhas.
+    lote = [_pedido(maio, numero=f'P{i}', status='Faturado' if i < 2 else 'Aprovado') for i in range(5)]
+    lote += [_pedido(maio, numero='P5'), _pedido(maio, numero='P5', status='Cancelado')]
+    segundo = db.upsert_pedidos(conn, lote, tamanho_lote=2)
+
+    assert (segundo['inseridos'], segundo['alterados'], segundo['inalterados']) == (1, 2, 3)
+    assert _linhas(conn, "SELECT numero_pedido, status FROM pedidos ORDER BY numero_pedido;") == [
+        ('P0', 'Faturado'), ('P1', 'Faturado'), ('P2', 'Aprovado'),
+        ('P3', 'Aprovado'), ('P4', 'Aprovado'), ('P5', 'Cancelado'),
+    ]
+
+    terceiro = db.upsert_pedidos(conn, lote, tamanho_lote=2)
+    assert (terceiro['inseridos'], terceiro['alterados'], terceiro['inalterados']) == (0, 0, 6)
+
+@pytest.mark.parametrize('gravar', [db.upsert_pedidos, db.copiar_pedidos])
+def test_pedido_com_data_alterada_continua_com_uma_linha(conn, gravar):
+    outro = _pedido(datetime(2025, 5, 20), numero='P2')
+    assert gravar(conn, [_pedido(datetime(2025, 5, 10)), outro])['inseridos'] == 2
+
+    resultado = gravar(conn, [_pedido(datetime(2025, 6, 2), status='Faturado'), outro])
+
+    assert (resultado['inseridos'], resultado['alterados'], resultado['inalterados']) == (0, 1, 1)
+    assert resultado['meses_movidos'] == ['2025-05']
+    assert _linhas(conn, "SELECT numero_pedido, data_pedido, status FROM pedidos ORDER BY numero_pedido;") == [
+        ('P1', datetime(2025, 6, 2), 'Faturado'),
+        ('P2', datetime(2025, 5, 20), 'Aprovado'),
+    ]
+    assert _linhas(conn, "SELECT numero_pedido, data_pedido FROM pedidos_chaves ORDER BY numero_pedido;") == [
+        ('P1', datetime(2025, 6, 2)),
+        ('P2', datetime(2025, 5, 20)),
+    ]
+    assert db.atualizar_rollups_pendentes(conn) == ['2025-05', '2025-06']
+    assert _linhas(conn, "SELECT ano_mes, status, total_pedidos FROM pedidos_mensal ORDER BY ano_mes;") == [
+        ('2025-05', 'Aprovado', 1),
+        ('2025-06', 'Faturado', 1),
+    ]
+    assert _linhas(conn, "SELECT numero_pedido, status_anterior, status_novo FROM pedidos_status_log ORDER BY seq;")[-1] == (
+        'P1', 'Aprovado', 'Faturado'
+    )
+
+def test_data_alterada_sem_mudar_status_conta_como_alteracao(conn):
+    db.upsert_pedidos(conn, [_pedido(datetime(2025, 5, 10))])
+
+    resultado = db.upsert_pedidos(conn, [_pedido(datetime(2025, 5, 11))])
+
+    assert (resultado['inseridos'], resultado['alterados']) == (0, 1)
+    assert _linhas(conn, "SELECT data_pedido FROM pedidos;") == [(datetime(2025, 5, 11),)]
+    db.atualizar_rollups_pendentes(conn)
+    assert _linhas(conn, "SELECT sum(total_pedidos) FROM pedidos_mensal;") == [(1,)]
+
+def test_rollups_recalculados_uma_vez_com_os_meses_de_todos_os_lotes(conn):
+    db.upsert_pedidos(conn, [_pedido(datetime(2025, 5, 10))])
+    db.copiar_pedidos(conn, [_pedido(datetime(2025, 6, 10), numero='P2')])
+    db.upsert_pedidos(conn, [_pedido(datetime(2025, 6, 11), numero='P3', status='Faturado')])
+    assert _linhas(conn, "SELECT count(*) FROM pedidos_mensal;") == [(0,)]
+
+    assert db.atualizar_rollups_pendentes(conn) == ['2025-05', '2025-06']
+    assert db.atualizar_rollups_pendentes(conn) == []
+    assert _linhas(conn, "SELECT ano_mes, status, total_pedidos FROM pedidos_mensal ORDER BY ano_mes, status;") == [
+        ('2025-05', 'Aprovado', 1),
+        ('2025-06', 'Aprovado', 1),
+        ('2025-06', 'Faturado', 1),
+    ]
+
+def test_pedidos_tem_indice_em_data_pedido(conn):
+    definicoes = [linha[0] for linha in _linhas(conn, "SELECT indexdef FROM pg_indexes WHERE tablename = 'pedidos';")]
+    assert any(definicao.endswith('(data_pedido)') for definicao in definicoes)
@@ -0,0 +1,33 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exportacao import gerar_csv, gerar_xlsx, lotes_dataframe
+
+@pytest.fixture
+def df_com_ausentes():
+    return pd.DataFrame({
+        'franqueado': ['Franqueado A', None, 'Franqueado C'],
+        'data_pedido': pd.to_datetime(['2025-05-10 08:00', None, '2025-05-12 09:30']),
+        'variacao': [0.25, np.nan, np.inf],
+        'total_pedidos': pd.array([3, pd.NA, 1], dtype='Int64'),
+    })
+
+def test_xlsx_aceita_nan_e_infinito(df_com_ausentes):
+    openpyxl = pytest.importorskip('openpyxl')
+
+    conteudo = b''.join(gerar_xlsx([('Crescimento', list(df_com_ausentes.columns), lotes_dataframe(df_com_ausentes, 2))]))
+
+    linhas = list(openpyxl.load_workbook(io.BytesIO(conteudo)).active.iter_rows(values_only=True))
+    assert linhas[0] == ('franqueado', 'data_pedido', 'variacao', 'total_pedidos')
+    assert linhas[1][0] == 'Franqueado A' and linhas[1][2] == 0.25 and linhas[1][3] == 3
+    assert linhas[2] == (None, None, None, None)
+    # O xlsxwriter grava o infinito como a fórmula =1/0, exibida como #DIV/0!.
+    assert linhas[3][2] == '=1/0'
+
+def test_csv_deixa_ausentes_vazios(df_com_ausentes):
+    conteudo = b''.join(gerar_csv(list(df_com_ausentes.columns), lotes_dataframe(df_com_ausentes)))
+
+    assert conteudo.decode('utf-8-sig').splitlines()[2] == ',,,'
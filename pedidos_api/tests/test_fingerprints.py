@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from fingerprints import CacheFingerprints, arquivo_padrao
+
+BANCO = 'localhost:5432/pedidos'
+MARCA = datetime(2025, 6, 30, 12, tzinfo=timezone.utc)
+PEDIDO = ('1001', 'Entregue', 'Loja Centro', 'Fornecedor A', datetime(2025, 6, 1, 10), '2025-06', 150.0)
+
+def _salvo(caminho, banco=BANCO, marca=MARCA):
+    cache = CacheFingerprints(caminho=caminho, banco=banco)
+    cache.confirmar([PEDIDO])
+    cache.salvar(lambda: marca)
+
+def test_recarrega_hashes_do_mesmo_banco(tmp_path):
+    caminho = str(tmp_path / 'fingerprints.json')
+    _salvo(caminho)
+
+    cache = CacheFingerprints(caminho=caminho, banco=BANCO)
+    assert cache.carregar(MARCA + timedelta(minutes=5)) == 1
+    assert cache.filtrar_alterados([PEDIDO]) == []
+
+def test_ignora_arquivo_de_outro_banco(tmp_path):
+    caminho = str(tmp_path / 'fingerprints.json')
+    _salvo(caminho, banco='outro-host:5432/pedidos')
+
+    cache = CacheFingerprints(caminho=caminho, banco=BANCO)
+    assert cache.carregar(MARCA) == 0
+    assert cache.filtrar_alterados([PEDIDO]) == [PEDIDO]
+
+def test_ignora_arquivo_se_marca_do_banco_voltou(tmp_path):
+    caminho = str(tmp_path / 'fingerprints.json')
+    _salvo(caminho)
+
+    assert CacheFingerprints(caminho=caminho, banco=BANCO).carregar(MARCA - timedelta(days=1)) == 0
+    assert CacheFingerprints(caminho=caminho, banco=BANCO).carregar(None) == 0
+
+def test_ignora_arquivo_no_formato_antigo(tmp_path):
+    caminho = tmp_path / 'fingerprints.json'
+    caminho.write_text('{"1001": "abc"}', encoding='utf-8')
+
+    assert CacheFingerprints(caminho=str(caminho), banco=BANCO).carregar(MARCA) == 0
+
+def test_arquivo_padrao_separa_bancos():
+    assert arquivo_padrao('localhost:5432/pedidos') != arquivo_padrao('localhost:5432/pedidos_homolog')
+    assert '/' not in arquivo_padrao('db.interno:5432/pedidos')
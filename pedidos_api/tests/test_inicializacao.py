@@ -0,0 +1,41 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+DIRETORIO_PACOTE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependências que os pontos de entrada importam sob demanda, nunca na subida.
+PESADOS = ('pandas', 'numpy', 'psycopg2', 'requests', 'pyarrow', 'plotly', 'xlsxwriter')
+
+def _modulos_apos(codigo):
+    """Módulos em sys.modules depois de executar `codigo` em um processo limpo."""
+    processo = subprocess.run(
+        [sys.executable, '-c', f'{codigo}\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))'],
+        cwd=DIRETORIO_PACOTE, capture_output=True, text=True,
+    )
+    assert processo.returncode == 0, processo.stderr
+    return json.loads(processo.stdout.splitlines()[-1])
+
+def _pesados_carregados(modulos):
+    return sorted(p for p in PESADOS if any(m == p or m.startswith(p + '.') for m in modulos))
+
+# exportacao é o que a API carrega no preaquecimento e na rota de export.
+@pytest.mark.parametrize('modulo', ['app', 'main', 'exportacao'])
+def test_ponto_de_entrada_nao_carrega_dependencias_pesadas(modulo):
+    assert _pesados_carregados(_modulos_apos(f'import {modulo}')) == []
+
+def test_dashboard_adia_plotly_express_e_xlsxwriter():
+    # O streamlit já carrega pandas e pyarrow; o dashboard adia o que só usa ao
+    # desenhar um gráfico ou exportar. Só os imports de nível de módulo rodam.
+    with open(os.path.join(DIRETORIO_PACOTE, 'dash.py'), encoding='utf-8') as origem:
+        arvore = ast.parse(origem.read())
+    imports = '\n'.join(ast.unparse(no) for no in arvore.body if isinstance(no, (ast.Import, ast.ImportFrom)))
+
+    modulos = _modulos_apos(imports)
+
+    assert 'plotly.express' not in modulos
+    assert 'xlsxwriter' not in modulos
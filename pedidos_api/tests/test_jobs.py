@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from jobs import GerenciadorJobs
+
+@pytest.fixture
+def gerenciador():
+    gerenciador = GerenciadorJobs(max_workers=4, max_historico=3)
+    yield gerenciador
+    gerenciador._executor.shutdown(wait=True)
+
+class _Bloqueada:
+    """Função de job que só termina quando `liberar` é sinalizado; conta as chamadas."""
+    def __init__(self, resultado='ok'):
+        self.liberar = threading.Event()
+        self.chamadas = 0
+        self.resultado = resultado
+
+    def __call__(self, *args):
+        self.chamadas += 1
+        self.liberar.wait(5)
+        return self.resultado
+
+def test_disparos_concorrentes_com_a_mesma_chave_recebem_o_mesmo_job(gerenciador):
+    funcao = _Bloqueada()
+    barreira = threading.Barrier(8)
+
+    def disparar():
+        barreira.wait()
+        return gerenciador.submeter('rodar-pedidos:2025-06-01', funcao, '2025-06-01')
+
+    with ThreadPoolExecutor(max_workers=8) as disparos:
+        respostas = list(disparos.map(lambda _: disparar(), range(8)))
+
+    assert len({job['id'] for job, novo in respostas}) == 1
+    assert [novo for job, novo in respostas].count(True) == 1
+
+    funcao.liberar.set()
+    job = gerenciador.aguardar(respostas[0][0]['id'], timeout=5)
+    assert job['status'] == 'concluido'
+    assert funcao.chamadas == 1
+
+def test_chave_liberada_ao_terminar_aceita_novo_job(gerenciador):
+    funcao = _Bloqueada()
+    funcao.liberar.set()
+    primeiro, _ = gerenciador.submeter('chave', funcao)
+    gerenciador.aguardar(primeiro['id'], timeout=5)
+
+    segundo, novo = gerenciador.submeter('chave', funcao)
+
+    assert novo and segundo['id'] != primeiro['id']
+    assert gerenciador.aguardar(segundo['id'], timeout=5)['status'] == 'concluido'
+    assert funcao.chamadas == 2
+
+def test_chaves_diferentes_rodam_em_paralelo(gerenciador):
+    funcao = _Bloqueada()
+    maio, novo_maio = gerenciador.submeter('rodar-pedidos:2025-05-01', funcao)
+    junho, novo_junho = gerenciador.submeter('rodar-pedidos:2025-06-01', funcao)
+
+    assert novo_maio and novo_junho and maio['id'] != junho['id']
+    funcao.liberar.set()
+    assert gerenciador.aguardar(maio['id'], timeout=5)['status'] == 'concluido'
+    assert gerenciador.aguardar(junho['id'], timeout=5)['status'] == 'concluido'
+
+@pytest.mark.parametrize('funcao, erro', [
+    (lambda: None, None),
+    (lambda: 1 / 0, 'division by zero'),
+])
+def test_falha_marca_o_job_e_libera_a_chave(gerenciador, funcao, erro):
+    job, _ = gerenciador.submeter('chave', funcao)
+
+    job = gerenciador.aguardar(job['id'], timeout=5)
+
+    assert (job['status'], job['erro']) == ('falhou', erro)
+    assert gerenciador.submeter('chave', lambda: 'ok')[1] is True
+
+def test_historico_descarta_os_jobs_terminados_mais_antigos(gerenciador):
+    ids = []
+    for i in range(5):
+        job, _ = gerenciador.submeter(f'chave-{i}', lambda: 'ok')
+        gerenciador.aguardar(job['id'], timeout=5)
+        ids.append(job['id'])
+
+    assert [job['id'] for job in gerenciador.listar()] == ids[:1:-1]
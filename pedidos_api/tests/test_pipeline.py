@@ -0,0 +1,58 @@
+import random
+import threading
+import time
+
+import pytest
+
+from pipeline import executar_pipeline
+
+def _lotes(quantidade, produzidos=None, atraso_max=0.0):
+    aleatorio = random.Random(7)
+    for i in range(quantidade):
+        time.sleep(aleatorio.uniform(0, atraso_max))
+        if produzidos is not None:
+            produzidos.append(i)
+        yield [i, i + 1]
+
+@pytest.fixture
+def sem_threads_vazadas():
+    antes = set(threading.enumerate())
+    yield
+    assert set(threading.enumerate()) - antes == set()
+
+@pytest.mark.parametrize('extratores', [0, 2])
+def test_lotes_gravados_na_ordem_de_chegada(extratores, sem_threads_vazadas):
+    gravados = []
+
+    tempos = executar_pipeline(_lotes(40, atraso_max=0.002), tuple, gravados.append, tamanho_fila=2, extratores=extratores)
+
+    assert gravados == [(i, i + 1) for i in range(40)]
+    assert set(tempos) == {'busca', 'extracao', 'gravacao', 'total'}
+
+def test_gravacao_lenta_segura_a_busca(sem_threads_vazadas):
+    produzidos, adiantamentos = [], []
+
+    def gravar(lote):
+        adiantamentos.append(len(produzidos) - lote[0])
+        time.sleep(0.005)
+
+    executar_pipeline(_lotes(30, produzidos), tuple, gravar, tamanho_fila=1)
+
+    # Uma fila de 1 lote por estágio mais o lote em mãos de cada thread.
+    assert max(adiantamentos) <= 5
+
+def _falhar(*args):
+    raise RuntimeError('estágio falhou')
+
+def _busca_que_falha():
+    yield [1]
+    _falhar()
+
+@pytest.mark.parametrize('lotes, extrair, gravar', [
+    (lambda: _busca_que_falha(), tuple, lambda lote: None),
+    (lambda: _lotes(20), _falhar, lambda lote: None),
+    (lambda: _lotes(20), tuple, _falhar),
+])
+def test_erro_em_qualquer_estagio_e_relancado(lotes, extrair, gravar, sem_threads_vazadas):
+    with pytest.raises(RuntimeError, match='estágio falhou'):
+        executar_pipeline(lotes(), extrair, gravar, tamanho_fila=1)
@@ -0,0 +1,119 @@
+from datetime import date, datetime
+
+import pytest
+
+import api
+import db
+import processador
+from api import ClienteAPI
+from benchmarks.servidor_api import ServidorAPIFake
+from db import ErroPool
+from migracoes import aplicar_migracoes
+from snapshot import SnapshotPedidos
+
+PERIODO = '2025-06-01'
+
+class _ConexaoFalsa:
+    def rollback(self):
+        pass
+
+@pytest.fixture
+def servidor():
+    with ServidorAPIFake(pedidos=20) as servidor:
+        yield servidor
+
+@pytest.fixture
+def cliente(servidor, monkeypatch):
+    cliente = ClienteAPI(url=servidor.url, api_key='teste')
+    monkeypatch.setattr(api, 'cliente', cliente)
+    yield cliente
+    cliente.fechar()
+
+@pytest.fixture
+def gravacoes(monkeypatch):
+    """Troca banco, histórico, fingerprints, rollups e snapshot por dublês; devolve os lotes gravados."""
+    gravados = []
+
+    def gravar(conn, pedidos):
+        gravados.append(pedidos)
+        return {'inseridos': len(pedidos), 'alterados': 0, 'inalterados': 0}
+
+    monkeypatch.setattr(processador, 'get_conn', lambda: _ConexaoFalsa())
+    monkeypatch.setattr(processador, 'put_conn', lambda conn: None)
+    monkeypatch.setattr(processador, 'gravar_pedidos', gravar)
+    monkeypatch.setattr(processador, '_registrar_execucao', lambda *args: None)
+    monkeypatch.setattr(processador, '_finalizar_fingerprints', lambda conn: None)
+    monkeypatch.setattr(processador, '_finalizar_snapshot', lambda conn: None)
+    monkeypatch.setattr(processador, '_finalizar_rollups', lambda conn: None)
+    return gravados
+
+def _falhar_get_conn():
+    raise ErroPool('pool esgotado')
+
+def _falhar_gravacao(conn, pedidos):
+    raise RuntimeError('falha no banco')
+
+def _periodo_chunk(periodo=None, tamanho_chunk=500):
+    return {}
+
+def _backfill(data_inicio, data_fim, paralelismo=8, ignorar_checkpoint=False):
+    return {}
+
+@pytest.mark.parametrize('funcao, args, kwargs, esperado', [
+    (_periodo_chunk, (PERIODO, 250), {}, PERIODO),
+    (_periodo_chunk, (), {'periodo': PERIODO, 'tamanho_chunk': 250}, PERIODO),
+    (_periodo_chunk, (), {'tamanho_chunk': 250}, date.today().isoformat()),
+    (_backfill, (date(2025, 1, 1), date(2025, 1, 31), 4), {}, '2025-01-01 a 2025-01-31'),
+    (_backfill, (date(2025, 1, 1),), {'data_fim': date(2025, 1, 31), 'ignorar_checkpoint': True}, '2025-01-01 a 2025-01-31'),
+])
+def test_execucao_registra_so_o_periodo(funcao, args, kwargs, esperado, monkeypatch):
+    registrados = []
+    monkeypatch.setattr(processador, '_registrar_execucao', lambda modo, periodo, *resto: registrados.append(periodo))
+
+    processador._instrumentar_execucao('teste')(funcao)(*args, **kwargs)
+
+    assert registrados == [esperado]
+
+@pytest.mark.parametrize('processar', [processador.processar_pedidos, processador.processar_pedidos_stream])
+def test_sucesso_mantem_validadores(processar, cliente, gravacoes):
+    assert processar(PERIODO) is not None
+    assert len(gravacoes) >= 1
+
+    gravacoes.clear()
+    assert processar(PERIODO) == {'inseridos': 0, 'alterados': 0, 'inalterados': 0}
+    assert gravacoes == []
+    assert cliente.metricas()['cache_hits'] == 1
+
+@pytest.mark.parametrize('processar', [processador.processar_pedidos, processador.processar_pedidos_stream])
+@pytest.mark.parametrize('alvo, falha', [('get_conn', _falhar_get_conn), ('gravar_pedidos', _falhar_gravacao)])
+def test_falha_descarta_validadores(processar, alvo, falha, cliente, gravacoes, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(processador, alvo, falha)
+        if alvo == 'gravar_pedidos':
+            with pytest.raises(RuntimeError):
+                processar(PERIODO)
+        else:
+            assert processar(PERIODO) is None
+
+    assert 'If-None-Match' not in cliente._cabecalhos_condicionais(PERIODO)
+    assert processar(PERIODO) is not None
+    assert len(gravacoes) >= 1
+    assert cliente.metricas()['cache_hits'] == 0
+
+def test_pedido_movido_marca_no_snapshot_tambem_o_mes_antigo(banco, tmp_path, monkeypatch):
+    monkeypatch.setattr(processador, 'snapshot', SnapshotPedidos(str(tmp_path)))
+    monkeypatch.setattr(processador, 'cache_fingerprints', None)
+    conn = db.get_conn()
+    try:
+        aplicar_migracoes(conn)
+        pedido = ('1', 'FINALIZADO', 'Franqueado A', 'Fornecedor B', datetime(2025, 5, 10), 'Maio', 100)
+        processador.gravar_pedidos(conn, [pedido])
+        assert processador.snapshot.sincronizar(conn) == 1
+
+        processador.gravar_pedidos(conn, [pedido[:4] + (datetime(2025, 6, 2),) + pedido[5:]])
+        assert processador.snapshot.sincronizar(conn) == 2
+        maio, _ = processador.snapshot.ler(['2025-05'], ['numero_pedido'])
+        junho, _ = processador.snapshot.ler(['2025-06'], ['numero_pedido'])
+        assert (len(maio), list(junho['numero_pedido'])) == (0, ['1'])
+    finally:
+        db.put_conn(conn)
@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import db
+import processador
+from migracoes import aplicar_migracoes
+from snapshot import COLUNAS_SNAPSHOT, SnapshotPedidos
+
+def _pedido(numero, data, status='FINALIZADO'):
+    return (numero, status, 'Franqueado A', 'Fornecedor B', data, 'Maio', 100)
+
+@pytest.fixture
+def conn(banco, tmp_path, monkeypatch):
+    monkeypatch.setattr(processador, 'snapshot', SnapshotPedidos(str(tmp_path / 'snapshot')))
+    monkeypatch.setattr(processador, 'cache_fingerprints', None)
+    conn = db.get_conn()
+    try:
+        aplicar_migracoes(conn)
+        yield conn
+    finally:
+        db.put_conn(conn)
+
+def _ler(snapshot, ano_mes):
+    df, _ = snapshot.ler([ano_mes], COLUNAS_SNAPSHOT)
+    return df.sort_values('numero_pedido').reset_index(drop=True)
+
+def test_mescla_so_os_alterados_e_fica_igual_a_reconstrucao(conn, tmp_path, monkeypatch):
+    snapshot = processador.snapshot
+    processador.gravar_pedidos(conn, [_pedido(str(i), datetime(2025, 5, 1 + i)) for i in range(5)]
+                               + [_pedido('10', datetime(2025, 6, 3))])
+    snapshot.sincronizar(conn)
+
+    lidos_do_banco = []
+    atualizar_meses = snapshot.atualizar_meses
+    monkeypatch.setattr(snapshot, 'atualizar_meses', lambda conn, meses: lidos_do_banco.append(sorted(meses)) or atualizar_meses(conn, meses))
+    processador.gravar_pedidos(conn, [
+        _pedido('1', datetime(2025, 5, 2), status='CANCELADO'),
+        _pedido('3', datetime(2025, 7, 1)),
+        _pedido('11', datetime(2025, 6, 9)),
+    ])
+    assert snapshot.sincronizar(conn) == 3
+
+    # Só julho, que ainda não tinha partição, foi lido inteiro do banco.
+    assert lidos_do_banco == [['2025-07']]
+    referencia = SnapshotPedidos(str(tmp_path / 'referencia'))
+    referencia.reconstruir(conn)
+    for ano_mes in ('2025-05', '2025-06', '2025-07'):
+        assert _ler(snapshot, ano_mes).equals(_ler(referencia, ano_mes)), ano_mes
+    assert list(_ler(snapshot, '2025-05')['numero_pedido']) == ['0', '1', '2', '4']
+    assert snapshot.watermark('2025-05') == snapshot.watermark('2025-07')
+
+def test_mes_marcado_sem_mudancas_nao_e_regravado(conn):
+    snapshot = processador.snapshot
+    processador.gravar_pedidos(conn, [_pedido('1', datetime(2025, 5, 10)), _pedido('2', datetime(2025, 6, 10))])
+    snapshot.sincronizar(conn)
+    arquivo_maio = os.stat(snapshot.caminho('2025-05')).st_ino
+
+    processador.gravar_pedidos(conn, [_pedido('2', datetime(2025, 6, 10), status='CANCELADO')])
+    snapshot.marcar(['2025-05'])
+    assert snapshot.sincronizar(conn) == 2
+
+    assert os.stat(snapshot.caminho('2025-05')).st_ino == arquivo_maio
+    assert list(_ler(snapshot, '2025-06')['status']) == ['CANCELADO']
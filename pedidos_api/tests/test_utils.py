@@ -0,0 +1,47 @@
+import copy
+
+import pytest
+
+from benchmarks.gerador import gerar_pedidos
+from utils import extrair_dados_pedido, extrair_pedidos_lote
+
+def _pedido(**campos):
+    pedido = {
+        'codigo': 42,
+        'situacao': {'descricao': 'Aguardando Aprovação'},
+        'franqueado': {'nome': 'Franqueado 1'},
+        'fornecedor': {'nome': '123 - Comércio de Papéis Ação'},
+        'dataCriacao': '2025-07-01T13:45:10.123Z',
+        'itensPedido': [{'quantidadeProdutos': 3, 'valorUnitario': 2.5}],
+    }
+    pedido.update(campos)
+    return pedido
+
+def test_lote_igual_a_extracao_pedido_a_pedido():
+    pedidos = gerar_pedidos(3000)
+    # Variações que fogem do caminho rápido da data e repetem nomes já em cache.
+    pedidos += [
+        _pedido(codigo=1, dataCriacao='2025-07-01T13:45:10.123456Z'),
+        _pedido(codigo=2, dataCriacao='2025-12-31T23:59:59.9Z'),
+        _pedido(codigo=3, itensPedido=[]),
+        _pedido(codigo=4),
+    ]
+
+    registros, rejeitados = extrair_pedidos_lote(copy.deepcopy(pedidos))
+
+    assert rejeitados == []
+    assert registros == [extrair_dados_pedido(pedido) for pedido in pedidos]
+
+@pytest.mark.parametrize('defeito', [
+    {'situacao': {}},
+    {'itensPedido': [{'valorUnitario': 1}]},
+    {'dataCriacao': '01/07/2025 13:45'},
+    {'fornecedor': None},
+])
+def test_pedido_malformado_vai_para_rejeitados_sem_parar_o_lote(defeito):
+    ruim = _pedido(codigo=2, **defeito)
+
+    registros, rejeitados = extrair_pedidos_lote([_pedido(codigo=1), ruim, _pedido(codigo=3)])
+
+    assert [registro[0] for registro in registros] == [1, 3]
+    assert [pedido for pedido, erro in rejeitados] == [ruim]
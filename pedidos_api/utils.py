@@ -1,5 +1,6 @@
 import unicodedata
 from datetime import datetime
+from functools import lru_cache
 
 MESES = [
     "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
@@ -25,3 +26,51 @@ def extrair_dados_pedido(pedido):
     except KeyError as e:
         print(f"Erro ao extrair dados do pedido: campo ausente {e}")
         return None
+
+@lru_cache(maxsize=4096)
+def normalizar_status(descricao):
+    return descricao.upper().encode("ASCII", "ignore").decode("ASCII")
+
+@lru_cache(maxsize=4096)
+def normalizar_fornecedor(nome):
+    fornecedor = nome.split('-')[-1].strip().upper()
+    return unicodedata.normalize("NFKD", fornecedor).encode("ASCII", "ignore").decode("ASCII")
+
+def converter_data_criacao(texto):
+    # Caminho rápido para o formato fixo da API (2025-07-01T13:45:10.123Z);
+    # qualquer variação cai no strptime, que valida o formato completo.
+    if (len(texto) == 24 and texto[4] == '-' and texto[7] == '-' and texto[10] == 'T'
+            and texto[13] == ':' and texto[16] == ':' and texto[19] == '.' and texto[23] == 'Z'):
+        return datetime(
+            int(texto[0:4]), int(texto[5:7]), int(texto[8:10]),
+            int(texto[11:13]), int(texto[14:16]), int(texto[17:19]),
+            int(texto[20:23]) * 1000,
+        )
+    return datetime.strptime(texto, '%Y-%m-%dT%H:%M:%S.%fZ')
+
+def _extrair_registro(pedido):
+    data_pedido = converter_data_criacao(pedido['dataCriacao'])
+    return (
+        pedido['codigo'],
+        normalizar_status(pedido['situacao']['descricao']),
+        pedido['franqueado']['nome'],
+        normalizar_fornecedor(pedido['fornecedor']['nome']),
+        data_pedido,
+        MESES[data_pedido.month - 1],
+        sum(item['quantidadeProdutos'] * item['valorUnitario'] for item in pedido['itensPedido']),
+    )
+
+def iterar_pedidos_extraidos(pedidos, rejeitados=None):
+    # Pedidos malformados não interrompem o lote: vão para `rejeitados` como
+    # (pedido, erro) quando a lista é informada.
+    for pedido in pedidos:
+        try:
+            yield _extrair_registro(pedido)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            if rejeitados is not None:
+                rejeitados.append((pedido, e))
+
+def extrair_pedidos_lote(pedidos):
+    rejeitados = []
+    registros = list(iterar_pedidos_extraidos(pedidos, rejeitados))
+    return registros, rejeitados